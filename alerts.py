@@ -0,0 +1,261 @@
+import time
+from datetime import datetime
+
+import numpy as np
+from bson import ObjectId
+from bson.errors import InvalidId
+
+from database import DatabaseManager
+from metrics import REGISTRY, timed
+from config import (
+    ALERT_RULES_COLLECTION, ALERTS_COLLECTION, ALERT_STATE_COLLECTION,
+    ALERT_MAX_HORIZON_DAYS, ALERT_WRITE_BATCH,
+)
+
+ALERTS_FIRED = REGISTRY.counter('aqi_alerts_fired_total', 'Subscriber alerts fired', ['horizon'])
+ALERT_RULES = REGISTRY.gauge('aqi_alert_rules', 'Subscriber alert rules evaluated per cycle')
+
+# Category → AQI it must exceed (the ladder of Predictor.get_aqi_category)
+CATEGORY_FLOORS = {
+    'Good': 0,
+    'Moderate': 50,
+    'Unhealthy for Sensitive Groups': 100,
+    'Unhealthy': 150,
+    'Very Unhealthy': 200,
+    'Hazardous': 300,
+}
+CATEGORIES = list(CATEGORY_FLOORS)
+_FLOORS = np.array(list(CATEGORY_FLOORS.values()), dtype=np.float64)
+
+_indexed_clients = set()
+
+
+def alert_messages(aqi):
+    """Public health message for one AQI reading"""
+    if aqi > 300:
+        return ["HAZARDOUS: Health alert - everyone may experience serious health effects"]
+    elif aqi > 200:
+        return ["VERY UNHEALTHY: Health alert - general public will be noticeably affected"]
+    elif aqi > 150:
+        return ["UNHEALTHY: Some members of the general public may experience health effects"]
+    elif aqi > 100:
+        return ["MODERATE: Air quality is acceptable; however, there may be a risk for some people"]
+    return ["GOOD: Air quality is satisfactory"]
+
+
+def category_levels(values):
+    """Index into CATEGORIES of each AQI value (-1 for NaN)"""
+    values = np.asarray(values, dtype=np.float64)
+    levels = np.searchsorted(_FLOORS, values, side='left') - 1
+    levels = np.maximum(levels, 0)
+    return np.where(np.isnan(values), -1, levels)
+
+
+def evaluate_rules(thresholds, horizons, last_levels, values):
+    """One vectorized pass over every rule.
+
+    values[h] is the AQI h days ahead (0 = current reading, NaN when there
+    is no forecast). A rule watches the peak over days 0..horizon and fires
+    when it exceeds the threshold; it notifies only when the peak's category
+    is above the highest one notified since the rule started firing, so a
+    persisting episode is reported once (however its peak moves between
+    categories) and an escalation again. Returns (notify, new_levels,
+    peak_days) with one entry per rule.
+    """
+    values = np.asarray(values, dtype=np.float64)
+
+    # Peak value and the day it occurs for every possible horizon (a handful of entries)
+    peaks = np.fmax.accumulate(values)
+    peak_days = np.array([int(np.nanargmax(values[:h + 1])) if not np.isnan(peaks[h]) else 0
+                          for h in range(len(values))])
+    peak_levels = category_levels(peaks)
+
+    watched = peaks[horizons]
+    firing = watched > thresholds
+    # The episode keeps its high-water mark until the rule stops firing
+    levels = np.where(firing, np.maximum(last_levels, peak_levels[horizons]), -1).astype(np.int8)
+    notify = firing & (levels > last_levels)
+
+    return notify, levels, peak_days[horizons]
+
+
+class AlertEngine:
+    """Per-subscriber alert rules evaluated in batch after every ingest.
+
+    Rules live in MongoDB but are evaluated from column arrays held in
+    memory, reloaded only when the rule set changes. Each cycle writes back
+    just the rules whose state changed, the alerts that fired, and one
+    summary document that /api/alerts serves without any upstream call.
+    """
+
+    def __init__(self, db=None):
+        self.db = db or DatabaseManager()
+        self.rules = self.db.db[ALERT_RULES_COLLECTION]
+        self.alerts = self.db.db[ALERTS_COLLECTION]
+        self.state = self.db.db[ALERT_STATE_COLLECTION]
+        self.rules_version = None
+        self.ids = np.empty(0, dtype=object)
+        self.subscribers = np.empty(0, dtype=object)
+        self.thresholds = np.empty(0)
+        self.horizons = np.empty(0, dtype=np.int64)
+        self.last_levels = np.empty(0, dtype=np.int8)
+        self._ensure_indexes()
+
+    def _ensure_indexes(self):
+        if id(self.db.client) in _indexed_clients:
+            return
+
+        try:
+            self.rules.create_index('subscriber_id')
+            self.alerts.create_index([('subscriber_id', 1), ('fired_at', -1)])
+            _indexed_clients.add(id(self.db.client))
+        except Exception as e:
+            print(f"Could not create alert indexes: {e}")
+
+    # --------------------------------------------------
+    # RULES
+    # --------------------------------------------------
+    def _bump_rules_version(self):
+        self.state.update_one({'_id': 'rules'}, {'$inc': {'version': 1}}, upsert=True)
+
+    def add_rule(self, subscriber_id, threshold=None, category=None, horizon_days=0):
+        """Store a rule firing when the AQI within horizon_days exceeds a threshold or enters a category"""
+        if (threshold is None) == (category is None):
+            raise ValueError("Give exactly one of threshold or category")
+        if category is not None and category not in CATEGORY_FLOORS:
+            raise ValueError(f"Unknown category {category!r}, expected one of {CATEGORIES}")
+        if not 0 <= horizon_days <= ALERT_MAX_HORIZON_DAYS:
+            raise ValueError(f"horizon_days must be between 0 and {ALERT_MAX_HORIZON_DAYS}")
+
+        rule = {
+            'subscriber_id': subscriber_id,
+            'threshold': float(CATEGORY_FLOORS[category] if category else threshold),
+            'category': category,
+            'horizon_days': int(horizon_days),
+            'last_level': -1,
+            'created_at': datetime.now()
+        }
+        rule_id = self.rules.insert_one(rule).inserted_id
+        self._bump_rules_version()
+        return str(rule_id)
+
+    def remove_rule(self, rule_id):
+        try:
+            deleted = self.rules.delete_one({'_id': ObjectId(rule_id)}).deleted_count
+        except InvalidId:
+            return False
+
+        if deleted:
+            self._bump_rules_version()
+        return bool(deleted)
+
+    def list_rules(self, subscriber_id):
+        rules = list(self.rules.find({'subscriber_id': subscriber_id}))
+        for rule in rules:
+            rule['_id'] = str(rule['_id'])
+        return rules
+
+    def _load_rules(self):
+        """Refresh the in-memory rule arrays when the rule set changed"""
+        document = self.state.find_one({'_id': 'rules'}) or {}
+        version = document.get('version', 0)
+
+        if version == self.rules_version:
+            return
+
+        projection = {'subscriber_id': 1, 'threshold': 1, 'horizon_days': 1, 'last_level': 1}
+        rules = list(self.rules.find({}, projection).batch_size(ALERT_WRITE_BATCH))
+
+        self.ids = np.array([rule['_id'] for rule in rules], dtype=object)
+        self.subscribers = np.array([rule['subscriber_id'] for rule in rules], dtype=object)
+        self.thresholds = np.array([rule['threshold'] for rule in rules], dtype=np.float64)
+        self.horizons = np.array([rule['horizon_days'] for rule in rules], dtype=np.int64)
+        self.last_levels = np.array([rule.get('last_level', -1) for rule in rules], dtype=np.int8)
+        self.rules_version = version
+
+        ALERT_RULES.set(len(rules))
+
+    # --------------------------------------------------
+    # EVALUATION
+    # --------------------------------------------------
+    def evaluate(self, current_aqi, predictions, evaluated_at=None):
+        """Evaluate every rule against a reading and its forecast, persist what changed"""
+        evaluated_at = evaluated_at or datetime.now()
+        started = time.perf_counter()
+
+        values = [float(current_aqi)]
+        by_day = {i + 1: p['predicted_aqi'] for i, p in enumerate(predictions[:ALERT_MAX_HORIZON_DAYS])}
+        values += [float(by_day.get(day, np.nan)) for day in range(1, ALERT_MAX_HORIZON_DAYS + 1)]
+
+        self._load_rules()
+
+        with timed('alert_evaluation'):
+            notify, levels, peak_days = evaluate_rules(self.thresholds, self.horizons, self.last_levels, values)
+
+        changed = np.flatnonzero(levels != self.last_levels)
+        fired = np.flatnonzero(notify)
+
+        self._store_levels(changed, levels)
+        self._store_fired(fired, levels, peak_days, values, evaluated_at)
+        self.last_levels = levels
+
+        for day in np.unique(peak_days[fired]):
+            ALERTS_FIRED.inc(int(np.count_nonzero(peak_days[fired] == day)), horizon=str(day))
+
+        summary = {
+            'evaluated_at': evaluated_at,
+            'current_aqi': values[0],
+            'category': CATEGORIES[category_levels([values[0]])[0]],
+            'alerts': alert_messages(values[0]),
+            'predictions': [
+                {'date': str(p['date']), 'predicted_aqi': float(p['predicted_aqi']), 'category': p['category']}
+                for p in predictions
+            ],
+            'rules': len(self.ids),
+            'fired': len(fired),
+            'seconds': time.perf_counter() - started
+        }
+        self.state.replace_one({'_id': 'latest'}, summary, upsert=True)
+
+        print(f"Evaluated {summary['rules']} alert rules: {summary['fired']} fired in {summary['seconds']:.3f}s")
+        return summary
+
+    def _store_levels(self, changed, levels):
+        # One update per (level, batch) rather than one per rule
+        for level in np.unique(levels[changed]):
+            ids = self.ids[changed[levels[changed] == level]]
+            for start in range(0, len(ids), ALERT_WRITE_BATCH):
+                self.rules.update_many(
+                    {'_id': {'$in': ids[start:start + ALERT_WRITE_BATCH].tolist()}},
+                    {'$set': {'last_level': int(level)}}
+                )
+
+    def _store_fired(self, fired, levels, peak_days, values, evaluated_at):
+        for start in range(0, len(fired), ALERT_WRITE_BATCH):
+            batch = fired[start:start + ALERT_WRITE_BATCH]
+            self.alerts.insert_many([
+                {
+                    'rule_id': self.ids[i],
+                    'subscriber_id': self.subscribers[i],
+                    'fired_at': evaluated_at,
+                    'horizon_days': int(peak_days[i]),
+                    'aqi': values[peak_days[i]],
+                    'threshold': float(self.thresholds[i]),
+                    'category': CATEGORIES[levels[i]]
+                }
+                for i in batch
+            ], ordered=False)
+
+    # --------------------------------------------------
+    # READ
+    # --------------------------------------------------
+    def latest(self):
+        """Summary of the last evaluation cycle (None before the first one)"""
+        return self.state.find_one({'_id': 'latest'}, {'_id': 0})
+
+    def subscriber_alerts(self, subscriber_id, limit=20):
+        cursor = self.alerts.find({'subscriber_id': subscriber_id}, {'_id': 0}).sort('fired_at', -1).limit(limit)
+        alerts = list(cursor)
+        for alert in alerts:
+            alert['rule_id'] = str(alert['rule_id'])
+        return alerts
@@ -1,20 +1,33 @@
+import math
+from datetime import datetime, timedelta
 import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
-import shap
-import lime
-import lime.lime_tabular
 from database import DatabaseManager
 from prediction import Predictor
+from config import EDA_MODE, EDA_HISTOGRAM_BINS, ROLLUP_FIELDS, DOWNSAMPLE_POINTS, DOWNSAMPLE_METHOD
+from downsample import downsample
+from alerts import alert_messages
 import numpy as np
 
+SERIES_FIELDS = ['aqi', 'temp', 'pm25', 'humidity']
+
+
+def _pyplot():
+    # matplotlib/seaborn/shap/lime are imported on first use to keep API startup fast
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    return plt
+
 class Analytics:
-    def __init__(self):
+    def __init__(self, predictor=None):
         self.db = DatabaseManager()
-        self.predictor = Predictor()
+        self.predictor = predictor or Predictor()
 
-    def perform_eda(self, days=30):
+    def perform_eda(self, days=30, mode=EDA_MODE):
         """Perform Exploratory Data Analysis"""
+        if mode == 'server':
+            return self.perform_eda_server_side(days)
+
         df = self.db.get_training_data(days)
 
         if df.empty:
@@ -37,10 +50,102 @@ class Analytics:
         # Feature importance (if model available)
         self.plot_feature_importance()
 
-    def plot_correlation_heatmap(self, df):
+    def perform_eda_server_side(self, days=30):
+        """EDA from aggregated summaries only; no raw rows leave MongoDB"""
+        stats = self.summary_statistics(days)
+
+        if not stats['describe']:
+            print("No data available for EDA")
+            return
+
+        print("Basic Statistics:")
+        print(pd.DataFrame(stats['describe']))
+
+        self.plot_correlation_heatmap(corr_matrix=pd.DataFrame(stats['correlation'], dtype=float))
+
+        # Daily means stand in for the hourly series over long ranges
+        end = datetime.now()
+        rollups = self.db.get_daily_rollups(end - timedelta(days=days), end)
+        if not rollups.empty:
+            columns = {f'{field}_mean': field for field in ROLLUP_FIELDS}
+            self.plot_time_series(rollups.rename(columns=dict(columns, date='timestamp')))
+
+        self.plot_aqi_distribution(histogram=stats['histogram'])
+
+        self.plot_feature_importance()
+
+    # --------------------------------------------------
+    # SERVER-SIDE STATISTICS
+    # --------------------------------------------------
+    def summary_statistics(self, days=30, fields=ROLLUP_FIELDS, histogram_field='aqi', bins=EDA_HISTOGRAM_BINS):
+        """describe(), correlation matrix and histogram built from MongoDB aggregations.
+
+        Moments come from one $group, correlations from centered pairwise
+        product sums over rows where every field is set, and the histogram
+        from one $bucket, so the transfer does not grow with the history.
+        """
+        end_date = datetime.now()
+        start_date = end_date - timedelta(days=days)
+
+        describe = {}
+        for field, m in self.db.get_feature_moments(fields, start_date, end_date).items():
+            n = m['count']
+            if not n:
+                continue
+            mean = m['sum'] / n
+            variance = max(m['sumsq'] - m['sum'] * mean, 0.0) / (n - 1) if n > 1 else math.nan
+            describe[field] = {'count': n, 'mean': mean, 'std': math.sqrt(variance),
+                               'min': m['min'], 'max': m['max']}
+
+        present = list(describe)
+        correlation = {}
+
+        if present:
+            co = self.db.get_feature_comoments(
+                present, {field: describe[field]['mean'] for field in present}, start_date, end_date)
+            n, sums = co['count'], co['sums']
+
+            def covariance(i, j):
+                i, j = min(i, j), max(i, j)
+                return (co['products'][(i, j)] - sums[i] * sums[j] / n) / (n - 1) if n > 1 else math.nan
+
+            for i, a in enumerate(present):
+                correlation[a] = {}
+                for j, b in enumerate(present):
+                    denominator = math.sqrt(covariance(i, i) * covariance(j, j))
+                    correlation[a][b] = covariance(i, j) / denominator if denominator > 0 else math.nan
+
+        histogram = None
+        if histogram_field in describe:
+            low, high = describe[histogram_field]['min'], describe[histogram_field]['max']
+            edges = np.linspace(low, high, bins + 1) if high > low else np.array([low, high])
+            # $bucket upper boundaries are exclusive; nudge the last so the maximum is counted
+            edges[-1] = np.nextafter(high, np.inf)
+            histogram = {
+                'field': histogram_field,
+                'edges': edges.tolist(),
+                'counts': self.db.get_feature_histogram(histogram_field, edges, start_date, end_date)
+            }
+
+        def clean(value):
+            return None if isinstance(value, float) and math.isnan(value) else value
+
+        return {
+            'start': start_date,
+            'end': end_date,
+            'describe': {field: {k: clean(v) for k, v in row.items()} for field, row in describe.items()},
+            'correlation': {a: {b: clean(v) for b, v in row.items()} for a, row in correlation.items()},
+            'histogram': histogram
+        }
+
+    def plot_correlation_heatmap(self, df=None, corr_matrix=None):
         """Plot correlation heatmap"""
-        numeric_cols = df.select_dtypes(include=[np.number]).columns
-        corr_matrix = df[numeric_cols].corr()
+        plt = _pyplot()
+        import seaborn as sns
+
+        if corr_matrix is None:
+            numeric_cols = df.select_dtypes(include=[np.number]).columns
+            corr_matrix = df[numeric_cols].corr()
 
         plt.figure(figsize=(12, 8))
         sns.heatmap(corr_matrix, annot=True, cmap='coolwarm', center=0)
@@ -49,43 +154,59 @@ class Analytics:
         plt.savefig('correlation_heatmap.png')
         plt.close()
 
-    def plot_time_series(self, df):
-        """Plot time series of AQI and key pollutants"""
+    def plot_time_series(self, df, points=DOWNSAMPLE_POINTS, method=DOWNSAMPLE_METHOD):
+        """Plot time series of AQI and key pollutants (downsampled to the axis width)"""
+        plt = _pyplot()
+
         fig, axes = plt.subplots(2, 2, figsize=(15, 10))
 
-        # AQI over time
-        axes[0, 0].plot(df['timestamp'], df['aqi'], color='red')
-        axes[0, 0].set_title('AQI Over Time')
-        axes[0, 0].set_xlabel('Date')
-        axes[0, 0].set_ylabel('AQI')
-
-        # Temperature over time
-        axes[0, 1].plot(df['timestamp'], df['temp'], color='blue')
-        axes[0, 1].set_title('Temperature Over Time')
-        axes[0, 1].set_xlabel('Date')
-        axes[0, 1].set_ylabel('Temperature (°C)')
-
-        # PM2.5 over time
-        if 'pm25' in df.columns:
-            axes[1, 0].plot(df['timestamp'], df['pm25'], color='green')
-            axes[1, 0].set_title('PM2.5 Over Time')
-            axes[1, 0].set_xlabel('Date')
-            axes[1, 0].set_ylabel('PM2.5')
-
-        # Humidity over time
-        axes[1, 1].plot(df['timestamp'], df['humidity'], color='orange')
-        axes[1, 1].set_title('Humidity Over Time')
-        axes[1, 1].set_xlabel('Date')
-        axes[1, 1].set_ylabel('Humidity (%)')
+        panels = [
+            (axes[0, 0], 'aqi', 'red', 'AQI Over Time', 'AQI'),
+            (axes[0, 1], 'temp', 'blue', 'Temperature Over Time', 'Temperature (°C)'),
+            (axes[1, 0], 'pm25', 'green', 'PM2.5 Over Time', 'PM2.5'),
+            (axes[1, 1], 'humidity', 'orange', 'Humidity Over Time', 'Humidity (%)'),
+        ]
+
+        for ax, field, color, title, ylabel in panels:
+            if field not in df.columns:
+                continue
+            ax.plot(*downsample(df['timestamp'], df[field], points, method), color=color)
+            ax.set_title(title)
+            ax.set_xlabel('Date')
+            ax.set_ylabel(ylabel)
 
         plt.tight_layout()
         plt.savefig('time_series_plots.png')
         plt.close()
 
-    def plot_aqi_distribution(self, df):
+    def downsampled_series(self, days=30, fields=SERIES_FIELDS, points=DOWNSAMPLE_POINTS, method=DOWNSAMPLE_METHOD):
+        """Shape-preserving series for client-side charts; the size depends on points, not on days"""
+        end_date = datetime.now()
+        df = self.db.get_features(end_date - timedelta(days=days), end_date, fields=fields)
+
+        series = {}
+        for field in fields:
+            if df.empty or field not in df.columns:
+                continue
+            timestamps, values = downsample(df['timestamp'], df[field], points, method)
+            series[field] = {
+                'timestamps': pd.DatetimeIndex(timestamps).strftime('%Y-%m-%dT%H:%M:%S').tolist(),
+                'values': np.round(values, 2).tolist()
+            }
+
+        return {'rows': len(df), 'points': points, 'method': method, 'series': series}
+
+    def plot_aqi_distribution(self, df=None, histogram=None):
         """Plot AQI distribution"""
+        plt = _pyplot()
+        import seaborn as sns
+
         plt.figure(figsize=(10, 6))
-        sns.histplot(df['aqi'], bins=30, kde=True)
+        if histogram is not None:
+            edges = np.array(histogram['edges'])
+            plt.bar(edges[:-1], histogram['counts'], width=np.diff(edges), align='edge')
+        else:
+            sns.histplot(df['aqi'], bins=30, kde=True)
         plt.title('AQI Distribution')
         plt.xlabel('AQI')
         plt.ylabel('Frequency')
@@ -100,6 +221,9 @@ class Analytics:
 
     def plot_feature_importance(self):
         """Plot feature importance using SHAP"""
+        plt = _pyplot()
+        import shap
+
         model, metadata = self.predictor.load_model()
         if model is None:
             print("No model available for feature importance")
@@ -149,6 +273,8 @@ class Analytics:
 
     def explain_prediction(self, prediction_data):
         """Explain a specific prediction using LIME"""
+        import lime.lime_tabular
+
         model, metadata = self.predictor.load_model()
         if model is None:
             return None
@@ -178,17 +304,4 @@ class Analytics:
 
     def check_alerts(self, current_aqi):
         """Check if AQI requires alerts"""
-        alerts = []
-
-        if current_aqi > 300:
-            alerts.append("HAZARDOUS: Health alert - everyone may experience serious health effects")
-        elif current_aqi > 200:
-            alerts.append("VERY UNHEALTHY: Health alert - general public will be noticeably affected")
-        elif current_aqi > 150:
-            alerts.append("UNHEALTHY: Some members of the general public may experience health effects")
-        elif current_aqi > 100:
-            alerts.append("MODERATE: Air quality is acceptable; however, there may be a risk for some people")
-        else:
-            alerts.append("GOOD: Air quality is satisfactory")
-
-        return alerts
\ No newline at end of file
+        return alert_messages(current_aqi)
@@ -1,13 +1,172 @@
-from fastapi import FastAPI, HTTPException
+import asyncio
+import functools
+import threading
+import time
+from contextlib import asynccontextmanager
+from typing import Optional
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from prediction import Predictor
-from analytics import Analytics
-from data_fetcher import DataFetcher
-from model_training import ModelTrainer
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from fastapi.routing import APIRoute
+from pydantic import BaseModel
+from upstream import UpstreamUnavailable, get_default_client
+from broadcast import Broadcaster
+from metrics import REGISTRY, HTTP_DURATION, profile_slow_requests, timed
 from datetime import datetime, timedelta
-import uvicorn
+from config import RING_BUFFER_POLL_SECONDS, DOWNSAMPLE_POINTS, DOWNSAMPLE_METHOD, FORECAST_METRICS_DAYS
 
-app = FastAPI(title="AQI Prediction API", version="1.0.0")
+
+# --------------------------------------------------
+# LAZY COMPONENTS
+# Heavy subsystems (analytics → shap/matplotlib, training →
+# xgboost/lightgbm) are imported and built on first use.
+# --------------------------------------------------
+def lazy(factory):
+    """Build a component once per process, on first call"""
+    lock = threading.Lock()
+    instance = []
+
+    @functools.wraps(factory)
+    def get():
+        if not instance:
+            with lock:
+                if not instance:
+                    instance.append(factory())
+        return instance[0]
+
+    get.loaded = lambda: bool(instance)
+    return get
+
+
+@lazy
+def get_buffer():
+    from ring_buffer import RingBuffer
+    return RingBuffer()
+
+
+@lazy
+def get_predictor():
+    from prediction import Predictor
+    return Predictor(buffer=get_buffer())
+
+
+@lazy
+def get_analytics():
+    from analytics import Analytics
+    return Analytics(predictor=get_predictor())
+
+
+@lazy
+def get_alert_engine():
+    from alerts import AlertEngine
+    return AlertEngine(get_predictor().db)
+
+
+@lazy
+def get_trainer():
+    from model_training import ModelTrainer
+    return ModelTrainer()
+
+
+# --------------------------------------------------
+# LIVE UPDATES
+# Computed once per ingested row and fanned out to every
+# /api/stream subscriber.
+# --------------------------------------------------
+broadcaster = Broadcaster()
+
+
+def publish_live_update():
+    """Build the current reading, alerts and predictions once and push them to all clients"""
+    latest = get_buffer().frame()
+    if latest.empty or latest['aqi'].isna().iloc[-1]:
+        return
+
+    with timed('live_update'):
+        predictor = get_predictor()
+        row = latest.iloc[-1]
+        current_aqi = float(row['aqi'])
+
+        broadcaster.publish("current", {
+            "current_aqi": current_aqi,
+            "category": predictor.get_aqi_category(current_aqi),
+            "timestamp": row['timestamp']
+        })
+        broadcaster.publish("alerts", {
+            "alerts": get_analytics().check_alerts(current_aqi),
+            "current_aqi": current_aqi
+        })
+
+        try:
+            broadcaster.publish("predictions", {"predictions": predictor.predict_next_3_days()})
+        except Exception as e:
+            print(f"Skipping live predictions: {e}")
+
+
+def refresh_buffer():
+    """Poll for new rows; publish a live update when any arrived"""
+    new_rows = get_buffer().poll(get_predictor().db)
+    if new_rows:
+        publish_live_update()
+    return new_rows
+
+
+# --------------------------------------------------
+# STARTUP
+# --------------------------------------------------
+readiness = {"ready": False, "checks": {}}
+
+
+def warm_up():
+    """Warm only what serving needs: the DB pool and the model cache"""
+    checks = {}
+
+    with timed('startup_warm_up'):
+        try:
+            predictor = get_predictor()
+            predictor.db.ping()
+            checks["database"] = "ok"
+            checks["model"] = "ok" if predictor.warm_up() else "missing"
+            checks["buffer"] = f"{get_buffer().prime(predictor.db)} rows"
+            publish_live_update()
+        except Exception as e:
+            checks.setdefault("database", f"error: {e}")
+            checks.setdefault("model", "not loaded")
+            checks.setdefault("buffer", "empty")
+
+    readiness["checks"] = checks
+    readiness["ready"] = checks.get("database") == "ok"
+    print(f"Startup warm-up finished: {checks}")
+
+
+def poll_observations(stop):
+    """Advance the ring buffer with rows ingested since its watermark"""
+    while not stop.wait(RING_BUFFER_POLL_SECONDS):
+        try:
+            refresh_buffer()
+        except Exception as e:
+            print(f"Ring buffer poll failed: {e}")
+
+
+@asynccontextmanager
+async def lifespan(app):
+    # Warm in the background so the process accepts liveness probes immediately
+    stop = threading.Event()
+    broadcaster.bind(asyncio.get_running_loop())
+    threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
+    threading.Thread(target=poll_observations, args=(stop,), name="buffer-poll", daemon=True).start()
+    yield
+    stop.set()
+
+class InstrumentedRoute(APIRoute):
+    """Route that profiles slow endpoint calls when PROFILE_SLOW_REQUEST_MS is set"""
+
+    def __init__(self, path, endpoint, **kwargs):
+        super().__init__(path, profile_slow_requests(endpoint), **kwargs)
+
+
+app = FastAPI(title="AQI Prediction API", version="1.0.0", lifespan=lifespan)
+app.router.route_class = InstrumentedRoute
 
 # CORS middleware
 app.add_middleware(
@@ -18,21 +177,37 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-predictor = Predictor()
-analytics = Analytics()
-fetcher = DataFetcher()
-trainer = ModelTrainer()
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    start = time.perf_counter()
+    response = await call_next(request)
+    route = request.scope.get("route")
+    HTTP_DURATION.observe(
+        time.perf_counter() - start,
+        method=request.method,
+        path=route.path if route else "unmatched",
+        status=response.status_code
+    )
+    return response
 
 @app.get("/")
 def read_root():
     return {"message": "AQI Prediction API"}
 
+@app.get("/ready")
+def get_readiness():
+    """Readiness probe: 200 once the DB pool and model cache are warm"""
+    status_code = 200 if readiness["ready"] else 503
+    return JSONResponse(readiness, status_code=status_code)
+
 @app.get("/api/current-aqi")
 def get_current_aqi():
     """Get current AQI data"""
     try:
-        current_data = predictor.get_current_aqi()
+        current_data = get_predictor().get_current_aqi()
         return current_data
+    except UpstreamUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -40,7 +215,7 @@ def get_current_aqi():
 def get_predictions():
     """Get AQI predictions for next 3 days"""
     try:
-        predictions = predictor.predict_next_3_days()
+        predictions = get_predictor().predict_next_3_days()
         return {"predictions": predictions}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -49,26 +224,150 @@ def get_predictions():
 def get_analytics_plots():
     """Generate and return analytics plots"""
     try:
-        analytics.perform_eda()
+        get_analytics().perform_eda()
         return {"message": "Analytics plots generated", "plots": ["correlation_heatmap.png", "time_series_plots.png", "aqi_distribution.png", "feature_importance.png", "shap_summary.png"]}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/alerts")
-def get_alerts():
-    """Get current alerts based on AQI"""
+def get_alerts(subscriber_id: str = None):
+    """Get alerts from the last evaluation cycle (plus a subscriber's recent alerts)"""
+    try:
+        engine = get_alert_engine()
+        latest = engine.latest()
+
+        if latest is None:
+            # No cycle has run yet: fall back to a live reading
+            current_data = get_predictor().get_current_aqi()
+            alerts = get_analytics().check_alerts(current_data['current_aqi'])
+            latest = {"alerts": alerts, "current_aqi": current_data['current_aqi']}
+
+        if subscriber_id:
+            latest["subscriber_alerts"] = engine.subscriber_alerts(subscriber_id)
+
+        return latest
+    except UpstreamUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+class AlertRule(BaseModel):
+    subscriber_id: str
+    threshold: Optional[float] = None
+    category: Optional[str] = None
+    horizon_days: int = 0
+
+@app.post("/api/alerts/rules")
+def create_alert_rule(rule: AlertRule):
+    """Subscribe to alerts when the AQI within horizon_days exceeds a threshold or enters a category"""
+    try:
+        rule_id = get_alert_engine().add_rule(rule.subscriber_id, rule.threshold, rule.category, rule.horizon_days)
+        return {"rule_id": rule_id}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/api/alerts/rules")
+def list_alert_rules(subscriber_id: str):
+    """List a subscriber's alert rules"""
+    return {"rules": get_alert_engine().list_rules(subscriber_id)}
+
+@app.delete("/api/alerts/rules/{rule_id}")
+def delete_alert_rule(rule_id: str):
+    """Remove an alert rule"""
+    if not get_alert_engine().remove_rule(rule_id):
+        raise HTTPException(status_code=404, detail=f"Unknown alert rule {rule_id}")
+    return {"deleted": rule_id}
+
+@app.get("/api/stream")
+async def stream_updates(request: Request):
+    """Server-sent events: current, alerts and predictions, pushed after each ingest"""
+    last_event_id = request.headers.get("last-event-id")
+    last_event_id = int(last_event_id) if last_event_id and last_event_id.isdigit() else None
+
+    return StreamingResponse(
+        broadcaster.stream(last_event_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.get("/api/analytics/daily")
+def get_daily_rollups(days: int = 365):
+    """Get daily AQI and weather aggregates for long-range charts"""
+    try:
+        end = datetime.now()
+        df = get_predictor().db.get_daily_rollups(end - timedelta(days=days), end)
+        return {"days": df.to_dict("records")}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/analytics/summary")
+def get_analytics_summary(days: int = 30):
+    """Get descriptive statistics, correlations and the AQI histogram, aggregated in MongoDB"""
+    try:
+        return get_analytics().summary_statistics(days)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/analytics/series")
+def get_analytics_series(days: int = 30, points: int = DOWNSAMPLE_POINTS, method: str = DOWNSAMPLE_METHOD):
+    """Get AQI, temperature, PM2.5 and humidity series downsampled for client-side charts"""
+    if method not in ("lttb", "minmax"):
+        raise HTTPException(status_code=400, detail="method must be lttb or minmax")
+    try:
+        return get_analytics().downsampled_series(days, points=max(points, 3), method=method)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/api/observations/refresh")
+def refresh_observations():
+    """Pull newly ingested rows into the ring buffer (called by the ingest job)"""
     try:
-        current_data = predictor.get_current_aqi()
-        alerts = analytics.check_alerts(current_data['current_aqi'])
-        return {"alerts": alerts, "current_aqi": current_data['current_aqi']}
+        buffer = get_buffer()
+        new_rows = refresh_buffer()
+        return {"new_rows": new_rows, "buffered": buffer.size, "last_seen": buffer.last_seen}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/api/models")
+def list_models(name: str = None):
+    """List stored model versions with metrics, lineage and aliases (no model bytes)"""
+    return {"models": get_predictor().registry.list_models(name)}
+
+@app.get("/api/models/champion")
+def get_champion():
+    """Describe the model version currently served"""
+    registry = get_predictor().registry
+    name, version = registry.resolve()
+    if name is None:
+        raise HTTPException(status_code=404, detail="No champion model promoted yet")
+    return registry.describe(name, version)
+
+@app.get("/api/models/{name}")
+def describe_model(name: str, version: int = None):
+    """Full metadata of one model version (latest by default)"""
+    document = get_predictor().registry.describe(name, version)
+    if document is None:
+        raise HTTPException(status_code=404, detail=f"Model {name} not found")
+    return document
+
+@app.post("/api/models/{name}/{version}/promote")
+def promote_model(name: str, version: int):
+    """Serve a specific model version (moves the champion alias)"""
+    predictor = get_predictor()
+    try:
+        predictor.registry.promote(name, version)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    predictor.clear_model_cache()
+    return {"message": f"{name} v{version} is now the champion"}
+
 @app.post("/api/train-models")
 def train_models():
     """Trigger model training"""
     try:
-        trainer.train_all_models()
+        get_trainer().train_all_models()
+        if get_predictor.loaded():
+            get_predictor().clear_model_cache()
         return {"message": "Model training completed"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -79,11 +378,59 @@ def backfill_data(start_date: str, end_date: str):
     try:
         start = datetime.fromisoformat(start_date)
         end = datetime.fromisoformat(end_date)
-        trainer.backfill_historical_data(start, end)
-        return {"message": "Data backfill completed"}
+        summary = get_trainer().backfill_historical_data(start, end)
+        if summary is None:
+            raise RuntimeError("Backfill failed, see server logs")
+        return {"message": "Data backfill completed", **summary}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/api/forecast-accuracy")
+def get_forecast_accuracy(days: int = FORECAST_METRICS_DAYS, by_version: bool = False):
+    """Get rolling RMSE/MAE/bias of served forecasts per model and horizon"""
+    predictor = get_predictor()
+    name, version = predictor.registry.resolve()
+    return {
+        "window_days": days,
+        "champion": {"name": name, "version": version},
+        "metrics": predictor.tracker.live_metrics(days, by_version)
+    }
+
+@app.post("/api/forecast-accuracy/promote")
+def promote_by_live_accuracy(days: int = FORECAST_METRICS_DAYS):
+    """Promote the model with the best live RMSE to champion (if it clearly beats the current one)"""
+    predictor = get_predictor()
+    result = predictor.tracker.promote_best(predictor.registry, days)
+    if result['promoted']:
+        predictor.clear_model_cache()
+    return result
+
+@app.get("/api/drift")
+def get_drift():
+    """Get per-feature PSI/KS drift of live readings against the champion's training data"""
+    from drift import DriftMonitor
+
+    status = DriftMonitor(get_predictor().db).status()
+    if status is None:
+        raise HTTPException(status_code=404, detail="No drift scores yet (needs a champion trained with a drift reference)")
+    return status
+
+@app.get("/api/upstream-stats")
+def get_upstream_stats():
+    """Get per-host latency, error and circuit breaker metrics for upstream APIs"""
+    return {"hosts": get_default_client().stats()}
+
+@app.get("/api/db-pool-stats")
+def get_db_pool_stats():
+    """Get shared MongoDB connection pool configuration and counters"""
+    from database import pool_stats
+    return pool_stats()
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    """Prometheus metrics for pipeline stages, DB I/O and API requests"""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
 @app.get("/api/feature-importance")
 def get_feature_importance():
     """Get feature importance explanation"""
@@ -95,4 +442,6 @@ def get_feature_importance():
         raise HTTPException(status_code=500, detail=str(e))
 
 if __name__ == "__main__":
+    import uvicorn
+
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
@@ -0,0 +1,335 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from database import DatabaseManager
+from data_fetcher import parse_weather_item
+from upstream import TokenBucket
+from metrics import timed
+from config import (
+    BACKFILL_PROVIDER,
+    BACKFILL_FIXTURE_PATH,
+    BACKFILL_CHECKPOINT_COLLECTION,
+    BACKFILL_CHUNK_HOURS,
+    BACKFILL_WORKERS,
+    BACKFILL_RATE_PER_SECOND,
+)
+
+# US EPA breakpoints (2024 revision): concentration low/high → index low/high
+PM25_BREAKPOINTS = [
+    (0.0, 9.0, 0, 50),
+    (9.1, 35.4, 51, 100),
+    (35.5, 55.4, 101, 150),
+    (55.5, 125.4, 151, 200),
+    (125.5, 225.4, 201, 300),
+    (225.5, 325.4, 301, 500),
+]
+PM10_BREAKPOINTS = [
+    (0, 54, 0, 50),
+    (55, 154, 51, 100),
+    (155, 254, 101, 150),
+    (255, 354, 151, 200),
+    (355, 424, 201, 300),
+    (425, 604, 301, 500),
+]
+
+
+def epa_sub_index(concentration, breakpoints, decimals):
+    """Vectorized EPA sub-index (the same scale AQICN reports in iaqi)"""
+    scale = 10 ** decimals
+    c = np.floor(np.asarray(concentration, dtype=float) * scale) / scale
+    table = np.array(breakpoints, dtype=float)
+
+    row = np.minimum(np.searchsorted(table[:, 1], c, side='left'), len(table) - 1)
+    c_lo, c_hi, i_lo, i_hi = table[row].T
+
+    return np.round((i_hi - i_lo) / (c_hi - c_lo) * (np.clip(c, c_lo, c_hi) - c_lo) + i_lo)
+
+
+def floor_hour(value):
+    return value.replace(minute=0, second=0, microsecond=0)
+
+
+# --------------------------------------------------
+# PROVIDERS
+# --------------------------------------------------
+class BackfillProvider:
+    """Source of hourly feature rows; fetch(start, end) returns rows in [start, end)"""
+
+    name = 'provider'
+
+    def __init__(self, limiter=None):
+        self.limiter = limiter or TokenBucket(BACKFILL_RATE_PER_SECOND)
+
+    def fetch(self, start, end):
+        raise NotImplementedError
+
+
+class OpenWeatherHistoryProvider(BackfillProvider):
+    """OpenWeather hourly history joined with air pollution history.
+
+    The air pollution API returns concentrations, so pm25/pm10 are converted
+    to EPA sub-indices and aqi is their maximum, matching what AQICN serves
+    live. Gases have no comparable hourly index and are left for the live feed.
+    """
+
+    name = 'openweather'
+
+    def __init__(self, fetcher=None, limiter=None):
+        super().__init__(limiter)
+        self._fetcher = fetcher
+
+    @property
+    def fetcher(self):
+        if self._fetcher is None:
+            from data_fetcher import DataFetcher
+            self._fetcher = DataFetcher()
+        return self._fetcher
+
+    def fetch(self, start, end):
+        self.limiter.acquire()
+        weather = self.fetcher.fetch_weather_history(start, end)
+        self.limiter.acquire()
+        pollution = self.fetcher.fetch_air_pollution_history(start, end)
+
+        weather_df = pd.DataFrame([parse_weather_item(item) for item in weather.get('list', [])])
+        pollution_df = pd.DataFrame([
+            {
+                'timestamp': datetime.fromtimestamp(item['dt']),
+                'pm2_5': item['components'].get('pm2_5'),
+                'pm10_concentration': item['components'].get('pm10')
+            }
+            for item in pollution.get('list', [])
+        ])
+
+        if weather_df.empty or pollution_df.empty:
+            return pd.DataFrame()
+
+        pollution_df['pm25'] = epa_sub_index(pollution_df.pop('pm2_5'), PM25_BREAKPOINTS, 1)
+        pollution_df['pm10'] = epa_sub_index(pollution_df.pop('pm10_concentration'), PM10_BREAKPOINTS, 0)
+        pollution_df['aqi'] = pollution_df[['pm25', 'pm10']].max(axis=1)
+
+        for df in (weather_df, pollution_df):
+            df['timestamp'] = df['timestamp'].dt.floor('h')
+
+        df = weather_df.drop_duplicates('timestamp').merge(
+            pollution_df.drop_duplicates('timestamp'), on='timestamp')
+
+        return df[(df['timestamp'] >= start) & (df['timestamp'] < end)].reset_index(drop=True)
+
+
+class RecordedFixtureProvider(BackfillProvider):
+    """Serves hourly rows recorded to a CSV/JSONL file (offline runs, load tests)"""
+
+    name = 'fixture'
+
+    def __init__(self, path=BACKFILL_FIXTURE_PATH, limiter=None, latency=0.0):
+        super().__init__(limiter)
+        self.path = path
+        self.latency = latency
+        self._rows = None
+        self._lock = threading.Lock()
+
+    @property
+    def rows(self):
+        with self._lock:
+            if self._rows is None:
+                if self.path.endswith('.jsonl'):
+                    df = pd.read_json(self.path, lines=True)
+                else:
+                    df = pd.read_csv(self.path)
+                df['timestamp'] = pd.to_datetime(df['timestamp'])
+                self._rows = df.sort_values('timestamp').reset_index(drop=True)
+            return self._rows
+
+    def fetch(self, start, end):
+        self.limiter.acquire()
+        if self.latency:
+            time.sleep(self.latency)
+
+        timestamps = self.rows['timestamp'].to_numpy()
+        lo = np.searchsorted(timestamps, np.datetime64(pd.Timestamp(start)), side='left')
+        hi = np.searchsorted(timestamps, np.datetime64(pd.Timestamp(end)), side='left')
+
+        return self.rows.iloc[lo:hi].reset_index(drop=True)
+
+
+def get_provider(name=BACKFILL_PROVIDER):
+    if name == 'fixture':
+        return RecordedFixtureProvider()
+    return OpenWeatherHistoryProvider()
+
+
+def record_fixture(provider, start, end, path, chunk_hours=BACKFILL_CHUNK_HOURS):
+    """Save a provider's rows for a range so later backfills can replay them offline"""
+    frames = []
+    cursor = floor_hour(start)
+
+    while cursor < end:
+        chunk_end = min(cursor + timedelta(hours=chunk_hours), end)
+        frames.append(provider.fetch(cursor, chunk_end))
+        cursor = chunk_end
+
+    df = pd.concat(frames, ignore_index=True)
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+
+    if path.endswith('.jsonl'):
+        df.to_json(path, orient='records', lines=True, date_format='iso')
+    else:
+        df.to_csv(path, index=False)
+
+    print(f"Recorded {len(df)} rows to {path}")
+    return df
+
+
+# --------------------------------------------------
+# ENGINE
+# --------------------------------------------------
+EPOCH = datetime(1970, 1, 1)
+
+
+def grid_start(value, chunk_hours):
+    """Start of the epoch-aligned chunk_hours chunk holding value"""
+    hours = int((floor_hour(value) - EPOCH) / timedelta(hours=1))
+    return EPOCH + timedelta(hours=hours - hours % chunk_hours)
+
+
+class BackfillEngine:
+    """Chunked, concurrent, checkpointed backfill.
+
+    Ranges are cut on a fixed chunk_hours grid counted from the epoch, so
+    any two calls that touch the same hours share the same chunks. Chunks
+    are fetched by a thread pool (the provider's token bucket bounds the
+    request rate), written with idempotent upserts and checkpointed one
+    document per chunk. A chunk is complete once the provider returned every
+    hour up to its grid end; failed chunks and chunks still missing hours
+    (the open one clipped at `end`, hours the provider has not published
+    yet) are picked up again by the next run that overlaps them.
+    """
+
+    def __init__(self, provider=None, db=None, chunk_hours=BACKFILL_CHUNK_HOURS,
+                 workers=BACKFILL_WORKERS):
+        self.provider = provider or get_provider()
+        self.db = db or DatabaseManager()
+        self.chunk_hours = chunk_hours
+        self.workers = workers
+        self.checkpoints = self.db.db[BACKFILL_CHECKPOINT_COLLECTION]
+
+    def plan(self, start, end):
+        """Grid chunks [chunk_start, chunk_end) overlapping [start, end)"""
+        chunks = []
+        cursor = grid_start(start, self.chunk_hours)
+
+        while cursor < end:
+            chunk_end = cursor + timedelta(hours=self.chunk_hours)
+            chunks.append((cursor, chunk_end))
+            cursor = chunk_end
+
+        return chunks
+
+    def chunk_id(self, chunk_start):
+        return f"{self.provider.name}:{self.chunk_hours}h:{chunk_start:%Y%m%d%H}"
+
+    def incomplete(self, since):
+        """Starts of checkpointed chunks since `since` that failed or are still open"""
+        cursor = self.checkpoints.find(
+            {
+                'provider': self.provider.name,
+                'chunk_hours': self.chunk_hours,
+                'start': {'$gte': grid_start(since, self.chunk_hours)},
+                'status': {'$ne': 'complete'}
+            },
+            {'start': 1}
+        )
+        return sorted(document['start'] for document in cursor)
+
+    def _checkpoint(self, chunk_start, chunk_end, fields, rows=0):
+        self.checkpoints.update_one(
+            {'_id': self.chunk_id(chunk_start)},
+            {
+                '$set': dict(fields, provider=self.provider.name, chunk_hours=self.chunk_hours,
+                             start=chunk_start, end=chunk_end, updated_at=datetime.now()),
+                '$inc': {'rows': rows}
+            },
+            upsert=True
+        )
+
+    @timed('backfill_chunk')
+    def _run_chunk(self, chunk_start, chunk_end, fetch_start, fetch_end):
+        df = self.provider.fetch(fetch_start, fetch_end)
+        result = self.db.upsert_features(df, source='backfill')
+
+        # Coverage is what the provider returned, not what was asked for: history
+        # lags real time, so missing hours stay pending until a later run gets them
+        returned = set()
+        if not df.empty:
+            returned = {ts.to_pydatetime() for ts in pd.to_datetime(df['timestamp']).dt.floor('h')}
+
+        covered_until = floor_hour(fetch_start)
+        while covered_until < chunk_end and covered_until in returned:
+            covered_until += timedelta(hours=1)
+
+        # Checkpoint only after the write succeeded
+        status = 'complete' if covered_until >= chunk_end else 'partial'
+        self._checkpoint(chunk_start, chunk_end,
+                         {'status': status, 'covered_until': covered_until}, rows=len(df))
+
+        return len(df), result
+
+    def run(self, start, end):
+        """Backfill [start, end); safe to call again with any overlapping range to resume"""
+        chunks = self.plan(start, end)
+
+        checkpoints = {
+            document['_id']: document
+            for document in self.checkpoints.find({'_id': {'$in': [self.chunk_id(s) for s, _ in chunks]}})
+        }
+
+        # Resume each chunk where its last successful write stopped
+        pending = []
+        for chunk_start, chunk_end in chunks:
+            checkpoint = checkpoints.get(self.chunk_id(chunk_start), {})
+            if checkpoint.get('status') == 'complete':
+                continue
+
+            fetch_start = checkpoint.get('covered_until') or chunk_start
+            fetch_end = min(chunk_end, end)
+            if fetch_start < fetch_end:
+                pending.append((chunk_start, chunk_end, fetch_start, fetch_end))
+
+        print(f"Backfill {self.provider.name}: {len(pending)} of {len(chunks)} chunks to fetch "
+              f"({self.workers} workers)")
+
+        summary = {'provider': self.provider.name, 'chunks': len(chunks),
+                   'resumed': len(chunks) - len(pending),
+                   'rows': 0, 'inserted': 0, 'updated': 0, 'failed': []}
+        started = time.perf_counter()
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            futures = {pool.submit(self._run_chunk, *chunk): chunk for chunk in pending}
+
+            for future in as_completed(futures):
+                chunk_start, chunk_end, _, _ = futures[future]
+                try:
+                    rows, result = future.result()
+                except Exception as e:
+                    print(f"Backfill chunk {chunk_start} failed: {e}")
+                    self._checkpoint(chunk_start, chunk_end, {'status': 'failed', 'error': str(e)})
+                    summary['failed'].append(chunk_start.isoformat())
+                    continue
+
+                summary['rows'] += rows
+                summary['inserted'] += result['inserted']
+                summary['updated'] += result['updated']
+
+        summary['seconds'] = round(time.perf_counter() - started, 2)
+        status = 'partial' if summary['failed'] else 'complete'
+
+        print(f"Backfill {status}: {summary['rows']} rows ({summary['inserted']} new) "
+              f"in {summary['seconds']}s")
+        return summary
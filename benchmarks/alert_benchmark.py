@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+Alert benchmark - time of one vectorized evaluation pass over N subscriber
+rules (thresholds, horizons, dedup state), for several rule counts, across
+consecutive cycles of a synthetic AQI episode.
+
+    python benchmarks/alert_benchmark.py --rules 100000,500000,1000000 --max-ms 500
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from alerts import evaluate_rules, CATEGORY_FLOORS  # noqa: E402
+from config import ALERT_MAX_HORIZON_DAYS  # noqa: E402
+
+# current reading + 3-day forecast, rising into an episode and clearing again
+CYCLES = [[90, 110, 140, 160], [120, 150, 180, 170], [170, 210, 190, 150], [140, 120, 100, 90], [80, 70, 90, 100]]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Alert rule evaluation benchmark")
+    parser.add_argument("--rules", default="100000,500000", help="Comma-separated rule counts")
+    parser.add_argument("--max-ms", type=float, default=None, help="Fail if a cycle takes longer")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(42)
+    floors = np.array(list(CATEGORY_FLOORS.values()), dtype=np.float64)
+    slowest = 0.0
+
+    for n in [int(count) for count in args.rules.split(',')]:
+        # Half threshold rules, half category rules
+        thresholds = np.where(rng.random(n) < 0.5, rng.uniform(50, 300, n), rng.choice(floors[1:], n))
+        horizons = rng.integers(0, ALERT_MAX_HORIZON_DAYS + 1, n)
+        last_levels = np.full(n, -1, dtype=np.int8)
+
+        timings, fired = [], []
+        for values in CYCLES:
+            start = time.perf_counter()
+            notify, last_levels, _ = evaluate_rules(thresholds, horizons, last_levels, values)
+            timings.append((time.perf_counter() - start) * 1000)
+            fired.append(int(notify.sum()))
+
+        slowest = max(slowest, max(timings))
+        print(f"{n:>10,} rules  mean {np.mean(timings):7.1f} ms  max {max(timings):7.1f} ms  fired per cycle {fired}")
+
+    if args.max_ms is not None and slowest > args.max_ms:
+        print(f"❌ Slowest cycle {slowest:.1f} ms exceeds {args.max_ms:.0f} ms")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
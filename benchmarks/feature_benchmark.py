@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Feature benchmark - FeatureEngineer.create_features over a long synthetic
+hourly history, single pass versus overlapping partitions on a process pool,
+for each worker count. Every partitioned result is checked to be identical
+to the single pass (same columns, dtypes and bit-for-bit values). The
+partition threshold is --min-rows (default 0), not FEATURE_PARALLEL_MIN_ROWS,
+so short histories still exercise the partitioned path.
+
+With --engines pandas,polars the lazy Polars query is timed too and checked
+column for column: identical except the rolling statistics, which must
+agree to --rtol.
+
+    python benchmarks/feature_benchmark.py --years 10 --workers 2,4,8 --engines pandas,polars
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from feature_engineering import FeatureEngineer  # noqa: E402
+
+
+def synthetic_history(hours, seed=42):
+    """Hourly rows shaped like the feature store, with a few gaps in the readings"""
+    rng = np.random.default_rng(seed)
+    timestamps = pd.date_range(end=pd.Timestamp.now().floor('h'), periods=hours, freq='h')
+    hour_factor = np.sin(2 * np.pi * timestamps.hour.to_numpy() / 24)
+
+    temp = 28 + 7 * hour_factor + rng.normal(0, 1, hours)
+    humidity = 65 - 10 * hour_factor + rng.normal(0, 3, hours)
+    wind_speed = rng.uniform(3, 20, hours)
+    aqi = np.clip(100 + humidity * 0.3 - wind_speed * 1.5 + rng.choice([0, 20, 40], hours, p=[0.8, 0.15, 0.05]), 40, 250)
+
+    df = pd.DataFrame({
+        'timestamp': timestamps,
+        'temp': temp.round(2),
+        'humidity': humidity.round(2),
+        'pressure': rng.uniform(1005, 1015, hours).round(2),
+        'wind_speed': wind_speed.round(2),
+        'weather_main': rng.choice(['Clear', 'Haze', 'Smoke'], hours),
+        'weather_description': rng.choice(['clear sky', 'haze', 'smoke'], hours),
+        'aqi': aqi.round(2),
+        'pm25': aqi * 0.6,
+        'pm10': aqi * 0.8,
+        'o3': rng.uniform(10, 50, hours),
+        'no2': rng.uniform(10, 60, hours),
+        'so2': rng.uniform(5, 25, hours),
+        'co': rng.uniform(0.5, 2.0, hours),
+    })
+
+    # Missed polls: NaN readings exercise the rolling windows and the ffill/bfill
+    gaps = rng.random((hours, 6)) < 0.002
+    df[['pm25', 'pm10', 'o3', 'no2', 'so2', 'co']] = df[['pm25', 'pm10', 'o3', 'no2', 'so2', 'co']].mask(gaps)
+    return df
+
+
+def timed_build(fe, df, workers, repeats, engine='pandas', min_rows=None):
+    best, result = None, None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = fe.create_features(df, workers=workers, engine=engine, min_rows=min_rows)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Partitioned and Polars feature engineering benchmark")
+    parser.add_argument("--years", type=float, default=5, help="Hourly history to generate")
+    parser.add_argument("--workers", default="2,4", help="Comma-separated process counts")
+    parser.add_argument("--repeats", type=int, default=3, help="Best of this many runs")
+    parser.add_argument("--engines", default="pandas", help="Comma-separated feature engines")
+    parser.add_argument("--rtol", type=float, default=1e-9, help="Tolerance for Polars rolling statistics")
+    parser.add_argument("--min-rows", type=int, default=0,
+                        help="Partition frames from this many rows (0 always partitions, so the comparison is real)")
+    args = parser.parse_args()
+
+    df = synthetic_history(int(args.years * 365 * 24))
+    fe = FeatureEngineer()
+    print(f"{len(df):,} hourly rows, {os.cpu_count()} CPUs")
+
+    engines = args.engines.split(',')
+    serial_s, expected = timed_build(fe, df, 1, args.repeats)
+    print(f"  {'serial':<12}{serial_s * 1000:>10.0f} ms")
+
+    # Record partitioned builds so a run that silently took the serial path is visible
+    partitioned = []
+    build_partitioned = fe.row_features_partitioned
+    fe.row_features_partitioned = lambda frame, workers: partitioned.append(workers) or build_partitioned(frame, workers)
+
+    mismatches = 0
+    for workers in [int(w) for w in args.workers.split(',')] if 'pandas' in engines else []:
+        partitioned.clear()
+        elapsed, result = timed_build(fe, df, workers, args.repeats, min_rows=args.min_rows)
+
+        try:
+            pd.testing.assert_frame_equal(result, expected, check_exact=True)
+            status = "identical" if partitioned else "identical (serial path, below --min-rows)"
+        except AssertionError as e:
+            mismatches += 1
+            status = f"MISMATCH: {str(e).splitlines()[0]}"
+
+        print(f"  {f'{workers} workers':<12}{elapsed * 1000:>10.0f} ms {serial_s / elapsed:>6.2f}x  {status}")
+
+    if 'polars' in engines:
+        elapsed, result = timed_build(fe, df, None, args.repeats, engine='polars')
+        rolling = [col for col in expected.columns if '_rolling_' in col]
+
+        try:
+            pd.testing.assert_frame_equal(result.drop(columns=rolling), expected.drop(columns=rolling), check_exact=True)
+            pd.testing.assert_frame_equal(result[rolling], expected[rolling], check_exact=False, rtol=args.rtol)
+            status = f"equivalent (rolling within rtol {args.rtol:g})"
+        except AssertionError as e:
+            mismatches += 1
+            status = f"MISMATCH: {str(e).splitlines()[0]}"
+
+        print(f"  {'polars':<12}{elapsed * 1000:>10.0f} ms {serial_s / elapsed:>6.2f}x  {status}")
+
+    if mismatches:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Inference benchmark - single-row latency of each model type, served as the
+original framework object versus the compiled engine, plus the max absolute
+difference between the two on held-out rows.
+
+With --fused the models are trained on standardized rows, as in training,
+and served raw rows three ways: the unfused pipeline (scaler, then the
+original model), the compiled engine behind the scaler, and the engine with
+the scaler folded in. The fused engine must match the unfused pipeline.
+
+    python benchmarks/inference_benchmark.py --engine native
+    python benchmarks/inference_benchmark.py --engine onnx
+    python benchmarks/inference_benchmark.py --fused --max-diff 1e-3
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from model_training import ModelTrainer  # noqa: E402
+from inference_engine import load_inference_model, ScaledModel  # noqa: E402
+
+
+def per_call_us(predict, row, calls):
+    start = time.perf_counter()
+    for _ in range(calls):
+        predict(row)
+    return (time.perf_counter() - start) / calls * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compiled inference benchmark")
+    parser.add_argument("--engine", default="native", choices=["native", "onnx"])
+    parser.add_argument("--rows", type=int, default=2000, help="Synthetic training rows")
+    parser.add_argument("--features", type=int, default=24 * 40, help="Features per row")
+    parser.add_argument("--calls", type=int, default=300, help="Timed single-row calls")
+    parser.add_argument("--fused", action="store_true", help="Compare the scaler folded in against applied per call")
+    parser.add_argument("--max-diff", type=float, default=None, help="Fail if fused and unfused differ by more")
+    args = parser.parse_args()
+
+    if args.fused:
+        return fused_benchmark(args)
+
+    rng = np.random.default_rng(42)
+    X = rng.normal(size=(args.rows, args.features))
+    y = 100 + 20 * X[:, 0] + 5 * X[:, 1] ** 2 + rng.normal(size=args.rows)
+    X_test = rng.normal(size=(500, args.features))
+
+    trainer = ModelTrainer.__new__(ModelTrainer)  # no DB needed for fitting
+    models = {
+        "random_forest": trainer.train_random_forest,
+        "ridge": trainer.train_ridge,
+        "xgboost": trainer.train_xgboost,
+        "lightgbm": trainer.train_lightgbm,
+    }
+
+    print(f"{'model':<15}{'original (us)':>15}{'compiled (us)':>15}{'max abs diff':>15}")
+    for name, train in models.items():
+        model = train(X, y)
+        engine = load_inference_model(model, engine=args.engine)
+
+        diff = np.max(np.abs(engine.predict(X_test) - model.predict(X_test.astype(np.float32))))
+        row = X_test[:1]
+        original = per_call_us(model.predict, row, args.calls)
+        compiled = per_call_us(engine.predict, row, args.calls)
+
+        print(f"{name:<15}{original:>15.1f}{compiled:>15.1f}{diff:>15.2g}")
+
+
+def fused_benchmark(args):
+    from sklearn.preprocessing import StandardScaler
+
+    rng = np.random.default_rng(42)
+    # Raw feature-store units: offsets and spreads that differ by orders of magnitude
+    offset, spread = rng.uniform(-500, 500, args.features), rng.uniform(0.01, 200, args.features)
+    raw = (offset + spread * rng.normal(size=(args.rows, args.features))).astype(np.float32)
+    y = 100 + 20 * (raw[:, 0] - offset[0]) / spread[0] + 5 * ((raw[:, 1] - offset[1]) / spread[1]) ** 2
+    raw_test = offset + spread * rng.normal(size=(500, args.features))
+
+    scaler = StandardScaler().fit(raw)
+    mean, scale = scaler.mean_, scaler.scale_
+    X = scaler.transform(raw)
+
+    trainer = ModelTrainer.__new__(ModelTrainer)  # no DB needed for fitting
+    models = {
+        "random_forest": trainer.train_random_forest,
+        "ridge": trainer.train_ridge,
+        "xgboost": trainer.train_xgboost,
+        "lightgbm": trainer.train_lightgbm,
+    }
+
+    print(f"{'model':<15}{'unfused (us)':>14}{'scaled (us)':>14}{'fused (us)':>14}{'max abs diff':>15}  engine")
+    worst = 0.0
+    for name, train in models.items():
+        model = train(X, y)
+
+        # The real pipeline the model was trained behind: the fitted scaler on float32 rows
+        def unfused(rows, model=model):
+            return np.asarray(model.predict(scaler.transform(np.asarray(rows, dtype=np.float32))), dtype=np.float64).ravel()
+
+        scaled = ScaledModel(load_inference_model(model, engine=args.engine), mean, scale)
+        fused = load_inference_model(model, engine=args.engine, scaler={'mean': mean, 'scale': scale})
+
+        diff = float(np.max(np.abs(fused.predict(raw_test) - unfused(raw_test))))
+        worst = max(worst, diff)
+        row = raw_test[:1]
+        timings = [per_call_us(predict, row, args.calls) for predict in (unfused, scaled.predict, fused.predict)]
+
+        print(f"{name:<15}{timings[0]:>14.1f}{timings[1]:>14.1f}{timings[2]:>14.1f}{diff:>15.2g}  {fused.source}")
+
+    if args.max_diff is not None and worst > args.max_diff:
+        print(f"❌ Fused and unfused predictions differ by {worst:.3g} > {args.max_diff:g}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+"""
+Load test - throughput and latency of the dashboard endpoints.
+
+Launches the API against local stub upstream servers (or targets one that
+is already running, e.g. started with stub_upstreams.py), then drives the
+endpoints with a closed loop of concurrent clients for each concurrency
+level and reports requests/s, p50/p95/p99 latency and error rate per
+endpoint. MongoDB must be reachable at MONGO_URI when the API is launched
+here.
+
+    python benchmarks/load_test.py --start-api --concurrency 10,50,100 --duration 30
+    python benchmarks/load_test.py --start-api --stub-error-rate 0.05 \\
+        --max-p95-ms 500 --max-error-rate 0.01 --output load_test.jsonl
+    python benchmarks/load_test.py --api-url http://staging:8000 --concurrency 50
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from collections import defaultdict
+
+import numpy as np
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from stub_upstreams import StubUpstreams  # noqa: E402
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# What the Next.js /api/weather route fans out to on every dashboard poll
+DEFAULT_ENDPOINTS = "/api/current-aqi,/api/predictions,/api/alerts"
+
+
+def parse_endpoints(spec):
+    """'/a:3,/b' → [('/a', 3), ('/b', 1)]"""
+    endpoints = []
+    for item in spec.split(','):
+        path, _, weight = item.partition(':')
+        endpoints.append((path.strip(), int(weight or 1)))
+    return endpoints
+
+
+def start_api(port, stub, workers):
+    env = dict(os.environ, **stub.env())
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app:app", "--host", "127.0.0.1",
+         "--port", str(port), "--workers", str(workers), "--log-level", "warning"],
+        cwd=ROOT, env=env
+    )
+    return process
+
+
+def wait_ready(api_url, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if requests.get(f"{api_url}/ready", timeout=2).status_code == 200:
+                return True
+        except requests.RequestException:
+            pass
+        time.sleep(0.5)
+    return False
+
+
+def run_level(api_url, endpoints, concurrency, duration, timeout):
+    """Closed loop: each client sends its next request as soon as the last one returns"""
+    schedule = [path for path, weight in endpoints for _ in range(weight)]
+    latencies = defaultdict(list)
+    statuses = defaultdict(lambda: defaultdict(int))
+    lock = threading.Lock()
+    stop_at = time.monotonic() + duration
+
+    def client(offset):
+        session = requests.Session()
+        i = offset
+        local = []
+
+        while time.monotonic() < stop_at:
+            path = schedule[i % len(schedule)]
+            i += 1
+            start = time.perf_counter()
+            try:
+                status = session.get(f"{api_url}{path}", timeout=timeout).status_code
+            except requests.RequestException:
+                status = 'exception'
+            local.append((path, time.perf_counter() - start, status))
+
+        with lock:
+            for path, latency, status in local:
+                latencies[path].append(latency)
+                statuses[path][status] += 1
+
+    threads = [threading.Thread(target=client, args=(n,)) for n in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    results = {}
+    for path, _ in endpoints:
+        samples = np.array(latencies[path]) * 1000
+        counts = dict(statuses[path])
+        total = int(sum(counts.values()))
+        errors = sum(n for status, n in counts.items() if status == 'exception' or status >= 500)
+
+        results[path] = {
+            'requests': total,
+            'rps': total / elapsed,
+            'p50_ms': float(np.percentile(samples, 50)) if total else None,
+            'p95_ms': float(np.percentile(samples, 95)) if total else None,
+            'p99_ms': float(np.percentile(samples, 99)) if total else None,
+            'error_rate': errors / total if total else None,
+            'statuses': {str(status): n for status, n in counts.items()},
+        }
+
+    return results
+
+
+def print_level(concurrency, results):
+    print(f"\nConcurrency {concurrency}")
+    print(f"  {'endpoint':<24}{'req/s':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>9}")
+    for path, r in results.items():
+        if not r['requests']:
+            print(f"  {path:<24}{'no requests completed':>48}")
+            continue
+        print(f"  {path:<24}{r['rps']:>9.1f}{r['p50_ms']:>10.1f}{r['p95_ms']:>10.1f}"
+              f"{r['p99_ms']:>10.1f}{r['error_rate']:>9.1%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="API load test against stub upstreams")
+    parser.add_argument("--api-url", default=None, help="Target a running API instead of launching one")
+    parser.add_argument("--start-api", action="store_true", help="Launch uvicorn against the stubs")
+    parser.add_argument("--api-port", type=int, default=8800)
+    parser.add_argument("--api-workers", type=int, default=1)
+    parser.add_argument("--endpoints", default=DEFAULT_ENDPOINTS,
+                        help="Comma-separated paths, optionally weighted as path:weight")
+    parser.add_argument("--concurrency", default="1,10,50", help="Comma-separated client counts")
+    parser.add_argument("--duration", type=float, default=20, help="Seconds per concurrency level")
+    parser.add_argument("--timeout", type=float, default=30, help="Per-request timeout")
+    parser.add_argument("--stub-port", type=int, default=0)
+    parser.add_argument("--stub-latency-ms", type=float, default=80)
+    parser.add_argument("--stub-jitter-ms", type=float, default=30)
+    parser.add_argument("--stub-error-rate", type=float, default=0.0)
+    parser.add_argument("--max-p95-ms", type=float, default=None, help="Fail if any endpoint p95 exceeds this")
+    parser.add_argument("--max-error-rate", type=float, default=None, help="Fail if any endpoint error rate exceeds this")
+    parser.add_argument("--output", default=None, help="Append the results as a JSON line")
+    args = parser.parse_args()
+
+    api = None
+    stub = None
+    api_url = args.api_url
+
+    # A running API keeps whatever upstreams it was started with (see stub_upstreams.py)
+    if args.start_api or not api_url:
+        stub = StubUpstreams(port=args.stub_port, latency_ms=args.stub_latency_ms,
+                             jitter_ms=args.stub_jitter_ms, error_rate=args.stub_error_rate).start()
+        print(f"Stub upstreams on {stub.url} "
+              f"({args.stub_latency_ms:.0f}±{args.stub_jitter_ms:.0f} ms, {args.stub_error_rate:.0%} errors)")
+
+        api = start_api(args.api_port, stub, args.api_workers)
+        api_url = f"http://127.0.0.1:{args.api_port}"
+
+    try:
+        if not wait_ready(api_url, timeout=60):
+            print(f"❌ API at {api_url} did not become ready")
+            sys.exit(1)
+
+        endpoints = parse_endpoints(args.endpoints)
+        levels = [int(level) for level in args.concurrency.split(',')]
+        report = {}
+
+        for concurrency in levels:
+            results = run_level(api_url, endpoints, concurrency, args.duration, args.timeout)
+            print_level(concurrency, results)
+            report[concurrency] = results
+
+        if stub is not None:
+            print(f"\nStub upstreams served {stub.requests} requests ({stub.errors} injected failures)")
+
+    finally:
+        if api is not None:
+            api.terminate()
+            api.wait(timeout=10)
+        if stub is not None:
+            stub.stop()
+
+    if args.output:
+        with open(args.output, "a") as f:
+            f.write(json.dumps({
+                "timestamp": time.time(),
+                "api_url": api_url,
+                "stub": {"latency_ms": args.stub_latency_ms, "jitter_ms": args.stub_jitter_ms,
+                         "error_rate": args.stub_error_rate} if stub else None,
+                "levels": report,
+            }) + "\n")
+
+    failures = []
+    for concurrency, results in report.items():
+        for path, r in results.items():
+            if args.max_p95_ms is not None and r['p95_ms'] is not None and r['p95_ms'] > args.max_p95_ms:
+                failures.append(f"{path} p95 {r['p95_ms']:.0f} ms at concurrency {concurrency}")
+            if args.max_error_rate is not None and r['error_rate'] is not None and r['error_rate'] > args.max_error_rate:
+                failures.append(f"{path} error rate {r['error_rate']:.1%} at concurrency {concurrency}")
+
+    if failures:
+        print("❌ Load test budget exceeded:")
+        for failure in failures:
+            print(f"  {failure}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Startup benchmark - measures the cold import cost of the API module.
+
+Each run imports the module in a fresh interpreter, so the numbers match
+what a new worker pays on deploy or autoscale.
+
+    python benchmarks/startup_benchmark.py --runs 5 --max-seconds 2.0
+"""
+
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+IMPORT_LINE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def time_import(module):
+    """Wall-clock seconds for a fresh interpreter to import the module"""
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-c", f"import {module}"], cwd=ROOT, check=True)
+    return time.perf_counter() - start
+
+
+def top_imports(module, limit):
+    """Slowest top-level imports according to python -X importtime"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, capture_output=True, text=True, check=True
+    )
+
+    entries = []
+    for line in result.stderr.splitlines():
+        match = IMPORT_LINE.match(line)
+        if match and len(match.group(3)) <= 3:
+            entries.append((int(match.group(2)) / 1e6, match.group(4)))
+
+    return sorted(entries, reverse=True)[:limit]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="API startup benchmark")
+    parser.add_argument("--module", default="app", help="Module to import")
+    parser.add_argument("--runs", type=int, default=5, help="Number of cold imports")
+    parser.add_argument("--top", type=int, default=10, help="Slowest imports to report")
+    parser.add_argument("--max-seconds", type=float, default=None,
+                        help="Fail if the median import time exceeds this budget")
+    parser.add_argument("--output", default=None, help="Append the result as a JSON line")
+    args = parser.parse_args()
+
+    timings = [time_import(args.module) for _ in range(args.runs)]
+    median = statistics.median(timings)
+
+    print(f"import {args.module}: median {median:.3f}s, "
+          f"min {min(timings):.3f}s, max {max(timings):.3f}s over {args.runs} runs")
+
+    slowest = top_imports(args.module, args.top)
+    print("Slowest top-level imports (cumulative):")
+    for seconds, name in slowest:
+        print(f"  {seconds:8.3f}s  {name}")
+
+    if args.output:
+        with open(args.output, "a") as f:
+            f.write(json.dumps({
+                "module": args.module,
+                "timestamp": time.time(),
+                "median_seconds": median,
+                "timings": timings,
+                "slowest": [{"module": name, "seconds": seconds} for seconds, name in slowest],
+            }) + "\n")
+
+    if args.max_seconds is not None and median > args.max_seconds:
+        print(f"❌ Startup budget exceeded: {median:.3f}s > {args.max_seconds:.3f}s")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+Stub upstream APIs - local stand-ins for OpenWeather and AQICN.
+
+Serves the response shapes DataFetcher parses (weather, forecast, history,
+air pollution history and the AQICN city feed) with configurable latency
+and error rate, so load tests never spend real API quota.
+
+    python benchmarks/stub_upstreams.py --port 9100 --latency-ms 80 --error-rate 0.02
+
+Then point the API at it:
+
+    OPENWEATHER_BASE_URL=http://127.0.0.1:9100/data/2.5
+    OPENWEATHER_HISTORY_BASE_URL=http://127.0.0.1:9100/data/2.5
+    AQICN_BASE_URL=http://127.0.0.1:9100
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+
+def weather_item(dt):
+    return {
+        'dt': dt,
+        'main': {
+            'temp': round(random.uniform(24, 36), 2),
+            'feels_like': round(random.uniform(24, 40), 2),
+            'humidity': random.randint(40, 85),
+            'pressure': random.randint(1000, 1015)
+        },
+        'wind': {'speed': round(random.uniform(1, 8), 2), 'deg': random.randint(0, 359)},
+        'weather': [{'main': 'Haze', 'description': 'haze', 'icon': '50d'}],
+        'visibility': 4000,
+        'sys': {'sunrise': dt - 6 * 3600, 'sunset': dt + 6 * 3600}
+    }
+
+
+def hourly_range(query, default_hours):
+    now = int(time.time())
+    start = int(query.get('start', [now - default_hours * 3600])[0])
+    end = int(query.get('end', [now])[0])
+    return range(start - start % 3600, end + 1, 3600)
+
+
+def respond(path, query):
+    """JSON body for a stubbed endpoint, or None for unknown paths"""
+    now = int(time.time())
+
+    if path.endswith('/weather'):
+        return weather_item(now)
+
+    if path.endswith('/forecast'):
+        return {'list': [weather_item(now + i * 3 * 3600) for i in range(40)]}
+
+    if path.endswith('/history/city'):
+        return {'list': [weather_item(dt) for dt in hourly_range(query, 24)]}
+
+    if path.endswith('/air_pollution/history'):
+        return {'list': [
+            {
+                'dt': dt,
+                'main': {'aqi': random.randint(2, 5)},
+                'components': {
+                    'pm2_5': round(random.uniform(20, 120), 2),
+                    'pm10': round(random.uniform(40, 220), 2),
+                    'o3': round(random.uniform(10, 80), 2),
+                    'no2': round(random.uniform(5, 60), 2),
+                    'so2': round(random.uniform(2, 30), 2),
+                    'co': round(random.uniform(200, 900), 2)
+                }
+            }
+            for dt in hourly_range(query, 24)
+        ]}
+
+    if path.startswith('/feed/'):
+        return {
+            'status': 'ok',
+            'data': {
+                'aqi': random.randint(60, 180),
+                'iaqi': {name: {'v': random.randint(5, 150)} for name in ('pm25', 'pm10', 'o3', 'no2', 'so2', 'co')}
+            }
+        }
+
+    return None
+
+
+class StubUpstreams:
+    """Threaded HTTP server answering like OpenWeather/AQICN"""
+
+    def __init__(self, host='127.0.0.1', port=0, latency_ms=50.0, jitter_ms=20.0, error_rate=0.0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.requests = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                stub.handle(self)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def env(self):
+        """Environment that points DataFetcher at this stub"""
+        return {
+            'OPENWEATHER_BASE_URL': f"{self.url}/data/2.5",
+            'OPENWEATHER_HISTORY_BASE_URL': f"{self.url}/data/2.5",
+            'AQICN_BASE_URL': self.url,
+            'OPENWEATHER_API_KEY': 'stub',
+            'AQICN_API_KEY': 'stub',
+        }
+
+    def handle(self, request):
+        parsed = urlparse(request.path)
+        delay = max(0.0, random.gauss(self.latency_ms, self.jitter_ms)) / 1000
+        time.sleep(delay)
+
+        failed = random.random() < self.error_rate
+        with self._lock:
+            self.requests += 1
+            self.errors += failed
+
+        if failed:
+            status, body = 503, {'message': 'stub injected failure'}
+        else:
+            body = respond(parsed.path, parse_qs(parsed.query))
+            status = 200 if body is not None else 404
+            body = body if body is not None else {'message': 'not found'}
+
+        payload = json.dumps(body).encode()
+        request.send_response(status)
+        request.send_header('Content-Type', 'application/json')
+        request.send_header('Content-Length', str(len(payload)))
+        request.end_headers()
+        request.wfile.write(payload)
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, name='stub-upstreams', daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stub OpenWeather/AQICN servers")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="Mean response latency")
+    parser.add_argument("--jitter-ms", type=float, default=20.0, help="Latency standard deviation")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of 503 responses")
+    args = parser.parse_args()
+
+    stub = StubUpstreams(args.host, args.port, args.latency_ms, args.jitter_ms, args.error_rate)
+    print(f"Stub upstreams listening on {stub.url}")
+    for key, value in stub.env().items():
+        print(f"  {key}={value}")
+
+    try:
+        stub.server.serve_forever()
+    except KeyboardInterrupt:
+        stub.stop()
+
+
+if __name__ == "__main__":
+    main()
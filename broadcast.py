@@ -0,0 +1,93 @@
+import asyncio
+import json
+import threading
+import time
+
+from fastapi.encoders import jsonable_encoder
+
+from metrics import REGISTRY
+from config import SSE_CLIENT_QUEUE_SIZE, SSE_HEARTBEAT_SECONDS
+
+SSE_CLIENTS = REGISTRY.gauge('aqi_sse_clients', 'Connected server-sent event clients')
+SSE_EVENTS = REGISTRY.counter('aqi_sse_events_total', 'Server-sent events published and dropped', ['event', 'outcome'])
+
+
+class Broadcaster:
+    """In-process fan-out of server-sent events.
+
+    publish() encodes an event once and hands the same bytes to every
+    subscriber queue, so the cost of an update does not grow with the
+    number of open dashboards. Each subscriber has a bounded queue; a client
+    that cannot keep up loses its oldest pending events instead of holding
+    memory. The latest event of each type is replayed to new subscribers.
+
+    Event ids are microseconds since the epoch (bumped to stay strictly
+    increasing), so they keep growing across restarts and a client's
+    Last-Event-ID from before a restart still orders correctly.
+    """
+
+    def __init__(self, queue_size=SSE_CLIENT_QUEUE_SIZE, heartbeat=SSE_HEARTBEAT_SECONDS):
+        self.queue_size = queue_size
+        self.heartbeat = heartbeat
+        self.loop = None
+        self.subscribers = set()
+        self.latest = {}
+        self._last_id = 0
+        self._lock = threading.Lock()
+
+    def bind(self, loop):
+        """Attach to the server's event loop (publish() may be called from any thread)"""
+        self.loop = loop
+
+    @staticmethod
+    def encode(event_id, event, data):
+        payload = json.dumps(jsonable_encoder(data), default=float)
+        return f"id: {event_id}\nevent: {event}\ndata: {payload}\n\n".encode()
+
+    def publish(self, event, data):
+        with self._lock:
+            event_id = max(self._last_id + 1, time.time_ns() // 1000)
+            self._last_id = event_id
+            message = self.encode(event_id, event, data)
+            self.latest[event] = (event_id, message)
+
+        SSE_EVENTS.inc(event=event, outcome='published')
+
+        if self.loop is not None and not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self._fan_out, event, message)
+
+        return event_id
+
+    def _fan_out(self, event, message):
+        for queue in list(self.subscribers):
+            if queue.full():
+                queue.get_nowait()
+                SSE_EVENTS.inc(event=event, outcome='dropped')
+            queue.put_nowait(message)
+
+    async def stream(self, last_event_id=None):
+        """Async generator of SSE frames for one client"""
+        queue = asyncio.Queue(maxsize=self.queue_size)
+
+        with self._lock:
+            snapshot = sorted(self.latest.values())
+
+        # Catch up on anything newer than what a reconnecting client already saw
+        for event_id, message in snapshot:
+            if last_event_id is None or event_id > last_event_id:
+                queue.put_nowait(message)
+
+        self.subscribers.add(queue)
+        SSE_CLIENTS.set(len(self.subscribers))
+
+        try:
+            yield b"retry: 5000\n\n"
+            while True:
+                try:
+                    yield await asyncio.wait_for(queue.get(), timeout=self.heartbeat)
+                except asyncio.TimeoutError:
+                    # Comment frame keeps proxies from closing an idle connection
+                    yield b": keep-alive\n\n"
+        finally:
+            self.subscribers.discard(queue)
+            SSE_CLIENTS.set(len(self.subscribers))
@@ -13,12 +13,14 @@ load_dotenv()
 OPENWEATHER_API_KEY = os.getenv("OPENWEATHER_API_KEY")
 AQICN_API_KEY = os.getenv("AQICN_API_KEY")
 
-# Validate required keys
-if not OPENWEATHER_API_KEY:
-    raise ValueError("OPENWEATHER_API_KEY not found in environment variables")
 
-if not AQICN_API_KEY:
-    raise ValueError("AQICN_API_KEY not found in environment variables")
+def require_api_keys():
+    """Validate required keys (called by components that hit the upstream APIs)"""
+    if not OPENWEATHER_API_KEY:
+        raise ValueError("OPENWEATHER_API_KEY not found in environment variables")
+
+    if not AQICN_API_KEY:
+        raise ValueError("AQICN_API_KEY not found in environment variables")
 
 # -------------------------
 # MongoDB Configuration
@@ -26,6 +28,16 @@ if not AQICN_API_KEY:
 MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017/")
 DATABASE_NAME = "aqi_prediction"
 
+# Shared per-process connection pool
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", 50))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", 0))
+MONGO_MAX_IDLE_TIME_MS = int(os.getenv("MONGO_MAX_IDLE_TIME_MS", 60000))
+MONGO_CONNECT_TIMEOUT_MS = int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", 5000))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", 5000))
+MONGO_SOCKET_TIMEOUT_MS = int(os.getenv("MONGO_SOCKET_TIMEOUT_MS", 30000))
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", 5000))
+MONGO_READ_PREFERENCE = os.getenv("MONGO_READ_PREFERENCE", "primary")
+
 # -------------------------
 # Location Configuration
 # -------------------------
@@ -39,3 +51,166 @@ CITY = "Karachi"
 MODEL_DIR = "models/"
 FEATURE_STORE_COLLECTION = "features"
 MODEL_REGISTRY_COLLECTION = "models"
+MODEL_COUNTERS_COLLECTION = "model_counters"
+# One document per alias ({_id: alias, name, version}) so moving an alias is a single write
+MODEL_ALIASES_COLLECTION = "model_aliases"
+# Registry alias the API serves; train_all_models moves it to the lowest validation RMSE
+CHAMPION_ALIAS = "champion"
+
+# -------------------------
+# Scheduler Configuration
+# -------------------------
+SCHEDULER_JOBS_COLLECTION = "scheduler_jobs"
+SCHEDULER_INGEST_WORKERS = int(os.getenv("SCHEDULER_INGEST_WORKERS", 2))
+SCHEDULER_TRAINING_WORKERS = int(os.getenv("SCHEDULER_TRAINING_WORKERS", 1))
+INGEST_MISFIRE_GRACE_SECONDS = int(os.getenv("INGEST_MISFIRE_GRACE_SECONDS", 15 * 60))
+TRAINING_MISFIRE_GRACE_SECONDS = int(os.getenv("TRAINING_MISFIRE_GRACE_SECONDS", 3 * 60 * 60))
+# Catch-up refetches missed hours from the backfill provider (backfill.py); off when there is none
+CATCHUP_ENABLED = os.getenv("CATCHUP_ENABLED", "true").lower() == "true"
+CATCHUP_MAX_HOURS = int(os.getenv("CATCHUP_MAX_HOURS", 7 * 24))
+
+# -------------------------
+# Training
+# -------------------------
+# incremental: continue the stored models on new rows, full: retrain from scratch every run
+TRAINING_MODE = os.getenv("TRAINING_MODE", "incremental")
+TRAINING_DAYS = int(os.getenv("TRAINING_DAYS", 30))
+INCREMENTAL_TREES = int(os.getenv("INCREMENTAL_TREES", 10))
+INCREMENTAL_MIN_ROWS = int(os.getenv("INCREMENTAL_MIN_ROWS", 24))
+# Full retrain when prequential RMSE exceeds the validation RMSE by this factor
+RETRAIN_DEGRADATION_FACTOR = float(os.getenv("RETRAIN_DEGRADATION_FACTOR", 1.25))
+# Full retrain when new rows sit this many standard deviations from the training mean
+RETRAIN_DRIFT_THRESHOLD = float(os.getenv("RETRAIN_DRIFT_THRESHOLD", 0.5))
+FULL_RETRAIN_MAX_AGE_DAYS = int(os.getenv("FULL_RETRAIN_MAX_AGE_DAYS", 30))
+# Materialized X/y memmaps reused across training runs (empty disables)
+TRAINING_CACHE_DIR = os.getenv("TRAINING_CACHE_DIR", "cache/training/")
+TRAINING_CACHE_CHUNK_DAYS = int(os.getenv("TRAINING_CACHE_CHUNK_DAYS", 7))
+
+# -------------------------
+# Feature Engineering
+# -------------------------
+# Frames with at least this many rows are built in overlapping partitions on a process pool.
+# Off by default: shipping partitions to the workers costs more per row than the row
+# features themselves (26k rows: 146 ms serial, 353 ms on 2 workers), so only enable it
+# after benchmarks/feature_benchmark.py shows a win on the target machine.
+FEATURE_WORKERS = int(os.getenv("FEATURE_WORKERS", 1))
+FEATURE_PARALLEL_MIN_ROWS = int(os.getenv("FEATURE_PARALLEL_MIN_ROWS", 200000))
+# pandas | polars (one lazy multi-threaded query, needs the polars package)
+FEATURE_ENGINE = os.getenv("FEATURE_ENGINE", "pandas")
+
+# -------------------------
+# Historical Backfill
+# -------------------------
+# openweather (history + air pollution APIs) or fixture (recorded CSV/JSONL rows)
+BACKFILL_PROVIDER = os.getenv("BACKFILL_PROVIDER", "openweather")
+BACKFILL_FIXTURE_PATH = os.getenv("BACKFILL_FIXTURE_PATH", "fixtures/karachi_hourly.csv")
+BACKFILL_CHECKPOINT_COLLECTION = "backfill_checkpoints"
+# OpenWeather history returns at most one week per call
+BACKFILL_CHUNK_HOURS = int(os.getenv("BACKFILL_CHUNK_HOURS", 7 * 24))
+BACKFILL_WORKERS = int(os.getenv("BACKFILL_WORKERS", 4))
+BACKFILL_RATE_PER_SECOND = float(os.getenv("BACKFILL_RATE_PER_SECOND", 1.0))
+
+# -------------------------
+# Upstream API Resilience
+# -------------------------
+# Base URLs are overridable so load tests can point the API at local stub servers
+OPENWEATHER_BASE_URL = os.getenv("OPENWEATHER_BASE_URL", "https://api.openweathermap.org/data/2.5")
+OPENWEATHER_HISTORY_BASE_URL = os.getenv("OPENWEATHER_HISTORY_BASE_URL", "https://history.openweathermap.org/data/2.5")
+AQICN_BASE_URL = os.getenv("AQICN_BASE_URL", "https://api.waqi.info")
+UPSTREAM_CONNECT_TIMEOUT = float(os.getenv("UPSTREAM_CONNECT_TIMEOUT", 3.05))
+UPSTREAM_READ_TIMEOUT = float(os.getenv("UPSTREAM_READ_TIMEOUT", 10))
+UPSTREAM_MAX_RETRIES = int(os.getenv("UPSTREAM_MAX_RETRIES", 2))
+UPSTREAM_BACKOFF_BASE = float(os.getenv("UPSTREAM_BACKOFF_BASE", 0.25))
+UPSTREAM_BACKOFF_MAX = float(os.getenv("UPSTREAM_BACKOFF_MAX", 4))
+UPSTREAM_DEADLINE_SECONDS = float(os.getenv("UPSTREAM_DEADLINE_SECONDS", 15))
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", 5))
+CIRCUIT_RESET_SECONDS = float(os.getenv("CIRCUIT_RESET_SECONDS", 30))
+# Latency percentile after which a hedged duplicate request is sent (0 disables)
+UPSTREAM_HEDGE_PERCENTILE = float(os.getenv("UPSTREAM_HEDGE_PERCENTILE", 0))
+
+# -------------------------
+# Instrumentation
+# -------------------------
+# Dump a cProfile for API requests slower than this many milliseconds (0 disables)
+PROFILE_SLOW_REQUEST_MS = float(os.getenv("PROFILE_SLOW_REQUEST_MS", 0))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles/")
+
+# -------------------------
+# Serving
+# -------------------------
+MODEL_CACHE_TTL_SECONDS = int(os.getenv("MODEL_CACHE_TTL_SECONDS", 300))
+# Inference backend: native (NumPy tree arrays), onnx (onnxruntime) or model (original object)
+INFERENCE_ENGINE = os.getenv("INFERENCE_ENGINE", "native")
+# Recent observations kept in the API process and how often it polls for new ones
+RING_BUFFER_HOURS = int(os.getenv("RING_BUFFER_HOURS", 7 * 24))
+RING_BUFFER_POLL_SECONDS = float(os.getenv("RING_BUFFER_POLL_SECONDS", 60))
+# Writes stamped this long before the ingested_at watermark may still be committing, so polls re-read them
+RING_BUFFER_INGEST_LAG_SECONDS = float(os.getenv("RING_BUFFER_INGEST_LAG_SECONDS", 60))
+# Optional API URL the ingest job POSTs to after storing a row (e.g. http://api:8000/api/observations/refresh)
+SERVING_NOTIFY_URL = os.getenv("SERVING_NOTIFY_URL", "")
+# Server-sent events: pending events kept per slow client and idle keep-alive interval
+SSE_CLIENT_QUEUE_SIZE = int(os.getenv("SSE_CLIENT_QUEUE_SIZE", 16))
+SSE_HEARTBEAT_SECONDS = float(os.getenv("SSE_HEARTBEAT_SECONDS", 15))
+
+# -------------------------
+# Feature Store Layout
+# -------------------------
+# Use a native MongoDB time-series collection (timeField=timestamp, metaField=meta)
+FEATURE_STORE_TIMESERIES = os.getenv("FEATURE_STORE_TIMESERIES", "false").lower() == "true"
+FEATURE_STORE_TS_COLLECTION = "features_ts"
+# Last fully copied batch of migrate_to_timeseries, so an interrupted run resumes there
+MIGRATION_CHECKPOINT_COLLECTION = "migrations"
+FEATURE_ROLLUP_COLLECTION = "features_daily"
+ROLLUP_FIELDS = ['aqi', 'pm25', 'pm10', 'o3', 'no2', 'so2', 'co', 'temp', 'humidity', 'pressure', 'wind_speed']
+
+# -------------------------
+# Analytics
+# -------------------------
+# server: EDA statistics from MongoDB aggregations (kilobytes), pandas: load every row
+EDA_MODE = os.getenv("EDA_MODE", "server")
+EDA_HISTOGRAM_BINS = int(os.getenv("EDA_HISTOGRAM_BINS", 30))
+# Time-series plots and /api/analytics/series: lttb or minmax, at most this many points per series
+DOWNSAMPLE_METHOD = os.getenv("DOWNSAMPLE_METHOD", "lttb")
+DOWNSAMPLE_POINTS = int(os.getenv("DOWNSAMPLE_POINTS", 1000))
+
+# -------------------------
+# Alerts
+# -------------------------
+ALERT_RULES_COLLECTION = "alert_rules"
+ALERTS_COLLECTION = "alerts"
+ALERT_STATE_COLLECTION = "alert_state"
+# Furthest forecast day a rule may watch (predict_next_3_days)
+ALERT_MAX_HORIZON_DAYS = 3
+# Rule state updates and fired alerts are written in batches of this many
+ALERT_WRITE_BATCH = int(os.getenv("ALERT_WRITE_BATCH", 50000))
+
+# -------------------------
+# Drift Monitoring
+# -------------------------
+DRIFT_COLLECTION = "drift_monitor"
+DRIFT_FIELDS = ROLLUP_FIELDS
+# Quantile bins of the training reference; live counts decay with this half-life
+DRIFT_BINS = int(os.getenv("DRIFT_BINS", 10))
+DRIFT_HALF_LIFE_HOURS = float(os.getenv("DRIFT_HALF_LIFE_HOURS", 7 * 24))
+# Scores are only trusted once the sketches hold this many (decayed) rows
+DRIFT_MIN_ROWS = int(os.getenv("DRIFT_MIN_ROWS", 48))
+# Population stability index above which a feature counts as drifted
+DRIFT_PSI_THRESHOLD = float(os.getenv("DRIFT_PSI_THRESHOLD", 0.25))
+# Queue a full retrain from the hourly pipeline on drift (at most once per cooldown)
+DRIFT_RETRAIN = os.getenv("DRIFT_RETRAIN", "true").lower() == "true"
+DRIFT_RETRAIN_COOLDOWN_HOURS = int(os.getenv("DRIFT_RETRAIN_COOLDOWN_HOURS", 24))
+
+# -------------------------
+# Forecast Accuracy
+# -------------------------
+FORECASTS_COLLECTION = "forecasts"
+FORECAST_METRICS_COLLECTION = "forecast_metrics"
+# Rolling window of the live RMSE/MAE (daily accumulators are summed over it)
+FORECAST_METRICS_DAYS = int(os.getenv("FORECAST_METRICS_DAYS", 7))
+# Forecasts whose target hour never got ingested stop waiting after this long
+FORECAST_EXPIRE_HOURS = int(os.getenv("FORECAST_EXPIRE_HOURS", 48))
+# Promote the model with the best live RMSE from the hourly pipeline
+FORECAST_AUTO_PROMOTE = os.getenv("FORECAST_AUTO_PROMOTE", "false").lower() == "true"
+FORECAST_PROMOTION_MIN_SAMPLES = int(os.getenv("FORECAST_PROMOTION_MIN_SAMPLES", 24))
+# A challenger must beat the champion's live RMSE by this fraction
+FORECAST_PROMOTION_MARGIN = float(os.getenv("FORECAST_PROMOTION_MARGIN", 0.05))
@@ -1,17 +1,39 @@
-import requests
 import pandas as pd
 from datetime import datetime
-from config import OPENWEATHER_API_KEY, AQICN_API_KEY, LAT, LON, CITY
+from config import (
+    OPENWEATHER_API_KEY, AQICN_API_KEY, LAT, LON, CITY, require_api_keys,
+    OPENWEATHER_BASE_URL, OPENWEATHER_HISTORY_BASE_URL, AQICN_BASE_URL,
+)
+from upstream import get_default_client
+from metrics import timed
+
+
+def parse_weather_item(item):
+    """Flatten one OpenWeather list entry (forecast or history) into a feature row"""
+    return {
+        'timestamp': datetime.fromtimestamp(item['dt']),
+        'temp': item['main']['temp'],
+        'humidity': item['main']['humidity'],
+        'pressure': item['main']['pressure'],
+        'wind_speed': item['wind']['speed'],
+        'wind_deg': item['wind'].get('deg'),
+        'weather_main': item['weather'][0]['main'],
+        'weather_description': item['weather'][0]['description']
+    }
 
 
 class DataFetcher:
-    def __init__(self):
-        self.openweather_base = "https://api.openweathermap.org/data/2.5"
-        self.aqicn_base = "https://api.waqi.info"
+    def __init__(self, client=None):
+        require_api_keys()
+        self.client = client or get_default_client()
+        self.openweather_base = OPENWEATHER_BASE_URL
+        self.openweather_history_base = OPENWEATHER_HISTORY_BASE_URL
+        self.aqicn_base = AQICN_BASE_URL
 
     # --------------------------------------------------
     # CURRENT WEATHER (FREE)
     # --------------------------------------------------
+    @timed('fetch_weather')
     def fetch_weather_data(self):
         url = f"{self.openweather_base}/weather"
         params = {
@@ -21,13 +43,12 @@ class DataFetcher:
             'units': 'metric'
         }
 
-        response = requests.get(url, params=params)
-        response.raise_for_status()
-        return response.json()
+        return self.client.get_json(url, params=params)
 
     # --------------------------------------------------
     # 5-DAY FORECAST (FREE)
     # --------------------------------------------------
+    @timed('fetch_forecast')
     def fetch_forecast_data(self):
         url = f"{self.openweather_base}/forecast"
         params = {
@@ -37,22 +58,52 @@ class DataFetcher:
             'units': 'metric'
         }
 
-        response = requests.get(url, params=params)
-        response.raise_for_status()
-        return response.json()
+        return self.client.get_json(url, params=params)
 
     # --------------------------------------------------
     # CURRENT AQI
     # --------------------------------------------------
+    @timed('fetch_aqi')
     def fetch_aqi_data(self):
         url = f"{self.aqicn_base}/feed/{CITY}/"
         params = {
             'token': AQICN_API_KEY
         }
 
-        response = requests.get(url, params=params)
-        response.raise_for_status()
-        return response.json()
+        return self.client.get_json(url, params=params)
+
+    # --------------------------------------------------
+    # HOURLY HISTORY (range queries)
+    # --------------------------------------------------
+    @timed('fetch_weather_history')
+    def fetch_weather_history(self, start, end):
+        """Hourly weather between two datetimes (at most one week per call)"""
+        url = f"{self.openweather_history_base}/history/city"
+        params = {
+            'lat': LAT,
+            'lon': LON,
+            'type': 'hour',
+            'start': int(start.timestamp()),
+            'end': int(end.timestamp()),
+            'appid': OPENWEATHER_API_KEY,
+            'units': 'metric'
+        }
+
+        return self.client.get_json(url, params=params)
+
+    @timed('fetch_air_pollution_history')
+    def fetch_air_pollution_history(self, start, end):
+        """Hourly pollutant concentrations (µg/m³) between two datetimes"""
+        url = f"{self.openweather_base}/air_pollution/history"
+        params = {
+            'lat': LAT,
+            'lon': LON,
+            'start': int(start.timestamp()),
+            'end': int(end.timestamp()),
+            'appid': OPENWEATHER_API_KEY
+        }
+
+        return self.client.get_json(url, params=params)
 
     # --------------------------------------------------
     # SIMULATED HISTORICAL (using forecast)
@@ -60,22 +111,7 @@ class DataFetcher:
     def get_historical_weather(self):
         forecast = self.fetch_forecast_data()
 
-        data = []
-
-        for item in forecast['list']:
-            record = {
-                'timestamp': datetime.fromtimestamp(item['dt']),
-                'temp': item['main']['temp'],
-                'humidity': item['main']['humidity'],
-                'pressure': item['main']['pressure'],
-                'wind_speed': item['wind']['speed'],
-                'wind_deg': item['wind']['deg'],
-                'weather_main': item['weather'][0]['main'],
-                'weather_description': item['weather'][0]['description']
-            }
-            data.append(record)
-
-        return pd.DataFrame(data)
+        return pd.DataFrame([parse_weather_item(item) for item in forecast['list']])
 
     # --------------------------------------------------
     # CURRENT COMBINED DATA
@@ -1,50 +1,293 @@
-from pymongo import MongoClient
-from config import MONGO_URI, DATABASE_NAME, FEATURE_STORE_COLLECTION, MODEL_REGISTRY_COLLECTION
+import os
+import threading
+from pymongo import MongoClient, UpdateOne, monitoring
+from config import (
+    MONGO_URI, DATABASE_NAME, FEATURE_STORE_COLLECTION, MODEL_REGISTRY_COLLECTION,
+    MONGO_MAX_POOL_SIZE, MONGO_MIN_POOL_SIZE, MONGO_MAX_IDLE_TIME_MS,
+    MONGO_CONNECT_TIMEOUT_MS, MONGO_SERVER_SELECTION_TIMEOUT_MS,
+    MONGO_SOCKET_TIMEOUT_MS, MONGO_WAIT_QUEUE_TIMEOUT_MS, MONGO_READ_PREFERENCE,
+    CITY, FEATURE_STORE_TIMESERIES, FEATURE_STORE_TS_COLLECTION,
+    FEATURE_ROLLUP_COLLECTION, ROLLUP_FIELDS, MIGRATION_CHECKPOINT_COLLECTION,
+)
 import pickle
 import pandas as pd
 from datetime import datetime
+from metrics import REGISTRY, timed, record_db_io
 
+POOL_CONNECTIONS = REGISTRY.gauge(
+    'aqi_mongo_pool_connections', 'Open MongoDB connections in the shared pool', ['address', 'state'])
+POOL_EVENTS = REGISTRY.counter(
+    'aqi_mongo_pool_events_total', 'MongoDB connection pool events', ['address', 'event'])
+
+
+# =========================
+# SHARED CONNECTION POOL
+# =========================
+
+class PoolStatsListener(monitoring.ConnectionPoolListener):
+    """Tracks open / in-use connections and checkout failures per server"""
 
-class DatabaseManager:
     def __init__(self):
-        self.client = MongoClient(MONGO_URI)
+        self.lock = threading.Lock()
+        self.servers = {}
+
+    def _update(self, address, event, open_delta=0, in_use_delta=0):
+        address = f"{address[0]}:{address[1]}"
+        with self.lock:
+            stats = self.servers.setdefault(address, {
+                'open': 0, 'in_use': 0, 'created': 0, 'closed': 0,
+                'checked_out': 0, 'checked_in': 0, 'checkout_failed': 0, 'cleared': 0
+            })
+            stats['open'] += open_delta
+            stats['in_use'] += in_use_delta
+            stats[event] += 1
+            open_count, in_use = stats['open'], stats['in_use']
+
+        POOL_EVENTS.inc(address=address, event=event)
+        POOL_CONNECTIONS.set(open_count, address=address, state='open')
+        POOL_CONNECTIONS.set(in_use, address=address, state='in_use')
+
+    def connection_created(self, event):
+        self._update(event.address, 'created', open_delta=1)
+
+    def connection_closed(self, event):
+        self._update(event.address, 'closed', open_delta=-1)
+
+    def connection_checked_out(self, event):
+        self._update(event.address, 'checked_out', in_use_delta=1)
+
+    def connection_checked_in(self, event):
+        self._update(event.address, 'checked_in', in_use_delta=-1)
+
+    def connection_check_out_failed(self, event):
+        self._update(event.address, 'checkout_failed')
+
+    def pool_cleared(self, event):
+        self._update(event.address, 'cleared')
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def snapshot(self):
+        with self.lock:
+            return {address: dict(stats) for address, stats in self.servers.items()}
+
+
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+_pool_listener = PoolStatsListener()
+
+
+def get_client():
+    """Process-wide MongoClient shared by every DatabaseManager.
+
+    Recreated after fork, since pymongo clients are not fork-safe
+    (e.g. in the scheduler's training process pool).
+    """
+    global _client, _client_pid
+
+    with _client_lock:
+        if _client is None or _client_pid != os.getpid():
+            _client = MongoClient(
+                MONGO_URI,
+                maxPoolSize=MONGO_MAX_POOL_SIZE,
+                minPoolSize=MONGO_MIN_POOL_SIZE,
+                maxIdleTimeMS=MONGO_MAX_IDLE_TIME_MS,
+                connectTimeoutMS=MONGO_CONNECT_TIMEOUT_MS,
+                serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+                socketTimeoutMS=MONGO_SOCKET_TIMEOUT_MS,
+                waitQueueTimeoutMS=MONGO_WAIT_QUEUE_TIMEOUT_MS,
+                readPreference=MONGO_READ_PREFERENCE,
+                event_listeners=[_pool_listener]
+            )
+            _client_pid = os.getpid()
+
+        return _client
+
+
+def pool_stats():
+    """Shared pool configuration and per-server connection counters"""
+    return {
+        'config': {
+            'max_pool_size': MONGO_MAX_POOL_SIZE,
+            'min_pool_size': MONGO_MIN_POOL_SIZE,
+            'max_idle_time_ms': MONGO_MAX_IDLE_TIME_MS,
+            'wait_queue_timeout_ms': MONGO_WAIT_QUEUE_TIMEOUT_MS,
+            'read_preference': MONGO_READ_PREFERENCE,
+        },
+        'servers': _pool_listener.snapshot()
+    }
+
+
+_prepared_collections = set()
+
+
+class DatabaseManager:
+    def __init__(self, client=None, timeseries=FEATURE_STORE_TIMESERIES):
+        self.client = client or get_client()
         self.db = self.client[DATABASE_NAME]
-        self.features_collection = self.db[FEATURE_STORE_COLLECTION]
+        self.timeseries = timeseries
         self.models_collection = self.db[MODEL_REGISTRY_COLLECTION]
+        self.rollup_collection = self.db[FEATURE_ROLLUP_COLLECTION]
+
+        if timeseries:
+            self.features_collection = self.db[FEATURE_STORE_TS_COLLECTION]
+        else:
+            self.features_collection = self.db[FEATURE_STORE_COLLECTION]
+
+        self._prepare_feature_store()
+
+    def _prepare_feature_store(self):
+        """Create the feature collection and its indexes once per process"""
+        key = (id(self.client), self.features_collection.name)
+        if key in _prepared_collections:
+            return
+
+        try:
+            if self.timeseries:
+                self.ensure_timeseries_collection()
+                self.features_collection.create_index([('meta.city', 1), ('timestamp', 1)])
+                self.features_collection.create_index([('meta.city', 1), ('ingested_at', 1)])
+            else:
+                self.features_collection.create_index('timestamp')
+                self.features_collection.create_index('ingested_at')
+            _prepared_collections.add(key)
+        except Exception as e:
+            # Server unreachable at construction time; retried by the next instance
+            print(f"Could not prepare feature store: {e}")
+
+    def ensure_timeseries_collection(self, name=FEATURE_STORE_TS_COLLECTION):
+        """Create the native time-series feature collection if it does not exist"""
+        if name not in self.db.list_collection_names(filter={'name': name}):
+            self.db.create_collection(
+                name,
+                timeseries={
+                    'timeField': 'timestamp',
+                    'metaField': 'meta',
+                    'granularity': 'hours'
+                }
+            )
+            print(f"Created time-series collection: {name}")
+
+        return self.db[name]
+
+    def _feature_filter(self):
+        # Time-series buckets are grouped by meta, so filtering on it prunes buckets
+        return {'meta.city': CITY} if self.timeseries else {}
+
+    def ping(self):
+        """Round-trip to the server, opening a pooled connection"""
+        self.client.admin.command('ping')
 
     # =========================
     # FEATURE STORAGE
     # =========================
 
-    def store_features(self, features_df):
-        """Store processed features in MongoDB"""
+    def store_features(self, features_df, source='live'):
+        """Store processed features in MongoDB, one row per hour.
+
+        Timestamps are floored to the hour and written as an upsert, so a
+        live reading replaces whatever a backfill stored for that hour
+        instead of sitting next to it a few seconds later (time-series
+        collections cannot update, so there the first row of an hour stays).
+        """
         if features_df.empty:
             print("No features to store.")
             return
 
-        records = features_df.to_dict('records')
+        features_df = features_df.copy()
+        features_df['timestamp'] = pd.to_datetime(features_df['timestamp']).dt.floor('h')
 
-        # Ensure timestamps are datetime objects
-        for record in records:
-            if isinstance(record.get('timestamp'), str):
-                record['timestamp'] = datetime.fromisoformat(record['timestamp'])
+        result = self._write_hours(features_df, source, overwrite=True)
+        print(f"Stored {result['inserted'] + result['updated']} feature records")
+        return result
 
-        self.features_collection.insert_many(records)
-        print(f"Stored {len(records)} feature records")
+    def upsert_features(self, features_df, source='backfill'):
+        """Idempotent write keyed by timestamp that only fills hours not stored yet.
 
-    def get_features(self, start_date=None, end_date=None, limit=None):
-        """Retrieve features from MongoDB"""
-        query = {}
+        A replayed chunk never duplicates rows, and backfilled history never
+        overwrites the richer live reading of the same hour.
+        """
+        if features_df.empty:
+            return {'inserted': 0, 'updated': 0}
+
+        return self._write_hours(features_df, source, overwrite=False)
+
+    def _write_hours(self, features_df, source, overwrite):
+        records = features_df.to_dict('records')
+        ingested_at = datetime.now()
+
+        # Rewritten hours get a new ingested_at too, so readers polling on it see the change
+        for record in records:
+            if isinstance(record.get('timestamp'), pd.Timestamp):
+                record['timestamp'] = record['timestamp'].to_pydatetime()
+            record['ingested_at'] = ingested_at
+            if self.timeseries:
+                record['meta'] = {'city': CITY, 'source': source}
+
+        with timed('db_write_features'):
+            if self.timeseries:
+                # Time-series collections cannot upsert; insert only the hours not stored yet
+                query = self._feature_filter()
+                query['timestamp'] = {'$in': [record['timestamp'] for record in records]}
+                existing = {
+                    document['timestamp']
+                    for document in self.features_collection.find(query, {'timestamp': 1, '_id': 0})
+                }
+                records = [record for record in records if record['timestamp'] not in existing]
+
+                if records:
+                    self.features_collection.insert_many(records)
+                result = {'inserted': len(records), 'updated': 0}
+            else:
+                update = '$set' if overwrite else '$setOnInsert'
+                operations = [
+                    UpdateOne({'timestamp': record['timestamp']}, {update: record}, upsert=True)
+                    for record in records
+                ]
+                write = self.features_collection.bulk_write(operations, ordered=False)
+                result = {'inserted': write.upserted_count, 'updated': write.modified_count}
+
+        record_db_io('write', self.features_collection.name, len(records))
+        return result
+
+    def get_features(self, start_date=None, end_date=None, limit=None, fields=None):
+        """Retrieve features from MongoDB (optionally only the given fields)"""
+        query = self._feature_filter()
 
         if start_date and end_date:
             query['timestamp'] = {'$gte': start_date, '$lte': end_date}
 
-        cursor = self.features_collection.find(query).sort('timestamp', 1)
+        if fields:
+            projection = {field: 1 for field in ['timestamp'] + list(fields)}
+            projection['_id'] = 0
+        else:
+            projection = {'_id': 0, 'meta': 0, 'ingested_at': 0}
+
+        cursor = self.features_collection.find(query, projection).sort('timestamp', 1)
 
         if limit:
             cursor = cursor.limit(limit)
 
-        df = pd.DataFrame(list(cursor))
+        with timed('db_read_features'):
+            documents = list(cursor)
+
+        record_db_io('read', self.features_collection.name, len(documents))
+
+        df = pd.DataFrame(documents)
 
         if df.empty:
             return df
@@ -59,6 +302,12 @@ class DatabaseManager:
 
         return df
 
+    def count_features(self, start_date, end_date):
+        """Number of stored feature rows in a time range (index-only on timestamp)"""
+        query = self._feature_filter()
+        query['timestamp'] = {'$gte': start_date, '$lte': end_date}
+        return self.features_collection.count_documents(query)
+
     # =========================
     # MODEL STORAGE
     # =========================
@@ -75,7 +324,10 @@ class DatabaseManager:
             'version': metadata.get('version', 1)
         }
 
-        self.models_collection.insert_one(document)
+        with timed('db_write_model'):
+            self.models_collection.insert_one(document)
+
+        record_db_io('write', MODEL_REGISTRY_COLLECTION, 1, len(model_data))
         print(f"Stored model: {model_name}")
 
     def get_model(self, model_name, version=None):
@@ -85,17 +337,35 @@ class DatabaseManager:
         if version:
             query['version'] = version
 
-        document = self.models_collection.find_one(
-            query,
-            sort=[('created_at', -1)]
-        )
+        return self.find_model(query, sort=[('version', -1), ('created_at', -1)])
+
+    def find_model(self, query, sort=None):
+        """Load the newest model document matching a query"""
+        with timed('model_load'):
+            document = self.models_collection.find_one(
+                query,
+                sort=sort or [('created_at', -1)]
+            )
+
+            if document:
+                record_db_io('read', MODEL_REGISTRY_COLLECTION, 1, len(document['model']))
+                model = pickle.loads(document['model'])
 
         if document:
-            model = pickle.loads(document['model'])
-            return model, document['metadata']
+            return model, dict(document['metadata'], name=document['name'])
 
         return None, None
 
+    def get_model_metadata(self, model_name):
+        """Latest metadata for a model without loading the pickled bytes"""
+        document = self.models_collection.find_one(
+            {'name': model_name},
+            {'model': 0},
+            sort=[('version', -1), ('created_at', -1)]
+        )
+
+        return document['metadata'] if document else None
+
     # =========================
     # TRAINING HELPERS
     # =========================
@@ -107,6 +377,43 @@ class DatabaseManager:
 
         return self.get_features(start_date, end_date)
 
+    def get_feature_changes(self, ingested_after=None, start_date=None):
+        """Rows written after an ingested_at watermark and/or from start_date on, oldest hour first.
+
+        Unlike get_features() the ingested_at column is kept, so a reader can
+        advance its own watermark; rows are matched by write time, not by
+        their timestamp, so backfilled and rewritten hours are included.
+        """
+        query = self._feature_filter()
+
+        if ingested_after is not None:
+            query['ingested_at'] = {'$gt': ingested_after}
+        if start_date is not None:
+            query['timestamp'] = {'$gte': start_date}
+
+        documents = list(self.features_collection.find(query, {'_id': 0, 'meta': 0}).sort('timestamp', 1))
+        record_db_io('read', self.features_collection.name, len(documents))
+        df = pd.DataFrame(documents)
+
+        if not df.empty:
+            df['timestamp'] = pd.to_datetime(df['timestamp'])
+            df['ingested_at'] = pd.to_datetime(df['ingested_at']) if 'ingested_at' in df else pd.NaT
+
+        return df
+
+    def get_latest_timestamp(self):
+        """Get the timestamp of the most recent stored feature row"""
+        document = self.features_collection.find_one(
+            self._feature_filter(),
+            {'timestamp': 1},
+            sort=[('timestamp', -1)]
+        )
+
+        if document:
+            return document['timestamp']
+
+        return None
+
     def get_training_data(self, days=30):
         """Get training data for model training"""
         end_date = datetime.now()
@@ -119,3 +426,212 @@ class DatabaseManager:
             df.drop(columns=["_id"], inplace=True)
 
         return df
+
+    # =========================
+    # TIME-SERIES MIGRATION
+    # =========================
+
+    def migrate_to_timeseries(self, batch_size=5000, source='migrated'):
+        """Copy the plain features collection into the time-series collection.
+
+        Resumable: a checkpoint is written after every batch that was fully
+        inserted, and a rerun re-reads from that batch's last timestamp
+        ($gte) and skips the timestamps the target already holds, so rows an
+        interrupted unordered insert never wrote are copied again.
+        """
+        target = self.ensure_timeseries_collection()
+        source_collection = self.db[FEATURE_STORE_COLLECTION]
+        checkpoints = self.db[MIGRATION_CHECKPOINT_COLLECTION]
+        checkpoint_id = f"{source_collection.name}->{target.name}"
+
+        checkpoint = checkpoints.find_one({'_id': checkpoint_id})
+        query = {'timestamp': {'$gte': checkpoint['timestamp']}} if checkpoint else {}
+
+        cursor = source_collection.find(query, {'_id': 0}).sort('timestamp', 1).batch_size(batch_size)
+        migrated = 0
+        batch = []
+
+        def flush(batch):
+            existing = {
+                document['timestamp']
+                for document in target.find(
+                    {'meta.city': CITY, 'timestamp': {'$in': [document['timestamp'] for document in batch]}},
+                    {'timestamp': 1, '_id': 0}
+                )
+            }
+            records = [document for document in batch if document['timestamp'] not in existing]
+
+            if records:
+                target.insert_many(records, ordered=False)
+
+            # Only after the insert returned: every row up to here is in the target
+            checkpoints.update_one(
+                {'_id': checkpoint_id},
+                {'$set': {'timestamp': batch[-1]['timestamp'], 'updated_at': datetime.now()}},
+                upsert=True
+            )
+            return len(records)
+
+        for document in cursor:
+            if not isinstance(document.get('timestamp'), datetime):
+                continue
+            document['meta'] = {'city': CITY, 'source': source}
+            batch.append(document)
+
+            if len(batch) >= batch_size:
+                migrated += flush(batch)
+                batch = []
+                print(f"Migrated {migrated} feature records...")
+
+        if batch:
+            migrated += flush(batch)
+
+        print(f"✅ Migrated {migrated} feature records to {target.name}")
+        return migrated
+
+    # =========================
+    # DAILY ROLLUPS
+    # =========================
+
+    def refresh_daily_rollups(self, start_date=None, end_date=None):
+        """Recompute daily aggregates for the range and merge them into the rollup collection"""
+        match = self._feature_filter()
+
+        if start_date or end_date:
+            match['timestamp'] = {}
+            if start_date:
+                match['timestamp']['$gte'] = datetime.combine(start_date.date(), datetime.min.time())
+            if end_date:
+                match['timestamp']['$lte'] = end_date
+
+        group = {
+            '_id': {'$dateTrunc': {'date': '$timestamp', 'unit': 'day'}},
+            'count': {'$sum': 1}
+        }
+        for field in ROLLUP_FIELDS:
+            group[f'{field}_mean'] = {'$avg': f'${field}'}
+            group[f'{field}_min'] = {'$min': f'${field}'}
+            group[f'{field}_max'] = {'$max': f'${field}'}
+
+        pipeline = [
+            {'$match': match},
+            {'$group': group},
+            {'$set': {'date': '$_id', 'city': CITY}},
+            {'$merge': {
+                'into': FEATURE_ROLLUP_COLLECTION,
+                'on': '_id',
+                'whenMatched': 'replace',
+                'whenNotMatched': 'insert'
+            }}
+        ]
+
+        with timed('db_refresh_rollups'):
+            self.features_collection.aggregate(pipeline)
+
+    def get_daily_rollups(self, start_date=None, end_date=None):
+        """Retrieve daily aggregates for long-range analytics"""
+        query = {}
+
+        if start_date and end_date:
+            query['date'] = {'$gte': start_date, '$lte': end_date}
+
+        documents = list(self.rollup_collection.find(query, {'_id': 0}).sort('date', 1))
+        record_db_io('read', FEATURE_ROLLUP_COLLECTION, len(documents))
+
+        return pd.DataFrame(documents)
+
+    # =========================
+    # SERVER-SIDE STATISTICS
+    # =========================
+
+    def _stats_match(self, start_date=None, end_date=None, fields=()):
+        match = self._feature_filter()
+
+        if start_date and end_date:
+            match['timestamp'] = {'$gte': start_date, '$lte': end_date}
+
+        # Numbers only; NaN sorts below -inf, so this also skips the NaNs stored for gaps
+        for field in fields:
+            match[field] = {'$type': 'number', '$gt': float('-inf')}
+
+        return match
+
+    def _aggregate_stats(self, pipeline):
+        with timed('db_feature_stats'):
+            documents = list(self.features_collection.aggregate(pipeline))
+
+        record_db_io('read', self.features_collection.name, len(documents))
+        return documents
+
+    def get_feature_moments(self, fields, start_date=None, end_date=None):
+        """Count, sum, sum of squares, min and max of each field, from one $group"""
+        group = {'_id': None}
+
+        for i, field in enumerate(fields):
+            valid = {'$and': [{'$isNumber': f'${field}'}, {'$gt': [f'${field}', float('-inf')]}]}
+            value = {'$cond': [valid, f'${field}', None]}
+            group[f'n{i}'] = {'$sum': {'$cond': [valid, 1, 0]}}
+            group[f'sum{i}'] = {'$sum': value}
+            group[f'sumsq{i}'] = {'$sum': {'$multiply': [value, value]}}
+            group[f'min{i}'] = {'$min': value}
+            group[f'max{i}'] = {'$max': value}
+
+        documents = self._aggregate_stats([{'$match': self._stats_match(start_date, end_date)}, {'$group': group}])
+        totals = documents[0] if documents else {}
+
+        return {
+            field: {
+                'count': totals.get(f'n{i}', 0),
+                'sum': totals.get(f'sum{i}', 0.0),
+                'sumsq': totals.get(f'sumsq{i}', 0.0),
+                'min': totals.get(f'min{i}'),
+                'max': totals.get(f'max{i}')
+            }
+            for i, field in enumerate(fields)
+        }
+
+    def get_feature_comoments(self, fields, center, start_date=None, end_date=None):
+        """Row count, sums and pairwise product sums of (field - center) over rows where every field is set"""
+        deltas = [{'$subtract': [f'${field}', float(center[field])]} for field in fields]
+        group = {'_id': None, 'n': {'$sum': 1}}
+
+        for i, delta in enumerate(deltas):
+            group[f's{i}'] = {'$sum': delta}
+            for j in range(i, len(deltas)):
+                group[f'p{i}_{j}'] = {'$sum': {'$multiply': [delta, deltas[j]]}}
+
+        documents = self._aggregate_stats([
+            {'$match': self._stats_match(start_date, end_date, fields)},
+            {'$group': group}
+        ])
+        totals = documents[0] if documents else {'n': 0}
+
+        return {
+            'count': totals['n'],
+            'sums': [totals.get(f's{i}', 0.0) for i in range(len(fields))],
+            'products': {
+                (i, j): totals.get(f'p{i}_{j}', 0.0)
+                for i in range(len(fields)) for j in range(i, len(fields))
+            }
+        }
+
+    def get_feature_histogram(self, field, edges, start_date=None, end_date=None):
+        """Row counts of `field` per [edges[i], edges[i + 1]) bucket, from one $bucket"""
+        edges = [float(edge) for edge in edges]
+        documents = self._aggregate_stats([
+            {'$match': self._stats_match(start_date, end_date, [field])},
+            {'$bucket': {
+                'groupBy': f'${field}',
+                'boundaries': edges,
+                'default': 'outside',
+                'output': {'count': {'$sum': 1}}
+            }}
+        ])
+
+        counts = [0] * (len(edges) - 1)
+        index = {edge: i for i, edge in enumerate(edges[:-1])}
+        for document in documents:
+            if document['_id'] in index:
+                counts[index[document['_id']]] = document['count']
+
+        return counts
@@ -0,0 +1,75 @@
+import numpy as np
+import pandas as pd
+
+from config import DOWNSAMPLE_POINTS, DOWNSAMPLE_METHOD
+
+
+def lttb(x, y, threshold):
+    """Indices of the Largest-Triangle-Three-Buckets selection of (x, y).
+
+    Keeps the first and last point and, from each of threshold - 2 equal
+    buckets in between, the point forming the largest triangle with the
+    previously kept point and the mean of the next bucket. Peaks and dips
+    survive, flat stretches collapse.
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    every = (n - 2) / (threshold - 2)
+
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0] = a = 0
+
+    for i in range(threshold - 2):
+        start = int(i * every) + 1
+        end = int((i + 1) * every) + 1
+        next_end = min(int((i + 2) * every) + 1, n)
+
+        avg_x = x[end:next_end].mean()
+        avg_y = y[end:next_end].mean()
+
+        area = np.abs((x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a]))
+        a = start + int(np.argmax(area))
+        selected[i + 1] = a
+
+    selected[-1] = n - 1
+    return selected
+
+
+def minmax(y, width):
+    """Indices of the minimum and maximum of each of `width` equal buckets (plus both ends).
+
+    What a line plot `width` pixels wide can show anyway: every pixel column
+    keeps its vertical extent, at most two points per column.
+    """
+    n = len(y)
+    if 2 * width >= n or width < 1:
+        return np.arange(n)
+
+    bucket = np.arange(n) * width // n
+    order = np.lexsort((np.asarray(y), bucket))
+    starts = np.searchsorted(bucket[order], np.arange(width))
+    ends = np.append(starts[1:], n) - 1
+
+    return np.unique(np.concatenate([[0, n - 1], order[starts], order[ends]]))
+
+
+def downsample(timestamps, values, points=DOWNSAMPLE_POINTS, method=DOWNSAMPLE_METHOD):
+    """At most ~`points` (timestamp, value) pairs that keep the visual shape of a series"""
+    timestamps = pd.to_datetime(pd.Series(timestamps)).to_numpy(dtype='datetime64[ns]')
+    values = pd.to_numeric(pd.Series(values), errors='coerce').to_numpy(dtype=np.float64)
+
+    present = ~np.isnan(values)
+    timestamps, values = timestamps[present], values[present]
+
+    if method == 'minmax':
+        keep = minmax(values, max(points // 2, 1))
+    elif method == 'lttb':
+        keep = lttb(timestamps.astype(np.int64), values, points)
+    else:
+        raise ValueError(f"Unknown downsampling method: {method}")
+
+    return timestamps[keep], values[keep]
@@ -0,0 +1,186 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from database import DatabaseManager
+from model_registry import ModelRegistry
+from metrics import REGISTRY
+from config import (
+    CHAMPION_ALIAS, DRIFT_COLLECTION, DRIFT_FIELDS, DRIFT_BINS, DRIFT_HALF_LIFE_HOURS,
+    DRIFT_MIN_ROWS, DRIFT_PSI_THRESHOLD, DRIFT_RETRAIN_COOLDOWN_HOURS,
+)
+
+DRIFT_PSI = REGISTRY.gauge('aqi_feature_drift_psi', 'PSI of live features against the champion training data', ['feature'])
+
+# Floor for empty bins so PSI stays finite
+_EPSILON = 1e-4
+
+
+def reference_sketch(df, fields=DRIFT_FIELDS, bins=DRIFT_BINS):
+    """Quantile-binned histogram of each field, saved with a model at training time"""
+    reference = {}
+
+    for field in fields:
+        if field not in df.columns:
+            continue
+
+        values = pd.to_numeric(df[field], errors='coerce').dropna().to_numpy(dtype=np.float64)
+        if len(values) < bins:
+            continue
+
+        # Inner quantile edges; the outer bins are open-ended so any live value has a bin
+        edges = np.unique(np.quantile(values, np.linspace(0, 1, bins + 1)[1:-1]))
+        counts = np.bincount(np.searchsorted(edges, values, side='right'), minlength=len(edges) + 1)
+
+        reference[field] = {
+            'edges': edges.tolist(),
+            'proportions': (counts / len(values)).tolist(),
+            'rows': len(values)
+        }
+
+    return reference
+
+
+def psi(expected, actual):
+    """Population stability index between two binned distributions"""
+    expected = np.clip(np.asarray(expected, dtype=np.float64), _EPSILON, None)
+    actual = np.clip(np.asarray(actual, dtype=np.float64), _EPSILON, None)
+    return float(np.sum((actual - expected) * np.log(actual / expected)))
+
+
+def ks(expected, actual):
+    """Kolmogorov-Smirnov distance evaluated at the bin edges"""
+    return float(np.max(np.abs(np.cumsum(expected) - np.cumsum(actual))))
+
+
+class StreamingHistogram:
+    """Fixed-bin histogram with exponentially decayed counts.
+
+    Memory is one float per bin whatever the stream length, and an update
+    costs one binary search over the edges plus one decay of the counts.
+    """
+
+    def __init__(self, edges, counts=None, half_life=DRIFT_HALF_LIFE_HOURS):
+        self.edges = np.asarray(edges, dtype=np.float64)
+        self.counts = np.zeros(len(self.edges) + 1) if counts is None else np.asarray(counts, dtype=np.float64)
+        self.decay = 0.5 ** (1.0 / half_life)
+
+    def update(self, value):
+        self.counts *= self.decay
+        if not np.isnan(value):
+            self.counts[np.searchsorted(self.edges, value, side='right')] += 1
+
+    @property
+    def total(self):
+        return float(self.counts.sum())
+
+    def proportions(self):
+        total = self.total
+        return self.counts / total if total else self.counts
+
+
+class DriftMonitor:
+    """Live feature distributions compared with the champion's training data.
+
+    The hourly pipeline folds each new reading into one StreamingHistogram
+    per field. The reference is the drift_reference the champion's full
+    training run saved; when a new full run becomes champion, the sketches
+    are rebuilt on its bins from the last few half-lives of stored rows. Sketches and scores persist
+    in one document, so the API reads the latest scores without recomputing.
+    """
+
+    def __init__(self, db=None):
+        self.db = db or DatabaseManager()
+        self.state = self.db.db[DRIFT_COLLECTION]
+        self.sketches = None
+        self.reference_key = None
+
+    def _champion(self):
+        name, version = ModelRegistry(self.db).resolve(CHAMPION_ALIAS)
+        if name is None:
+            return None
+
+        return self.db.models_collection.find_one(
+            {'name': name, 'version': version},
+            {'_id': 0, 'name': 1, 'version': 1, 'metadata.drift_reference': 1, 'metadata.lineage': 1}
+        )
+
+    def _restore(self, key, reference):
+        """Sketches for this reference: persisted ones if they match, else rebuilt from recent rows"""
+        stored = self.state.find_one({'_id': 'live'}) or {}
+
+        if stored.get('reference') == key:
+            self.sketches = {
+                field: StreamingHistogram(sketch['edges'], sketch['counts'])
+                for field, sketch in stored['sketches'].items()
+            }
+            return False
+
+        self.sketches = {field: StreamingHistogram(ref['edges']) for field, ref in reference.items()}
+        recent = self.db.get_latest_features(hours=int(3 * DRIFT_HALF_LIFE_HOURS))
+        for row in recent.to_dict('records'):
+            self._fold(row)
+        return True
+
+    def _fold(self, row):
+        for field, sketch in self.sketches.items():
+            try:
+                value = float(row.get(field))
+            except (TypeError, ValueError):
+                value = np.nan
+            sketch.update(value)
+
+    def update(self, row):
+        """Add one observation and store fresh scores (None while no champion has a reference)"""
+        champion = self._champion()
+        reference = ((champion or {}).get('metadata') or {}).get('drift_reference')
+        if not reference:
+            return None
+
+        # Incremental children inherit their base model's reference, so the sketches carry on
+        lineage = champion['metadata'].get('lineage', {})
+        key = {'name': champion['name'], 'base_version': lineage.get('base_version', champion['version'])}
+        if key != self.reference_key:
+            rebuilt = self._restore(key, reference)
+            self.reference_key = key
+            if not rebuilt:
+                self._fold(row)
+        else:
+            self._fold(row)
+
+        return self._score(key, reference, lineage.get('base_training_date'))
+
+    def _score(self, key, reference, trained_at):
+        features = {}
+        for field, sketch in self.sketches.items():
+            expected = reference[field]['proportions']
+            actual = sketch.proportions()
+            features[field] = {'psi': psi(expected, actual), 'ks': ks(expected, actual)}
+            DRIFT_PSI.set(features[field]['psi'], feature=field)
+
+        rows = min((sketch.total for sketch in self.sketches.values()), default=0.0)
+        max_psi = max((f['psi'] for f in features.values()), default=0.0)
+        drifted = rows >= DRIFT_MIN_ROWS and max_psi > DRIFT_PSI_THRESHOLD
+        cooled_down = trained_at is None or datetime.now() - trained_at > timedelta(hours=DRIFT_RETRAIN_COOLDOWN_HOURS)
+
+        status = {
+            'reference': key,
+            'updated_at': datetime.now(),
+            'rows': rows,
+            'features': features,
+            'max_psi': max_psi,
+            'drifted_features': sorted(f for f, s in features.items() if s['psi'] > DRIFT_PSI_THRESHOLD),
+            'drifted': drifted,
+            'retrain': drifted and cooled_down,
+            'sketches': {
+                field: {'edges': sketch.edges.tolist(), 'counts': sketch.counts.tolist()}
+                for field, sketch in self.sketches.items()
+            }
+        }
+        self.state.replace_one({'_id': 'live'}, status, upsert=True)
+        return status
+
+    def status(self):
+        """Latest stored scores, without the sketches (None before the first update)"""
+        return self.state.find_one({'_id': 'live'}, {'_id': 0, 'sketches': 0})
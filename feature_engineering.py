@@ -1,22 +1,106 @@
+import hashlib
+import json
+from concurrent.futures import ProcessPoolExecutor
 import pandas as pd
 import numpy as np
-from sklearn.preprocessing import StandardScaler
+from metrics import timed
+from config import FEATURE_ENGINE, FEATURE_WORKERS, FEATURE_PARALLEL_MIN_ROWS
+
+# Bump whenever create_features changes so cached training matrices are rebuilt
+FEATURE_PIPELINE_VERSION = 2
+
+
+def rolling_mean_std(values, window):
+    """Trailing mean and sample std, each window reduced on its own.
+
+    pandas' rolling() carries running sums along the series, so its last
+    bits depend on where the series starts; summing every window in a fixed
+    order gives the same value for a row whichever partition computed it.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    mean = np.full(len(values), np.nan)
+    std = np.full(len(values), np.nan)
+
+    if len(values) < window:
+        return mean, std
+
+    windows = np.lib.stride_tricks.sliding_window_view(values, window)
+    total = windows[:, 0].copy()
+    for k in range(1, window):
+        total += windows[:, k]
+    window_mean = total / window
+
+    squares = (windows[:, 0] - window_mean) ** 2
+    for k in range(1, window):
+        squares += (windows[:, k] - window_mean) ** 2
+
+    mean[window - 1:] = window_mean
+    std[window - 1:] = np.sqrt(squares / (window - 1))
+    return mean, std
+
+
+def _partition_features(chunk, halo):
+    """Process pool task: row features of one partition, minus its leading halo"""
+    return FeatureEngineer().row_features(chunk).iloc[halo:]
+
 
 class FeatureEngineer:
+    POLLUTANT_COLS = ['pm25', 'pm10', 'o3', 'no2', 'so2', 'co', 'aqi']
+    # Longest look-back of any row feature (lag_24, 24-hour rolling window)
+    HALO_ROWS = 24
+
     def __init__(self):
-        self.scaler = StandardScaler()
+        self._scaler = None
+
+    @property
+    def scaler(self):
+        # sklearn is only needed for training, keep it off the serving import path
+        if self._scaler is None:
+            from sklearn.preprocessing import StandardScaler
+            self._scaler = StandardScaler()
+        return self._scaler
 
     # --------------------------------------------------
     # CREATE FEATURES
     # --------------------------------------------------
-    def create_features(self, df):
-        """Create features from raw data"""
+    @timed('feature_build')
+    def create_features(self, df, workers=None, engine=None, min_rows=None):
+        """Create features from raw data (partitioned over `workers` from `min_rows` rows)"""
         df = df.copy()
 
         # Ensure timestamp is datetime
         if not np.issubdtype(df['timestamp'].dtype, np.datetime64):
             df['timestamp'] = pd.to_datetime(df['timestamp'])
 
+        engine = engine or FEATURE_ENGINE
+
+        if engine == 'polars':
+            # Polars is optional; it plans the whole pipeline as one multi-threaded query
+            from polars_features import create_features_polars
+            return create_features_polars(df, self.POLLUTANT_COLS)
+        if engine != 'pandas':
+            raise ValueError(f"Unknown feature engine {engine!r}, expected 'pandas' or 'polars'")
+
+        workers = FEATURE_WORKERS if workers is None else workers
+        min_rows = FEATURE_PARALLEL_MIN_ROWS if min_rows is None else min_rows
+
+        if workers > 1 and len(df) >= min_rows:
+            df = self.row_features_partitioned(df, workers)
+        else:
+            df = self.row_features(df)
+
+        # One-hot encode weather strings (optional, numeric only will work too)
+        for col in ['weather_main', 'weather_description']:
+            if col in df.columns:
+                df = pd.get_dummies(df, columns=[col], prefix=col)
+
+        # Fill NaN values
+        df = df.ffill().bfill()
+
+        return df
+
+    def row_features(self, df):
+        """Features that only look at a row and the HALO_ROWS rows before it"""
         # Time-based features
         df['hour'] = df['timestamp'].dt.hour
         df['day'] = df['timestamp'].dt.day
@@ -31,13 +115,13 @@ class FeatureEngineer:
         df['month_cos'] = np.cos(2 * np.pi * df['month'] / 12)
 
         # Rolling statistics for pollutants
-        pollutant_cols = ['pm25', 'pm10', 'o3', 'no2', 'so2', 'co', 'aqi']
-        for col in pollutant_cols:
+        for col in self.POLLUTANT_COLS:
             if col in df.columns:
+                mean, std = rolling_mean_std(df[col], 24)
                 df[f'{col}_lag_1'] = df[col].shift(1)
                 df[f'{col}_lag_24'] = df[col].shift(24)
-                df[f'{col}_rolling_mean_24'] = df[col].rolling(window=24).mean()
-                df[f'{col}_rolling_std_24'] = df[col].rolling(window=24).std()
+                df[f'{col}_rolling_mean_24'] = mean
+                df[f'{col}_rolling_std_24'] = std
                 df[f'{col}_change_rate'] = df[col].diff()
 
         # Weather interaction features
@@ -49,39 +133,95 @@ class FeatureEngineer:
                                    bins=[0, 50, 100, 150, 200, 300, np.inf],
                                    labels=['Good', 'Moderate', 'Unhealthy for Sensitive', 'Unhealthy', 'Very Unhealthy', 'Hazardous'])
 
-        # One-hot encode weather strings (optional, numeric only will work too)
-        for col in ['weather_main', 'weather_description']:
-            if col in df.columns:
-                df = pd.get_dummies(df, columns=[col], prefix=col)
+        return df
 
-        # Fill NaN values
-        df = df.ffill().bfill()
+    def row_features_partitioned(self, df, workers):
+        """row_features() over `workers` contiguous partitions on a process pool.
 
-        return df
+        Each partition is shipped with the HALO_ROWS rows before it, so lags
+        and rolling windows at its first rows see the same history as in a
+        single pass; the halo is dropped again before the partitions are
+        stitched back in order. One-hot encoding and NaN filling span the
+        whole frame and stay in create_features().
+        """
+        bounds = np.linspace(0, len(df), workers + 1).astype(int)
+        chunks, halos = [], []
+
+        for start, end in zip(bounds[:-1], bounds[1:]):
+            halo_start = max(0, start - self.HALO_ROWS)
+            chunks.append(df.iloc[halo_start:end])
+            halos.append(start - halo_start)
+
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            parts = list(pool.map(_partition_features, chunks, halos))
+
+        return pd.concat(parts)
 
     # --------------------------------------------------
     # PREPARE TRAINING DATA
     # --------------------------------------------------
+    @timed('training_windows')
     def prepare_training_data(self, df, target_col='aqi', lookback=24):
         """Prepare data for model training with lookback window"""
-        features = []
-        targets = []
-
         # Use numeric columns only
         feature_cols = [col for col in df.select_dtypes(include=[np.number]).columns if col != target_col]
 
         if len(df) < lookback + 1:
             raise ValueError("Not enough data to create training sequences.")
 
-        for i in range(lookback, len(df)):
-            features.append(df[feature_cols].iloc[i-lookback:i].values.flatten())
-            targets.append(df[target_col].iloc[i])
+        # Row i holds the flattened rows i-lookback .. i-1 (a strided view, no Python loop)
+        values = df[feature_cols].to_numpy(dtype=np.float32)
+        windows = np.lib.stride_tricks.sliding_window_view(values, lookback, axis=0)[:-1]
 
-        X = np.array(features, dtype=np.float32)
-        y = np.array(targets, dtype=np.float32)
+        X = np.ascontiguousarray(windows.transpose(0, 2, 1)).reshape(len(windows), -1)
+        y = df[target_col].to_numpy(dtype=np.float32)[lookback:]
 
         return X, y, feature_cols
 
+    def build_windows(self, df, feature_cols=None, target_col='aqi', lookback=24, after=None):
+        """Training windows plus the timestamp of each target.
+
+        feature_cols pins the column layout to an earlier run (missing one-hot
+        levels become 0); after keeps only windows whose target is newer.
+        """
+        timestamps = df['timestamp'].to_numpy()[lookback:]
+
+        if feature_cols is not None:
+            df = df.reindex(columns=feature_cols + [target_col], fill_value=0)
+
+        X, y, feature_cols = self.prepare_training_data(df, target_col, lookback)
+
+        if after is not None:
+            keep = timestamps > np.datetime64(pd.Timestamp(after))
+            X, y, timestamps = X[keep], y[keep], timestamps[keep]
+
+        return X, y, feature_cols, timestamps
+
+    def inference_window(self, df, feature_cols=None, target_col='aqi', lookback=24):
+        """Model input for the hour after df's last row, in the training layout.
+
+        The last `lookback` rows of feature_cols, flattened row by row like
+        a prepare_training_data() window (columns missing from df are 0).
+        """
+        if feature_cols is None:
+            feature_cols = [col for col in df.select_dtypes(include=[np.number]).columns if col != target_col]
+
+        if len(df) < lookback:
+            raise ValueError(f"Need {lookback} rows of recent features, got {len(df)}")
+
+        values = df.reindex(columns=feature_cols, fill_value=0).to_numpy(dtype=np.float32)[-lookback:]
+        return values.reshape(-1)
+
+    def config_fingerprint(self, target_col='aqi', lookback=24):
+        """Hash of everything that shapes the training matrix"""
+        config = {
+            'version': FEATURE_PIPELINE_VERSION,
+            'pollutants': self.POLLUTANT_COLS,
+            'target': target_col,
+            'lookback': lookback
+        }
+        return hashlib.sha1(json.dumps(config, sort_keys=True).encode()).hexdigest()[:12]
+
     # --------------------------------------------------
     # SCALE FEATURES
     # --------------------------------------------------
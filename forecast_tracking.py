@@ -0,0 +1,229 @@
+import math
+from datetime import datetime, timedelta
+
+import pandas as pd
+from pymongo import UpdateOne
+
+from database import DatabaseManager
+from metrics import REGISTRY, timed
+from config import (
+    CHAMPION_ALIAS, FORECASTS_COLLECTION, FORECAST_METRICS_COLLECTION, FORECAST_METRICS_DAYS,
+    FORECAST_EXPIRE_HOURS, FORECAST_PROMOTION_MIN_SAMPLES, FORECAST_PROMOTION_MARGIN,
+)
+
+FORECASTS_RESOLVED = REGISTRY.counter('aqi_forecasts_resolved_total', 'Logged forecasts joined with the realized AQI', ['outcome'])
+LIVE_RMSE = REGISTRY.gauge('aqi_forecast_live_rmse', 'Rolling RMSE of served forecasts', ['model', 'horizon'])
+
+_indexed_clients = set()
+
+
+def _hour(timestamp):
+    return pd.Timestamp(timestamp).floor('h').to_pydatetime()
+
+
+class ForecastTracker:
+    """Live accuracy of served forecasts.
+
+    Every forecast is logged once per (model, version, horizon, target
+    hour). When its target hour has been ingested it is joined with the
+    realized AQI and its error is added to a daily accumulator document
+    (count, sum of squared/absolute/signed errors) per model version and
+    horizon, so rolling RMSE/MAE is a sum over a handful of documents
+    rather than a pass over the forecast history.
+    """
+
+    def __init__(self, db=None):
+        self.db = db or DatabaseManager()
+        self.forecasts = self.db.db[FORECASTS_COLLECTION]
+        self.metrics = self.db.db[FORECAST_METRICS_COLLECTION]
+        self._logged = set()
+        self._ensure_indexes()
+
+    def _ensure_indexes(self):
+        if id(self.db.client) in _indexed_clients:
+            return
+
+        try:
+            self.forecasts.create_index(
+                [('name', 1), ('version', 1), ('horizon_days', 1), ('target_hour', 1)], unique=True)
+            self.forecasts.create_index([('status', 1), ('target_hour', 1)])
+            self.metrics.create_index([('day', -1), ('name', 1)])
+            _indexed_clients.add(id(self.db.client))
+        except Exception as e:
+            print(f"Could not create forecast tracking indexes: {e}")
+
+    # --------------------------------------------------
+    # LOG
+    # --------------------------------------------------
+    def log(self, name, version, predictions, role='champion', served_at=None):
+        """Record a forecast set; repeats for the same target hours are no-ops"""
+        served_at = served_at or datetime.now()
+        operations = []
+
+        for horizon, prediction in enumerate(predictions, start=1):
+            target_hour = _hour(served_at + timedelta(days=horizon))
+            key = (name, version, horizon, target_hour)
+
+            # Serving calls this on every request; only the first per target hour reaches MongoDB
+            if key in self._logged:
+                continue
+            self._logged.add(key)
+
+            operations.append(UpdateOne(
+                {'name': name, 'version': version, 'horizon_days': horizon, 'target_hour': target_hour},
+                {'$setOnInsert': {
+                    'predicted_aqi': float(prediction['predicted_aqi']),
+                    'role': role,
+                    'served_at': served_at,
+                    'status': 'pending'
+                }},
+                upsert=True
+            ))
+
+        if len(self._logged) > 10000:
+            self._logged = {key for key in self._logged if key[3] > served_at}
+
+        if operations:
+            self.forecasts.bulk_write(operations, ordered=False)
+
+        return len(operations)
+
+    # --------------------------------------------------
+    # JOIN WITH THE REALIZED AQI
+    # --------------------------------------------------
+    @timed('forecast_resolve')
+    def resolve_pending(self, now=None):
+        """Score every pending forecast whose target hour has been ingested"""
+        now = now or datetime.now()
+        pending = list(self.forecasts.find(
+            {'status': 'pending', 'target_hour': {'$lte': now}},
+            {'name': 1, 'version': 1, 'horizon_days': 1, 'target_hour': 1, 'predicted_aqi': 1}
+        ))
+
+        if not pending:
+            return {'resolved': 0, 'expired': 0}
+
+        start = min(forecast['target_hour'] for forecast in pending)
+        end = max(forecast['target_hour'] for forecast in pending) + timedelta(hours=1)
+        observed = self.db.get_features(start, end, fields=['aqi'])
+
+        actuals = {}
+        if not observed.empty:
+            observed = observed.dropna(subset=['aqi'])
+            # First reading of each hour is the realized value
+            for hour, aqi in observed.groupby(observed['timestamp'].dt.floor('h'))['aqi'].first().items():
+                actuals[hour.to_pydatetime()] = float(aqi)
+
+        resolved = expired = 0
+
+        for forecast in pending:
+            actual = actuals.get(forecast['target_hour'])
+
+            if actual is None:
+                if now - forecast['target_hour'] > timedelta(hours=FORECAST_EXPIRE_HOURS):
+                    self.forecasts.update_one({'_id': forecast['_id'], 'status': 'pending'},
+                                              {'$set': {'status': 'expired'}})
+                    expired += 1
+                continue
+
+            error = forecast['predicted_aqi'] - actual
+
+            # Conditional on still pending so a concurrent resolver never counts an error twice
+            claimed = self.forecasts.update_one(
+                {'_id': forecast['_id'], 'status': 'pending'},
+                {'$set': {'status': 'resolved', 'actual_aqi': actual, 'error': error, 'resolved_at': now}}
+            ).modified_count
+
+            if not claimed:
+                continue
+
+            day = datetime.combine(forecast['target_hour'].date(), datetime.min.time())
+            self.metrics.update_one(
+                {'name': forecast['name'], 'version': forecast['version'],
+                 'horizon_days': forecast['horizon_days'], 'day': day},
+                {'$inc': {'n': 1, 'sse': error * error, 'sae': abs(error), 'se': error}},
+                upsert=True
+            )
+            resolved += 1
+
+        FORECASTS_RESOLVED.inc(resolved, outcome='resolved')
+        FORECASTS_RESOLVED.inc(expired, outcome='expired')
+        return {'resolved': resolved, 'expired': expired}
+
+    # --------------------------------------------------
+    # ROLLING METRICS
+    # --------------------------------------------------
+    def live_metrics(self, days=FORECAST_METRICS_DAYS, by_version=False):
+        """Rolling RMSE/MAE/bias per model and horizon (per version too with by_version)"""
+        cutoff = datetime.combine((datetime.now() - timedelta(days=days)).date(), datetime.min.time())
+        totals = {}
+
+        for bucket in self.metrics.find({'day': {'$gte': cutoff}}, {'_id': 0}):
+            key = (bucket['name'], bucket['version'] if by_version else None, bucket['horizon_days'])
+            total = totals.setdefault(key, {'n': 0, 'sse': 0.0, 'sae': 0.0, 'se': 0.0})
+            for field in total:
+                total[field] += bucket[field]
+
+        rows = []
+        for (name, version, horizon), total in sorted(totals.items(), key=lambda item: str(item[0])):
+            row = {
+                'name': name,
+                'horizon_days': horizon,
+                'samples': total['n'],
+                'rmse': math.sqrt(total['sse'] / total['n']),
+                'mae': total['sae'] / total['n'],
+                'bias': total['se'] / total['n']
+            }
+            if by_version:
+                row['version'] = version
+            else:
+                LIVE_RMSE.set(row['rmse'], model=name, horizon=str(horizon))
+            rows.append(row)
+
+        return rows
+
+    def model_scores(self, days=FORECAST_METRICS_DAYS):
+        """Live RMSE per model version over all horizons, with the number of scored forecasts.
+
+        Keyed "name vN": records of older versions never vouch for a newer
+        one, so only the version that earned a score can be promoted on it.
+        """
+        scores = {}
+        for row in self.live_metrics(days, by_version=True):
+            key = f"{row['name']} v{row['version']}"
+            score = scores.setdefault(key, {'name': row['name'], 'version': row['version'], 'samples': 0, 'sse': 0.0})
+            score['samples'] += row['samples']
+            score['sse'] += row['rmse'] ** 2 * row['samples']
+
+        return {
+            key: {'name': score['name'], 'version': score['version'], 'samples': score['samples'],
+                  'rmse': math.sqrt(score['sse'] / score['samples'])}
+            for key, score in scores.items()
+        }
+
+    def promote_best(self, registry, days=FORECAST_METRICS_DAYS, min_samples=FORECAST_PROMOTION_MIN_SAMPLES,
+                     margin=FORECAST_PROMOTION_MARGIN):
+        """Move the champion alias to the model version with the lowest live RMSE, if it clearly wins"""
+        scores = {key: s for key, s in self.model_scores(days).items() if s['samples'] >= min_samples}
+        champion_name, champion_version = registry.resolve(CHAMPION_ALIAS)
+        champion = f"{champion_name} v{champion_version}" if champion_name else None
+
+        if not scores:
+            return {'promoted': False, 'reason': f"no model has {min_samples} scored forecasts yet", 'scores': scores}
+
+        best = min(scores, key=lambda key: scores[key]['rmse'])
+        result = {'promoted': False, 'champion': champion, 'best': best, 'scores': scores}
+
+        if best == champion:
+            result['reason'] = "champion has the best live RMSE"
+            return result
+
+        if champion in scores and scores[best]['rmse'] > scores[champion]['rmse'] * (1 - margin):
+            result['reason'] = f"{best} does not beat {champion} by {margin:.0%}"
+            return result
+
+        name, version = scores[best]['name'], scores[best]['version']
+        registry.promote(name, version)
+        result.update(promoted=True, champion=best, version=version,
+                      reason=f"live RMSE {scores[best]['rmse']:.2f} over {scores[best]['samples']} forecasts")
+        return result
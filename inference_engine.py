@@ -0,0 +1,542 @@
+import json
+
+import numpy as np
+
+from metrics import timed
+from config import INFERENCE_ENGINE
+
+# How a node routes missing values
+MISSING_NAN = 0      # NaN follows default_left
+MISSING_ZERO = 1     # NaN and 0.0 follow default_left (LightGBM "Zero")
+NAN_AS_ZERO = 2      # NaN is treated as 0.0 (LightGBM "None")
+
+# LightGBM reads |x| <= 1e-35f (a float32 constant) as exactly zero
+LIGHTGBM_ZERO_THRESHOLD = float(np.float32(1e-35))
+
+
+class CompiledEnsemble:
+    """Tree ensemble flattened into NumPy node arrays.
+
+    Every tree lives in the same arrays; leaves point back at themselves so
+    all trees can be walked together for ``depth`` steps with a handful of
+    vectorized gathers, independent of framework dispatch overhead.
+    """
+
+    def __init__(self, feature, threshold, children, default_left, missing, value,
+                 roots, depth, base_score=0.0, average=False, cast_float32=True,
+                 zero_threshold=None, source=None):
+        self.feature = np.asarray(feature, dtype=np.intp)
+        self.threshold = np.asarray(threshold, dtype=np.float64)
+        # children[2 * node] is the left child, children[2 * node + 1] the right
+        self.children = np.asarray(children, dtype=np.intp)
+        self.default_left = np.asarray(default_left, dtype=bool)
+        self.missing = np.asarray(missing, dtype=np.int8)
+        self.value = np.asarray(value, dtype=np.float64)
+        self.roots = np.asarray(roots, dtype=np.intp)
+        self.depth = int(depth)
+        self.base_score = float(base_score)
+        self.average = average
+        self.cast_float32 = cast_float32
+        self.zero_threshold = zero_threshold
+        self.source = source
+        self.has_zero_missing = bool((self.missing == MISSING_ZERO).any())
+
+    @property
+    def n_trees(self):
+        return len(self.roots)
+
+    def _step(self, node, x):
+        return self.children[2 * node + (x > self.threshold[node])]
+
+    def _step_missing(self, node, x):
+        missing_type = self.missing[node]
+        nan = np.isnan(x)
+        x = np.where(nan & (missing_type == NAN_AS_ZERO), 0.0, x)
+        is_missing = (nan & (missing_type != NAN_AS_ZERO)) | ((x == 0) & (missing_type == MISSING_ZERO))
+        go_right = np.where(is_missing, ~self.default_left[node], x > self.threshold[node])
+        return self.children[2 * node + go_right]
+
+    def predict(self, X):
+        X = np.asarray(X, dtype=np.float32 if self.cast_float32 else np.float64)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        if self.zero_threshold is not None:
+            X = np.where(np.abs(X) <= self.zero_threshold, 0.0, X)
+
+        step = self._step
+        if self.has_zero_missing or np.isnan(X).any():
+            step = self._step_missing
+
+        if len(X) == 1:
+            row = X[0]
+            node = self.roots
+            for _ in range(self.depth):
+                node = step(node, row[self.feature[node]])
+            leaves = self.value[node]
+            total = leaves.mean() if self.average else leaves.sum()
+            return np.array([total + self.base_score])
+
+        rows = np.arange(len(X))[:, None]
+        node = np.broadcast_to(self.roots, (len(X), self.n_trees))
+        for _ in range(self.depth):
+            node = step(node, X[rows, self.feature[node]])
+        leaves = self.value[node]
+        total = leaves.mean(axis=1) if self.average else leaves.sum(axis=1)
+        return total + self.base_score
+
+
+class CompiledLinear:
+    """Linear model reduced to a dot product"""
+
+    def __init__(self, coef, intercept, source=None):
+        self.coef = np.asarray(coef, dtype=np.float64).ravel()
+        self.intercept = float(np.ravel(intercept)[0]) if np.ndim(intercept) else float(intercept)
+        self.source = source
+
+    def predict(self, X):
+        X = np.asarray(X, dtype=np.float64)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        return X @ self.coef + self.intercept
+
+
+class ScaledModel:
+    """Model behind the training StandardScaler, for engines it cannot be folded into"""
+
+    def __init__(self, model, mean, scale, source=None):
+        self.model = model
+        self.mean = np.asarray(mean, dtype=np.float64)
+        self.scale = np.asarray(scale, dtype=np.float64)
+        self.source = source or f"{getattr(model, 'source', None) or type(model).__name__} (scaled)"
+
+    def predict(self, X):
+        X = np.asarray(X, dtype=np.float64)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        return np.asarray(self.model.predict(standardize(X, self.mean, self.scale)), dtype=np.float64).ravel()
+
+
+class OnnxModel:
+    """Model exported to ONNX and run through onnxruntime (optional dependency)"""
+
+    def __init__(self, onnx_bytes, source=None):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = 1
+        self.session = ort.InferenceSession(onnx_bytes, options, providers=['CPUExecutionProvider'])
+        self.input_name = self.session.get_inputs()[0].name
+        self.source = source
+
+    def predict(self, X):
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        return self.session.run(None, {self.input_name: X})[0].ravel().astype(np.float64)
+
+
+def export_onnx(model, n_features):
+    """Convert a trained model to an ONNX runtime session"""
+    from skl2onnx.common.data_types import FloatTensorType
+
+    initial_types = [('input', FloatTensorType([None, n_features]))]
+    name = type(model).__name__
+
+    if name == 'XGBRegressor':
+        from onnxmltools import convert_xgboost
+        onnx_model = convert_xgboost(model, initial_types=initial_types)
+    elif name == 'LGBMRegressor':
+        from onnxmltools import convert_lightgbm
+        onnx_model = convert_lightgbm(model, initial_types=initial_types)
+    else:
+        from skl2onnx import convert_sklearn
+        onnx_model = convert_sklearn(model, initial_types=initial_types)
+
+    return OnnxModel(onnx_model.SerializeToString(), source=f'{name} (onnx)')
+
+
+def standardize(X, mean, scale):
+    """The training transform, bit for bit: StandardScaler.transform on float32 rows.
+
+    sklearn casts mean and scale to the input dtype and subtracts and
+    divides in float32, so this must too; float64 arithmetic rounded once
+    differs in the last bits for almost every value.
+    """
+    X = np.asarray(X, dtype=np.float32)
+    return (X - np.asarray(mean).astype(np.float32)) / np.asarray(scale).astype(np.float32)
+
+
+# --------------------------------------------------
+# FLATTENING
+# --------------------------------------------------
+class _TreeBuilder:
+    def __init__(self):
+        self.feature, self.threshold, self.children = [], [], []
+        self.default_left, self.missing, self.value = [], [], []
+        self.roots = []
+        self.depth = 0
+
+    def add_node(self, feature=0, threshold=0.0, default_left=False, missing=MISSING_NAN, value=0.0):
+        index = len(self.feature)
+        self.feature.append(feature)
+        self.threshold.append(threshold)
+        self.children.extend([index, index])  # leaves point at themselves
+        self.default_left.append(default_left)
+        self.missing.append(missing)
+        self.value.append(value)
+        return index
+
+    def set_children(self, node, left, right):
+        self.children[2 * node] = left
+        self.children[2 * node + 1] = right
+
+    def build(self, **kwargs):
+        return CompiledEnsemble(
+            self.feature, self.threshold, self.children, self.default_left,
+            self.missing, self.value, self.roots, self.depth, **kwargs
+        )
+
+
+def _add_array_tree(builder, left, right, leaf, make_node):
+    """Copy one array-encoded tree (sklearn / xgboost layout) into the builder"""
+    offset = len(builder.feature)
+    depths = {0: 0}
+    for i in range(len(left)):
+        make_node(i, leaf(i))
+    for i in range(len(left)):
+        if not leaf(i):
+            builder.set_children(offset + i, offset + left[i], offset + right[i])
+            depths[left[i]] = depths[right[i]] = depths[i] + 1
+    builder.roots.append(offset)
+    builder.depth = max(builder.depth, max(depths.values()))
+
+
+def _compile_sklearn_forest(model):
+    builder = _TreeBuilder()
+    estimators = getattr(model, 'estimators_', [model])
+
+    for estimator in estimators:
+        tree = estimator.tree_
+        missing_left = getattr(tree, 'missing_go_to_left', np.zeros(tree.node_count, dtype=bool))
+
+        def make_node(i, is_leaf):
+            if is_leaf:
+                builder.add_node(value=tree.value[i, 0, 0])
+            else:
+                builder.add_node(tree.feature[i], tree.threshold[i], bool(missing_left[i]))
+
+        _add_array_tree(builder, tree.children_left, tree.children_right,
+                        lambda i: tree.children_left[i] == -1, make_node)
+
+    return builder.build(average=hasattr(model, 'estimators_'), cast_float32=True,
+                         source=type(model).__name__)
+
+
+def _compile_xgboost(model):
+    booster = model.get_booster()
+    document = json.loads(booster.save_raw(raw_format='json'))
+    learner = document['learner']
+
+    if not learner['objective']['name'].startswith('reg:squarederror'):
+        return None
+
+    base_score = float(learner['learner_model_param']['base_score'].strip('[]'))
+    builder = _TreeBuilder()
+
+    for tree in learner['gradient_booster']['model']['trees']:
+        left, right = tree['left_children'], tree['right_children']
+        conditions = np.asarray(tree['split_conditions'], dtype=np.float32)
+
+        def make_node(i, is_leaf):
+            if is_leaf:
+                builder.add_node(value=float(conditions[i]))
+            else:
+                # xgboost goes left on x < split; for float32 inputs that is
+                # x <= the next float32 below split
+                threshold = float(np.nextafter(conditions[i], np.float32(-np.inf)))
+                builder.add_node(tree['split_indices'][i], threshold, bool(tree['default_left'][i]))
+
+        _add_array_tree(builder, left, right, lambda i: left[i] == -1, make_node)
+
+    return builder.build(base_score=base_score, cast_float32=True, source='XGBRegressor')
+
+
+def _compile_lightgbm(model):
+    booster = model.booster_
+    document = booster.dump_model()
+
+    if document.get('num_class', 1) != 1 or not document['objective'].startswith('regression'):
+        return None
+
+    missing_types = {'None': NAN_AS_ZERO, 'Zero': MISSING_ZERO, 'NaN': MISSING_NAN}
+    builder = _TreeBuilder()
+
+    for info in document['tree_info']:
+        root = None
+        stack = [(info['tree_structure'], None, None, 0)]
+
+        while stack:
+            node, parent, side, depth = stack.pop()
+            builder.depth = max(builder.depth, depth)
+
+            if 'leaf_value' in node:
+                index = builder.add_node(value=node['leaf_value'])
+            else:
+                if node['decision_type'] != '<=':
+                    return None  # categorical splits are not compiled
+                index = builder.add_node(
+                    node['split_feature'], node['threshold'], node['default_left'],
+                    missing_types[node['missing_type']]
+                )
+                stack.append((node['right_child'], index, 1, depth + 1))
+                stack.append((node['left_child'], index, 0, depth + 1))
+
+            if parent is None:
+                root = index
+            else:
+                builder.children[2 * parent + side] = index
+
+        builder.roots.append(root)
+
+    return builder.build(average=document.get('average_output', False), cast_float32=False,
+                         zero_threshold=LIGHTGBM_ZERO_THRESHOLD, source='LGBMRegressor')
+
+
+def compile_model(model):
+    """Compile a trained model into a NumPy engine, or None if unsupported"""
+    name = type(model).__name__
+
+    if name in ('RandomForestRegressor', 'ExtraTreesRegressor', 'DecisionTreeRegressor'):
+        return _compile_sklearn_forest(model)
+    if name == 'XGBRegressor':
+        return _compile_xgboost(model)
+    if name == 'LGBMRegressor':
+        return _compile_lightgbm(model)
+    if name in ('Ridge', 'LinearRegression', 'Lasso', 'ElasticNet'):
+        return CompiledLinear(model.coef_, model.intercept_, source=name)
+
+    return None
+
+
+# --------------------------------------------------
+# FUSED PREPROCESSING
+# --------------------------------------------------
+_INT64_MIN = np.iinfo(np.int64).min
+
+
+def _ordered(x):
+    """float64 → int64 with the same ordering, so bisection can walk every float between two bounds"""
+    bits = np.asarray(x, dtype=np.float64).view(np.int64)
+    return np.where(bits < 0, _INT64_MIN - bits, bits)
+
+
+def _unordered(keys):
+    return np.where(keys < 0, _INT64_MIN - keys, keys).view(np.float64)
+
+
+def _goes_right(x, threshold, mean, scale, zero_threshold):
+    """How a split routes raw values under the unfused pipeline (standardize, then compare)"""
+    z = standardize(x, mean, scale).astype(np.float64)
+    if zero_threshold is not None:
+        z = np.where(np.abs(z) <= zero_threshold, 0.0, z)
+    return z > threshold
+
+
+def _raw_thresholds(engine, mean, scale):
+    """Each split moved into raw units: the largest raw value the unfused pipeline sends left.
+
+    Standardizing and rounding to float32 are monotone, so every split is a
+    single cut in raw units too. It lies within float32 rounding of
+    threshold * scale + mean; bisecting over the float64s around that guess
+    finds it exactly, so the fused tree routes every row as the unfused one.
+    """
+    threshold = engine.threshold.copy()
+    splits = np.flatnonzero(engine.children[0::2] != np.arange(len(engine.feature)))
+
+    # LightGBM's ±1e300 NaN-only sentinels: no finite value crosses them either way
+    sentinel = splits[np.abs(threshold[splits]) >= 1e30]
+    threshold[sentinel] = np.sign(threshold[sentinel]) * np.inf
+    splits = splits[np.abs(threshold[splits]) < 1e30]
+
+    t = threshold[splits]
+    m, s = mean[engine.feature[splits]], scale[engine.feature[splits]]
+    args = (t, m, s, engine.zero_threshold)
+
+    guess = t * s + m
+    width = 1e-5 * (np.abs(guess) + np.abs(m) + s)
+    low, high = guess - width, guess + width
+
+    for _ in range(16):
+        low_ok, high_ok = ~_goes_right(low, *args), _goes_right(high, *args)
+        if low_ok.all() and high_ok.all():
+            break
+        width *= 1024
+        low, high = np.where(low_ok, low, guess - width), np.where(high_ok, high, guess + width)
+    else:
+        raise ValueError("Could not bracket the raw split thresholds")
+
+    low, high = _ordered(low), _ordered(high)
+    for _ in range(64):
+        # Overflow-free midpoint of two int64 keys
+        mid = (low >> 1) + (high >> 1) + (low & high & 1)
+        right = _goes_right(_unordered(mid), *args)
+        low, high = np.where(right, low, mid), np.where(right, mid, high)
+
+    threshold[splits] = _unordered(low)
+    return threshold
+
+
+def fuse_scaler(engine, mean, scale):
+    """Fold the training StandardScaler into a compiled engine so it takes raw rows.
+
+    Linear models absorb it into their coefficients and intercept, tree
+    ensembles into their split thresholds. Returns None for engines it
+    cannot be folded into.
+    """
+    mean = np.asarray(mean, dtype=np.float64)
+    scale = np.asarray(scale, dtype=np.float64)
+
+    if isinstance(engine, CompiledLinear):
+        coef = engine.coef / scale
+        return CompiledLinear(coef, engine.intercept - coef @ mean, source=f'{engine.source} (fused)')
+
+    # Zero-as-missing is an interval around the mean in raw units, not a cut
+    if not isinstance(engine, CompiledEnsemble) or engine.has_zero_missing:
+        return None
+
+    # A NaN read as 0.0 after scaling always takes the side 0.0 takes
+    missing = engine.missing.copy()
+    default_left = engine.default_left.copy()
+    as_zero = missing == NAN_AS_ZERO
+    default_left[as_zero] = ~(0.0 > engine.threshold[as_zero])
+    missing[as_zero] = MISSING_NAN
+
+    return CompiledEnsemble(
+        engine.feature, _raw_thresholds(engine, mean, scale), engine.children, default_left, missing,
+        engine.value, engine.roots, engine.depth, base_score=engine.base_score, average=engine.average,
+        cast_float32=True, source=f'{engine.source} (fused)'
+    )
+
+
+# --------------------------------------------------
+# VERIFICATION
+# --------------------------------------------------
+def _verification_rows(engine, n_features, n_rows=256, seed=0):
+    """Rows whose values sit on and around the split thresholds"""
+    rng = np.random.default_rng(seed)
+    X = rng.normal(size=(n_rows, n_features))
+
+    if isinstance(engine, CompiledEnsemble):
+        splits = engine.children[0::2] != np.arange(len(engine.feature))
+        for f in range(n_features):
+            thresholds = engine.threshold[splits & (engine.feature == f)]
+            # LightGBM uses ±1e300 as a sentinel for NaN-only splits
+            thresholds = thresholds[np.abs(thresholds) < 1e30]
+            if len(thresholds):
+                picks = rng.choice(thresholds, size=n_rows)
+                nudge = rng.choice([-1, 0, 1], size=n_rows) * np.abs(picks) * 1e-6
+                X[:, f] = picks + nudge
+
+    return X
+
+
+def verify(engine, model, n_features, rtol=1e-5, atol=1e-4):
+    """Max absolute difference between engine and original predictions, or raise"""
+    reference = engine if isinstance(engine, CompiledEnsemble) else compile_model(model)
+    X = _verification_rows(reference, n_features)
+    expected = np.asarray(model.predict(X.astype(np.float32)), dtype=np.float64).ravel()
+    actual = engine.predict(X.astype(np.float32))
+
+    return _max_diff(actual, expected, f"Compiled {engine.source}", "the original model", rtol, atol)
+
+
+def verify_fused(fused, engine, model, mean, scale, rtol=1e-5, atol=1e-4):
+    """Max absolute difference between a fused engine on raw rows and the unfused pipeline, or raise"""
+    reference = engine if isinstance(engine, CompiledEnsemble) else compile_model(model)
+    X = (mean + scale * _verification_rows(reference, len(mean))).astype(np.float32)
+
+    # The reference is the real pipeline, a fitted StandardScaler then the model, not standardize()
+    expected = np.asarray(model.predict(_fitted_scaler(mean, scale).transform(X)), dtype=np.float64).ravel()
+    actual = fused.predict(X)
+
+    return _max_diff(actual, expected, f"Fused {fused.source}", "the unfused pipeline", rtol, atol)
+
+
+def _fitted_scaler(mean, scale):
+    from sklearn.preprocessing import StandardScaler
+
+    scaler = StandardScaler()
+    scaler.mean_ = np.asarray(mean, dtype=np.float64)
+    scaler.scale_ = np.asarray(scale, dtype=np.float64)
+    scaler.var_ = scaler.scale_ ** 2
+    scaler.n_features_in_ = len(scaler.mean_)
+    scaler.n_samples_seen_ = 1
+    return scaler
+
+
+def _max_diff(actual, expected, name, against, rtol, atol):
+    if not np.allclose(actual, expected, rtol=rtol, atol=atol):
+        raise ValueError(f"{name} disagrees with {against} (max abs diff {np.max(np.abs(actual - expected)):.6g})")
+
+    return float(np.max(np.abs(actual - expected)))
+
+
+def _n_features(model):
+    for attribute in ('n_features_in_', 'n_features_'):
+        if hasattr(model, attribute):
+            return int(getattr(model, attribute))
+    if hasattr(model, 'num_features'):
+        return int(model.num_features())
+    return None
+
+
+def _with_scaler(compiled, model, scaler):
+    """The compiled engine with the scaler folded in, or behind it when folding fails"""
+    mean = np.asarray(scaler['mean'], dtype=np.float64)
+    scale = np.asarray(scaler['scale'], dtype=np.float64)
+
+    try:
+        fused = fuse_scaler(compiled, mean, scale)
+        if fused is not None:
+            diff = verify_fused(fused, compiled, model, mean, scale)
+            print(f"Folded the scaler into {compiled.source} (max abs diff {diff:.2g})")
+            return fused
+    except Exception as e:
+        print(f"Scaler folding failed: {e}")
+
+    return ScaledModel(compiled, mean, scale)
+
+
+@timed('model_compile')
+def load_inference_model(model, engine=INFERENCE_ENGINE, scaler=None):
+    """Compile and verify a model for serving.
+
+    engine is 'native' (NumPy node arrays), 'onnx' (onnxruntime, falling
+    back to native) or 'model' (serve the original object). Anything that
+    fails to compile or verify is served as the original model. With the
+    training scaler ({'mean', 'scale'}) the result takes raw feature rows:
+    the scaler is folded into native engines and applied per call otherwise.
+    """
+    n_features = _n_features(model)
+    if engine == 'model' or n_features is None:
+        return model if scaler is None else ScaledModel(model, scaler['mean'], scaler['scale'])
+
+    builders = [lambda: compile_model(model)]
+    if engine == 'onnx':
+        builders.insert(0, lambda: export_onnx(model, n_features))
+
+    for build in builders:
+        try:
+            compiled = build()
+            if compiled is None:
+                continue
+
+            diff = verify(compiled, model, n_features)
+            print(f"Compiled {compiled.source} for inference (max abs diff {diff:.2g})")
+            return compiled if scaler is None else _with_scaler(compiled, model, scaler)
+
+        except Exception as e:
+            print(f"Model compilation failed: {e}")
+
+    print(f"Serving original {type(model).__name__}")
+    return model if scaler is None else ScaledModel(model, scaler['mean'], scaler['scale'])
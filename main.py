@@ -7,6 +7,7 @@ feature engineering, and web dashboard
 
 import argparse
 import sys
+from datetime import datetime, timedelta
 
 
 def main():
@@ -14,7 +15,7 @@ def main():
 
     parser.add_argument(
         "--mode",
-        choices=["api", "scheduler", "train", "backfill", "analytics", "mock"],
+        choices=["api", "scheduler", "train", "train-incremental", "backfill", "analytics", "mock", "migrate-timeseries"],
         default="api",
         help="Mode to run the system"
     )
@@ -23,7 +24,7 @@ def main():
         "--days",
         type=int,
         default=30,
-        help="Number of days for mock generation or analytics"
+        help="Number of days for mock generation, backfill or analytics"
     )
 
     args = parser.parse_args()
@@ -58,6 +59,13 @@ def main():
         trainer = ModelTrainer()
         trainer.train_all_models()
 
+    elif args.mode == "train-incremental":
+        print("🤖 Updating models with new data...")
+        from model_training import ModelTrainer
+
+        trainer = ModelTrainer()
+        trainer.run_training_cycle()
+
     # --------------------------------------------------
     # BACKFILL MODE (REAL API)
     # --------------------------------------------------
@@ -67,7 +75,8 @@ def main():
         from model_training import ModelTrainer
 
         trainer = ModelTrainer()
-        trainer.backfill_historical_data()
+        end_date = datetime.now()
+        trainer.backfill_historical_data(end_date - timedelta(days=args.days), end_date)
 
     # --------------------------------------------------
     # MOCK DATA MODE (BEST FOR TRAINING)
@@ -92,6 +101,19 @@ def main():
         analytics = Analytics()
         analytics.perform_eda(days=args.days)
 
+    # --------------------------------------------------
+    # TIME-SERIES MIGRATION
+    # --------------------------------------------------
+    elif args.mode == "migrate-timeseries":
+        print("🗄️ Migrating features to a time-series collection...")
+        from database import DatabaseManager
+
+        db = DatabaseManager(timeseries=True)
+        db.migrate_to_timeseries()
+        db.refresh_daily_rollups()
+
+        print("Set FEATURE_STORE_TIMESERIES=true to read and write the new collection.")
+
     else:
         print("❌ Invalid mode. Use --help for options.")
         sys.exit(1)
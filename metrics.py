@@ -0,0 +1,222 @@
+import cProfile
+import functools
+import inspect
+import os
+import threading
+import time
+from bisect import bisect_left
+from datetime import datetime
+
+from config import PROFILE_SLOW_REQUEST_MS, PROFILE_DIR
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                   0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+# --------------------------------------------------
+# METRIC TYPES
+# --------------------------------------------------
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.lock = threading.Lock()
+        self.values = {}
+
+    def _key(self, labels):
+        return tuple(str(labels.get(n, '')) for n in self.labelnames)
+
+    def header(self):
+        return [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self):
+        lines = self.header()
+        with self.lock:
+            for key, value in sorted(self.values.items()):
+                lines.append(f'{self.name}{_format_labels(self.labelnames, key)} {value}')
+        return lines
+
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        with self.lock:
+            self.values[self._key(labels)] = value
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self.lock:
+            if key not in self.values:
+                self.values[key] = [[0] * len(self.buckets), 0.0, 0]
+            state = self.values[key]
+            index = bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def render(self):
+        lines = self.header()
+        with self.lock:
+            for key, (counts, total, count) in sorted(self.values.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    labels = _format_labels(self.labelnames, key, f'le="{bound}"')
+                    lines.append(f'{self.name}_bucket{labels} {cumulative}')
+                labels = _format_labels(self.labelnames, key, 'le="+Inf"')
+                lines.append(f'{self.name}_bucket{labels} {count}')
+                labels = _format_labels(self.labelnames, key)
+                lines.append(f'{self.name}_sum{labels} {total}')
+                lines.append(f'{self.name}_count{labels} {count}')
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.metrics = {}
+
+    def _register(self, cls, name, *args, **kwargs):
+        with self.lock:
+            if name not in self.metrics:
+                self.metrics[name] = cls(name, *args, **kwargs)
+            return self.metrics[name]
+
+    def counter(self, name, help_text, labelnames=()):
+        return self._register(Counter, name, help_text, labelnames)
+
+    def gauge(self, name, help_text, labelnames=()):
+        return self._register(Gauge, name, help_text, labelnames)
+
+    def histogram(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram, name, help_text, labelnames, buckets)
+
+    def render(self):
+        """Prometheus text exposition format (version 0.0.4)"""
+        with self.lock:
+            metrics = list(self.metrics.values())
+
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = MetricsRegistry()
+
+STAGE_DURATION = REGISTRY.histogram(
+    'aqi_stage_duration_seconds', 'Latency of pipeline and serving stages', ['stage'])
+STAGE_CALLS = REGISTRY.counter(
+    'aqi_stage_calls_total', 'Pipeline and serving stage invocations', ['stage', 'status'])
+DB_ROWS = REGISTRY.counter(
+    'aqi_db_rows_total', 'Documents read from or written to MongoDB', ['operation', 'collection'])
+DB_BYTES = REGISTRY.counter(
+    'aqi_db_bytes_total', 'Model payload bytes read from or written to MongoDB', ['operation', 'collection'])
+HTTP_DURATION = REGISTRY.histogram(
+    'aqi_http_request_duration_seconds', 'API request latency', ['method', 'path', 'status'])
+
+
+# --------------------------------------------------
+# TIMING HELPERS
+# --------------------------------------------------
+class timed:
+    """Record a stage's latency and outcome; usable as context manager or decorator"""
+
+    def __init__(self, stage):
+        self.stage = stage
+        self._local = threading.local()
+
+    def __enter__(self):
+        starts = getattr(self._local, 'starts', None)
+        if starts is None:
+            starts = self._local.starts = []
+        starts.append(time.perf_counter())
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self._local.starts.pop()
+        STAGE_DURATION.observe(elapsed, stage=self.stage)
+        STAGE_CALLS.inc(stage=self.stage, status='error' if exc_type else 'ok')
+        return False
+
+    def __call__(self, func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with self:
+                return func(*args, **kwargs)
+        return wrapper
+
+
+def record_db_io(operation, collection, rows, nbytes=None):
+    DB_ROWS.inc(rows, operation=operation, collection=collection)
+    # Bytes only where the size is already at hand; re-encoding documents to count them costs as much as the I/O
+    if nbytes is not None:
+        DB_BYTES.inc(nbytes, operation=operation, collection=collection)
+
+
+# --------------------------------------------------
+# SLOW REQUEST PROFILING
+# --------------------------------------------------
+def profile_slow_requests(func):
+    """Dump a cProfile of calls slower than PROFILE_SLOW_REQUEST_MS.
+
+    No-op unless the env var is set. Profiles land in PROFILE_DIR as .prof
+    files (snakeviz / pstats); the logged native thread id can be handed to
+    ``py-spy dump --pid`` for a live look at a stuck worker.
+    """
+    if PROFILE_SLOW_REQUEST_MS <= 0 or inspect.iscoroutinefunction(func):
+        return func
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        profiler = cProfile.Profile()
+        start = time.perf_counter()
+        profiler.enable()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            profiler.disable()
+            elapsed_ms = (time.perf_counter() - start) * 1000
+
+            if elapsed_ms >= PROFILE_SLOW_REQUEST_MS:
+                os.makedirs(PROFILE_DIR, exist_ok=True)
+                stamp = datetime.now().strftime('%Y%m%d-%H%M%S-%f')
+                path = os.path.join(PROFILE_DIR, f'{func.__name__}-{stamp}.prof')
+                profiler.dump_stats(path)
+                print(f"Slow call {func.__name__} ({elapsed_ms:.0f} ms, "
+                      f"thread {threading.get_native_id()}) profiled to {path}")
+
+    return wrapper
@@ -56,6 +56,6 @@ class MockDataGenerator:
 
         print(f"Generated {len(df)} rows.")
 
-        self.db.store_features(df)
+        self.db.store_features(df, source='mock')
 
         print("Mock data stored successfully in MongoDB.")
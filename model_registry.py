@@ -0,0 +1,121 @@
+from datetime import datetime
+from pymongo import ReturnDocument
+from database import DatabaseManager
+from config import MODEL_COUNTERS_COLLECTION, MODEL_ALIASES_COLLECTION, CHAMPION_ALIAS
+
+# Listing queries never pull the pickled model, the per-feature scaler arrays or drift bins
+SUMMARY_PROJECTION = {
+    '_id': 0, 'model': 0, 'metadata.scaler': 0, 'metadata.feature_columns': 0, 'metadata.drift_reference': 0
+}
+
+_indexed_clients = set()
+
+
+class ModelRegistry:
+    """Versioned models plus movable aliases, on top of the models collection.
+
+    Each document is one (name, version). Versions come from an atomic
+    counter per name; aliases such as "champion" are one document each in
+    the aliases collection, so promoting is a single atomic write and two
+    concurrent promotions can never leave an alias pointing nowhere.
+    """
+
+    def __init__(self, db=None):
+        self.db = db or DatabaseManager()
+        self.models = self.db.models_collection
+        self.counters = self.db.db[MODEL_COUNTERS_COLLECTION]
+        self.aliases = self.db.db[MODEL_ALIASES_COLLECTION]
+        self._ensure_indexes()
+
+    def _ensure_indexes(self):
+        if id(self.db.client) in _indexed_clients:
+            return
+
+        try:
+            self.models.create_index([('name', 1), ('version', -1)])
+            _indexed_clients.add(id(self.db.client))
+        except Exception as e:
+            print(f"Could not create model registry indexes: {e}")
+
+    # --------------------------------------------------
+    # WRITE
+    # --------------------------------------------------
+    def next_version(self, name):
+        counter = self.counters.find_one_and_update(
+            {'_id': name},
+            {'$inc': {'seq': 1}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        return counter['seq']
+
+    def register(self, name, model, metadata, version=None):
+        """Store a new version of a model and return its version number"""
+        version = version or self.next_version(name)
+        metadata = dict(metadata, version=version)
+        self.db.store_model(name, model, metadata)
+        return version
+
+    def promote(self, name, version, alias=CHAMPION_ALIAS):
+        """Point an alias at one model version (and away from every other)"""
+        if self.models.count_documents({'name': name, 'version': version}, limit=1) == 0:
+            raise KeyError(f"Unknown model {name} v{version}")
+
+        # One document per alias: the last promotion wins, there is never zero or two targets
+        self.aliases.update_one(
+            {'_id': alias},
+            {'$set': {'name': name, 'version': version, 'promoted_at': datetime.now()}},
+            upsert=True
+        )
+
+        print(f"Promoted {name} v{version} to {alias}")
+
+    # --------------------------------------------------
+    # READ
+    # --------------------------------------------------
+    def load(self, alias=CHAMPION_ALIAS):
+        """Model and metadata behind an alias"""
+        name, version = self.resolve(alias)
+        if name is None:
+            return None, None
+        return self.db.find_model({'name': name, 'version': version})
+
+    def load_latest(self, name):
+        return self.db.get_model(name)
+
+    def resolve(self, alias=CHAMPION_ALIAS):
+        """Name and version an alias points to, without loading the model"""
+        document = self.aliases.find_one({'_id': alias})
+
+        if document is None:
+            # Registries promoted before the aliases collection kept them in a per-model array
+            document = self.models.find_one({'aliases': alias}, {'name': 1, 'version': 1, '_id': 0})
+
+        return (document['name'], document['version']) if document else (None, None)
+
+    def _with_aliases(self, documents):
+        targets = {}
+        for document in self.aliases.find({}):
+            targets.setdefault((document['name'], document['version']), []).append(document['_id'])
+
+        for document in documents:
+            document['aliases'] = targets.get((document.get('name'), document.get('version')), [])
+        return documents
+
+    def latest_metadata(self, name):
+        return self.db.get_model_metadata(name)
+
+    def list_models(self, name=None):
+        """Summaries of every stored version, newest first"""
+        query = {'name': name} if name else {}
+        cursor = self.models.find(query, SUMMARY_PROJECTION).sort([('name', 1), ('version', -1)])
+        return self._with_aliases(list(cursor))
+
+    def describe(self, name, version=None):
+        """Full metadata of one version (latest when version is None), without model bytes"""
+        query = {'name': name}
+        if version is not None:
+            query['version'] = version
+
+        document = self.models.find_one(query, {'_id': 0, 'model': 0}, sort=[('version', -1)])
+        return self._with_aliases([document])[0] if document else None
@@ -1,28 +1,57 @@
 import pandas as pd
 import numpy as np
-from sklearn.ensemble import RandomForestRegressor
-from sklearn.linear_model import Ridge
-from sklearn.metrics import mean_squared_error, mean_absolute_error, r2_score
-import xgboost as xgb
-import lightgbm as lgb
 from database import DatabaseManager
+from model_registry import ModelRegistry
 from feature_engineering import FeatureEngineer
-from datetime import datetime
+from datetime import datetime, timedelta
+from metrics import timed
+from inference_engine import standardize, load_inference_model
+from config import (
+    TRAINING_MODE,
+    TRAINING_DAYS,
+    INCREMENTAL_TREES,
+    INCREMENTAL_MIN_ROWS,
+    RETRAIN_DEGRADATION_FACTOR,
+    RETRAIN_DRIFT_THRESHOLD,
+    FULL_RETRAIN_MAX_AGE_DAYS,
+    TRAINING_CACHE_DIR,
+    DRIFT_FIELDS,
+    DRIFT_PSI_THRESHOLD,
+)
+
+MODEL_NAMES = ['random_forest', 'ridge', 'xgboost', 'lightgbm']
 
 class ModelTrainer:
     def __init__(self):
         self.db = DatabaseManager()
+        self.registry = ModelRegistry(self.db)
         self.fe = FeatureEngineer()
 
     # --------------------------------------------------
     # PREPARE DATA
     # --------------------------------------------------
-    def prepare_data(self, days=30):
+    @timed('prepare_training_data')
+    def prepare_data(self, days=TRAINING_DAYS):
+        if TRAINING_CACHE_DIR:
+            from training_cache import TrainingMatrixCache
+
+            cache = TrainingMatrixCache(self.db, self.fe)
+            X_train, X_test, y_train, y_test, feature_cols, scaler, watermark = \
+                cache.training_matrices(days)
+
+            self.fe._scaler = scaler
+            self.data_watermark = watermark
+
+            return X_train, X_test, y_train, y_test, feature_cols
+
         df = self.db.get_training_data(days)
 
         if df.empty:
             raise ValueError("No training data available. Run backfill first.")
 
+        # Incremental runs continue from the newest row this training run saw
+        self.data_watermark = df['timestamp'].max().to_pydatetime()
+
         df = self.fe.create_features(df)
         X, y, feature_cols = self.fe.prepare_training_data(df)
 
@@ -38,6 +67,8 @@ class ModelTrainer:
     # MODELS
     # --------------------------------------------------
     def train_random_forest(self, X_train, y_train):
+        from sklearn.ensemble import RandomForestRegressor
+
         model = RandomForestRegressor(
             n_estimators=100,
             max_depth=10,
@@ -48,11 +79,15 @@ class ModelTrainer:
         return model
 
     def train_ridge(self, X_train, y_train):
+        from sklearn.linear_model import Ridge
+
         model = Ridge(alpha=1.0)
         model.fit(X_train, y_train)
         return model
 
     def train_xgboost(self, X_train, y_train):
+        import xgboost as xgb
+
         model = xgb.XGBRegressor(
             objective='reg:squarederror',
             n_estimators=100,
@@ -64,6 +99,8 @@ class ModelTrainer:
         return model
 
     def train_lightgbm(self, X_train, y_train):
+        import lightgbm as lgb
+
         model = lgb.LGBMRegressor(
             n_estimators=100,
             max_depth=6,
@@ -77,7 +114,10 @@ class ModelTrainer:
     # EVALUATION
     # --------------------------------------------------
     def evaluate_model(self, model, X_test, y_test, model_name):
-        y_pred = model.predict(X_test)
+        from sklearn.metrics import mean_squared_error, mean_absolute_error, r2_score
+
+        with timed('evaluate'):
+            y_pred = model.predict(X_test)
 
         rmse = float(np.sqrt(mean_squared_error(y_test, y_pred)))
         mae = float(mean_absolute_error(y_test, y_pred))
@@ -101,64 +141,231 @@ class ModelTrainer:
                 "lightgbm": self.train_lightgbm
             }
 
-            best_model = None
             best_score = float("inf")
             best_name = None
+            best_version = None
+
+            training_date = datetime.now()
+            scaler = {
+                'mean': self.fe.scaler.mean_.tolist(),
+                'scale': self.fe.scaler.scale_.tolist()
+            }
+            drift_reference = self.drift_reference()
 
             for name, trainer in models.items():
                 print(f"Training {name}...")
-                model = trainer(X_train, y_train)
+                with timed(f'train_{name}'):
+                    model = trainer(X_train, y_train)
                 metrics = self.evaluate_model(model, X_test, y_test, name)
 
-                if metrics['rmse'] < best_score:
-                    best_score = metrics['rmse']
-                    best_model = model
-                    best_name = name
+                # What serving will run: the scaler folded in, checked against the unfused pipeline
+                serving = load_inference_model(model, scaler=scaler)
 
                 # Convert numpy types to float for MongoDB
                 safe_metrics = {k: float(v) for k, v in metrics.items()}
 
+                previous = self.registry.latest_metadata(name)
+                version = self.registry.next_version(name)
+
                 metadata = {
                     "metrics": safe_metrics,
                     "feature_columns": feature_cols,
-                    "training_date": datetime.now(),
-                    "version": 1
+                    "lookback": 24,  # hours per input window, the prepare_training_data default
+                    "training_date": training_date,
+                    "version": version,
+                    "data_watermark": self.data_watermark,
+                    "scaler": scaler,
+                    "serving_engine": getattr(serving, 'source', None) or type(serving).__name__,
+                    "drift_reference": drift_reference,
+                    "lineage": {
+                        "training_mode": "full",
+                        "parent_version": previous.get('version') if previous else None,
+                        "base_version": version,
+                        "base_training_date": training_date,
+                        "incremental_updates": 0,
+                        "rows_added": len(X_train) + len(X_test)
+                    }
                 }
 
-                self.db.store_model(f"{name}_v1", model, metadata)
+                self.registry.register(name, model, metadata, version)
 
-            print(f"\n✅ Best model: {best_name} (RMSE: {best_score:.2f})")
+                if metrics['rmse'] < best_score:
+                    best_score = metrics['rmse']
+                    best_name = name
+                    best_version = version
+
+            self.registry.promote(best_name, best_version)
+
+            print(f"\n✅ Best model: {best_name} v{best_version} (RMSE: {best_score:.2f})")
 
         except Exception as e:
             print(f"Error training models: {e}")
 
+    def drift_reference(self, days=TRAINING_DAYS):
+        """Binned distribution of the raw fields this run trained on (see drift.py)"""
+        from drift import reference_sketch
+
+        end_date = self.data_watermark
+        df = self.db.get_features(end_date - timedelta(days=days), end_date, fields=DRIFT_FIELDS)
+        return reference_sketch(df)
+
     # --------------------------------------------------
-    # BACKFILL (FREE TIER SAFE)
+    # INCREMENTAL TRAINING
     # --------------------------------------------------
-    def backfill_historical_data(self, start_date=None, end_date=None):
-        from data_fetcher import DataFetcher
+    def prepare_incremental_data(self, watermark, feature_cols, lookback=24):
+        """Training windows whose target arrived after the watermark.
 
-        fetcher = DataFetcher()
+        Rows from 2 * lookback hours before the watermark are loaded as well so the
+        lag/rolling features and the lookback windows of the first new target are complete.
+        """
+        df = self.db.get_features(watermark - timedelta(hours=2 * lookback), datetime.now())
 
-        try:
-            print("📦 Fetching forecast data (free tier)...")
+        if len(df) <= lookback:
+            return None
 
-            weather_df = fetcher.get_historical_weather()
+        df = self.fe.create_features(df)
+        X, y, _, _ = self.fe.build_windows(df, feature_cols, lookback=lookback, after=watermark)
+
+        return X, y, df['timestamp'].max().to_pydatetime()
+
+    def update_model(self, name, model, X_new, y_new):
+        """Continue training a stored model on new rows (None when it cannot be continued)"""
+        if name == 'random_forest':
+            # warm_start keeps the existing trees and only fits the added ones
+            model.set_params(warm_start=True, n_estimators=model.n_estimators + INCREMENTAL_TREES)
+            model.fit(X_new, y_new)
+            return model
+
+        if name == 'xgboost':
+            import xgboost as xgb
+
+            updated = xgb.XGBRegressor(**model.get_params())
+            updated.set_params(n_estimators=INCREMENTAL_TREES)
+            updated.fit(X_new, y_new, xgb_model=model.get_booster())
+            return updated
+
+        if name == 'lightgbm':
+            import lightgbm as lgb
+
+            updated = lgb.LGBMRegressor(**model.get_params())
+            updated.set_params(n_estimators=INCREMENTAL_TREES)
+            updated.fit(X_new, y_new, init_model=model.booster_)
+            return updated
+
+        # Ridge has no partial fit; it is refit on the next full retrain
+        return None
+
+    def incremental_update(self):
+        """Continue the stored models on rows newer than their data watermark.
+
+        Returns None when the models are up to date, or the reason a full
+        retrain is needed instead.
+        """
+        parents = {}
+        for name in MODEL_NAMES:
+            model, metadata = self.registry.load_latest(name)
+            if model is None or 'data_watermark' not in metadata:
+                return f"no incremental-ready {name} model"
+            parents[name] = (model, metadata)
+
+        _, reference = parents['random_forest']
+        lineage = reference['lineage']
+
+        if datetime.now() - lineage['base_training_date'] > timedelta(days=FULL_RETRAIN_MAX_AGE_DAYS):
+            return f"last full retrain is older than {FULL_RETRAIN_MAX_AGE_DAYS} days"
+
+        batch = self.prepare_incremental_data(reference['data_watermark'], reference['feature_columns'])
+        if batch is None or len(batch[0]) < INCREMENTAL_MIN_ROWS:
+            print(f"Fewer than {INCREMENTAL_MIN_ROWS} new rows since {reference['data_watermark']}, skipping")
+            return None
+
+        X_new, y_new, watermark = batch
+        scaler = reference['scaler']
+        X_new = standardize(X_new, np.array(scaler['mean']), np.array(scaler['scale']))
+
+        # Streaming PSI from the hourly drift monitor, when it tracks the champion's lineage
+        from drift import DriftMonitor
+
+        champion_name, _ = self.registry.resolve()
+        status = DriftMonitor(self.db).status()
+        if champion_name in parents and status and status['drifted']:
+            tracked = {'name': champion_name, 'base_version': parents[champion_name][1]['lineage']['base_version']}
+            if status['reference'] == tracked:
+                return f"feature drift PSI {status['max_psi']:.2f} > {DRIFT_PSI_THRESHOLD} " \
+                       f"({', '.join(status['drifted_features'])})"
+
+        # Mean standardized shift of the new rows against the training distribution
+        drift = float(np.mean(np.abs(X_new.mean(axis=0))))
+        if drift > RETRAIN_DRIFT_THRESHOLD:
+            return f"feature drift {drift:.2f} > {RETRAIN_DRIFT_THRESHOLD}"
+
+        # Test-then-train: score every parent on rows it has not seen yet
+        prequential = {}
+        for name, (model, metadata) in parents.items():
+            metrics = self.evaluate_model(model, X_new, y_new, f"{name} (prequential)")
+            baseline = metadata['metrics']['rmse']
+            if metrics['rmse'] > baseline * RETRAIN_DEGRADATION_FACTOR:
+                return f"{name} RMSE {metrics['rmse']:.2f} degraded from {baseline:.2f}"
+            prequential[name] = metrics
+
+        for name, (model, metadata) in parents.items():
+            with timed(f'update_{name}'):
+                updated = self.update_model(name, model, X_new, y_new)
+
+            if updated is None:
+                continue
+
+            version = self.registry.next_version(name)
+            new_metadata = dict(metadata)
+            new_metadata.update({
+                "training_date": datetime.now(),
+                "version": version,
+                "data_watermark": watermark,
+                "prequential_metrics": prequential[name],
+                "lineage": dict(
+                    metadata['lineage'],
+                    training_mode="incremental",
+                    parent_version=metadata['version'],
+                    incremental_updates=metadata['lineage']['incremental_updates'] + 1,
+                    rows_added=len(X_new)
+                )
+            })
+
+            self.registry.register(name, updated, new_metadata, version)
+
+            # The champion follows its own lineage; switching models needs a full retrain
+            if name == champion_name:
+                self.registry.promote(name, version)
+
+        print(f"✅ Incremental update on {len(X_new)} new rows (data up to {watermark})")
+        return None
+
+    def run_training_cycle(self):
+        """Nightly training: incremental by default, full retrain on drift or degradation"""
+        if TRAINING_MODE != 'incremental':
+            return self.train_all_models()
 
-            if weather_df.empty:
-                print("No data fetched.")
-                return
+        try:
+            reason = self.incremental_update()
+        except Exception as e:
+            reason = f"incremental update failed: {e}"
 
-            # Simulated AQI (since free tier has no historical AQI)
-            weather_df['aqi'] = np.random.randint(40, 160, len(weather_df))
+        if reason:
+            print(f"Full retrain: {reason}")
+            self.train_all_models()
 
-            # Only keep numeric columns for training
-            numeric_cols = weather_df.select_dtypes(include=[np.number]).columns.tolist()
-            features_df = self.fe.create_features(weather_df[numeric_cols + ['timestamp']])
+    # --------------------------------------------------
+    # BACKFILL
+    # --------------------------------------------------
+    def backfill_historical_data(self, start_date=None, end_date=None):
+        """Fill [start_date, end_date) with hourly history (resumable, see backfill.py)"""
+        from backfill import BackfillEngine
 
-            self.db.store_features(features_df)
+        end_date = end_date or datetime.now()
+        start_date = start_date or end_date - timedelta(days=TRAINING_DAYS)
 
-            print("✅ Backfill complete (using forecast data).")
+        try:
+            return BackfillEngine(db=self.db).run(start_date, end_date)
 
         except Exception as e:
             print(f"Error during backfill: {e}")
@@ -0,0 +1,87 @@
+import numpy as np
+import pandas as pd
+
+AQI_BINS = [0, 50, 100, 150, 200, 300]
+AQI_LABELS = ['Good', 'Moderate', 'Unhealthy for Sensitive', 'Unhealthy', 'Very Unhealthy', 'Hazardous']
+WEATHER_COLS = ['weather_main', 'weather_description']
+
+
+def _cyclic(pl, col, period):
+    # Lookup tables from numpy so the encodings match the pandas path to the bit
+    angles = 2 * np.pi * np.arange(period + 1) / period
+    sin = pl.lit(pl.Series(np.sin(angles))).gather(pl.col(col))
+    cos = pl.lit(pl.Series(np.cos(angles))).gather(pl.col(col))
+    return sin, cos
+
+
+def _aqi_category(pl):
+    category = pl.lit(None, dtype=pl.String)
+    for upper, lower, label in reversed(list(zip(AQI_BINS[1:] + [np.inf], AQI_BINS, AQI_LABELS))):
+        category = pl.when((pl.col('aqi') > lower) & (pl.col('aqi') <= upper)).then(pl.lit(label)).otherwise(category)
+    return category
+
+
+def create_features_polars(df, pollutant_cols):
+    """FeatureEngineer.create_features() as one lazy Polars query.
+
+    Polars plans the whole chain - time and cyclic features, lags, rolling
+    windows, one-hot encoding, forward/backward fill - and runs it over
+    all cores in a single pass instead of materializing a frame per step.
+    Returns a pandas frame with the columns and dtypes of the pandas path;
+    values agree exactly except the rolling statistics, which Polars sums
+    incrementally and which can differ from rolling_mean_std() in the last
+    bits.
+    """
+    import polars as pl
+
+    if not hasattr(pl, 'String') or not hasattr(pl.Expr, 'gather'):
+        raise ImportError(f"FEATURE_ENGINE=polars needs polars>=0.20, found {pl.__version__}")
+
+    # One-hot levels must be known before the query is planned (get_dummies sorts them)
+    levels = {col: sorted(df[col].dropna().unique()) for col in WEATHER_COLS if col in df.columns}
+
+    # Both conversions go column by column through numpy, so neither needs pyarrow
+    frame = pl.DataFrame([pl.Series(name, df[name].to_numpy(), nan_to_null=True) for name in df.columns])
+
+    ts = pl.col('timestamp').dt
+    query = frame.lazy().with_columns(
+        ts.hour().cast(pl.Int32).alias('hour'),
+        ts.day().cast(pl.Int32).alias('day'),
+        ts.month().cast(pl.Int32).alias('month'),
+        (ts.weekday() - 1).cast(pl.Int32).alias('weekday'),
+    ).with_columns(
+        (pl.col('weekday') >= 5).cast(pl.Int64).alias('is_weekend'),
+    )
+
+    hour_sin, hour_cos = _cyclic(pl, 'hour', 24)
+    month_sin, month_cos = _cyclic(pl, 'month', 12)
+    columns = [hour_sin.alias('hour_sin'), hour_cos.alias('hour_cos'),
+               month_sin.alias('month_sin'), month_cos.alias('month_cos')]
+
+    for col in [col for col in pollutant_cols if col in df.columns]:
+        columns += [
+            pl.col(col).shift(1).alias(f'{col}_lag_1'),
+            pl.col(col).shift(24).alias(f'{col}_lag_24'),
+            pl.col(col).rolling_mean(24).alias(f'{col}_rolling_mean_24'),
+            pl.col(col).rolling_std(24).alias(f'{col}_rolling_std_24'),
+            (pl.col(col) - pl.col(col).shift(1)).alias(f'{col}_change_rate'),
+        ]
+
+    columns += [
+        (pl.col('temp') * pl.col('humidity')).alias('temp_humidity_interaction'),
+        (pl.col('wind_speed') * pl.col('temp')).alias('wind_temp_interaction'),
+        _aqi_category(pl).alias('aqi_category'),
+    ]
+    query = query.with_columns(columns)
+
+    # get_dummies appends each column's indicators at the end, NaN rows get none set
+    for col, values in levels.items():
+        query = query.with_columns([
+            (pl.col(col) == value).fill_null(False).alias(f'{col}_{value}') for value in values
+        ]).drop(col)
+
+    frame = query.with_columns(pl.all().forward_fill().backward_fill()).collect()
+
+    result = pd.DataFrame({name: frame[name].to_numpy() for name in frame.columns}, index=df.index)
+    result['aqi_category'] = pd.Categorical(result['aqi_category'], categories=AQI_LABELS, ordered=True)
+    return result
@@ -1,38 +1,118 @@
+import time
 import pandas as pd
 import numpy as np
 from database import DatabaseManager
+from model_registry import ModelRegistry
 from feature_engineering import FeatureEngineer
 from data_fetcher import DataFetcher
 from datetime import datetime, timedelta
+from metrics import timed
+from config import MODEL_CACHE_TTL_SECONDS, CHAMPION_ALIAS
+from inference_engine import load_inference_model, ScaledModel
 
 class Predictor:
-    def __init__(self):
+    def __init__(self, buffer=None):
         self.db = DatabaseManager()
+        self.registry = ModelRegistry(self.db)
         self.fe = FeatureEngineer()
-        self.fetcher = DataFetcher()
-
-    def load_model(self, model_name='best_model'):
-        """Load the best model"""
-        model, metadata = self.db.get_model(model_name)
+        self.buffer = buffer
+        self._fetcher = None
+        self._tracker = None
+        self._model_cache = {}
+
+    @property
+    def fetcher(self):
+        # Created on first use so serving predictions does not require API keys
+        if self._fetcher is None:
+            self._fetcher = DataFetcher()
+        return self._fetcher
+
+    def load_model(self, alias=CHAMPION_ALIAS):
+        """Load the model behind a registry alias (cached for MODEL_CACHE_TTL_SECONDS)"""
+        cached = self._model_cache.get(alias)
+        if cached and time.monotonic() - cached['loaded_at'] < MODEL_CACHE_TTL_SECONDS:
+            return cached['model'], cached['metadata']
+
+        model, metadata = self.registry.load(alias)
         if model is None:
-            # Try to get the latest model
-            # For simplicity, get random forest
-            model, metadata = self.db.get_model('random_forest_v1')
+            # Nothing promoted yet (models trained before the registry): newest stored model
+            model, metadata = self.db.find_model({})
+
+        if model is not None:
+            self._model_cache[alias] = {
+                'model': model,
+                'metadata': metadata,
+                'engine': None,
+                'loaded_at': time.monotonic()
+            }
 
         return model, metadata
 
+    def load_serving_model(self, alias=CHAMPION_ALIAS):
+        """Load the model compiled for low-latency inference (cached with the model)"""
+        model, metadata = self.load_model(alias)
+        if model is None:
+            return None, None
+
+        cached = self._model_cache[alias]
+        if cached['engine'] is None:
+            # Takes raw feature windows: the training scaler is folded in (or applied per call)
+            cached['engine'] = load_inference_model(model, scaler=metadata.get('scaler'))
+
+        return cached['engine'], metadata
+
+    def clear_model_cache(self):
+        """Drop cached models so the next request resolves the alias again"""
+        self._model_cache.clear()
+
+    def warm_up(self):
+        """Load and compile the serving model ahead of the first request"""
+        model, _ = self.load_serving_model()
+        return model is not None
+
+    def history_hours(self, metadata=None):
+        """Hours of observations one input window needs, its lag/rolling look-back included"""
+        return (metadata or {}).get('lookback', 24) + self.fe.HALO_ROWS
+
+    def get_latest_features(self, hours=24):
+        """Recent rows from the in-process ring buffer, or the feature store without one"""
+        if self.buffer is not None and self.buffer.size:
+            return self.buffer.frame(hours)
+
+        return self.db.get_latest_features(hours=hours)
+
+    @property
+    def tracker(self):
+        if self._tracker is None:
+            from forecast_tracking import ForecastTracker
+            self._tracker = ForecastTracker(self.db)
+        return self._tracker
+
+    @timed('predict')
     def predict_next_3_days(self):
         """Predict AQI for next 3 days"""
+        # Load model
+        model, metadata = self.load_serving_model()
+        if model is None:
+            raise ValueError("No trained model available")
+
         # Get latest features
-        latest_df = self.db.get_latest_features(hours=24)
+        latest_df = self.get_latest_features(hours=self.history_hours(metadata))
         if latest_df.empty:
             raise ValueError("No recent data available for prediction")
 
-        # Load model
-        model, metadata = self.load_model()
-        if model is None:
-            raise ValueError("No trained model available")
+        predictions = self.forecast(model, latest_df, metadata)
+
+        # Logged once per target hour so live accuracy can be tracked (forecast_tracking.py)
+        try:
+            self.tracker.log(metadata.get('name'), metadata.get('version'), predictions)
+        except Exception as e:
+            print(f"Could not log forecast: {e}")
 
+        return predictions
+
+    def forecast(self, model, latest_df, metadata):
+        """Day-ahead predictions of one model from the latest observations"""
         predictions = []
         current_time = datetime.now()
 
@@ -44,15 +124,16 @@ class Predictor:
 
             # Use forecast data to create features
             # This is simplified; in practice, you'd need to properly integrate forecast
-            pred_features = self.create_prediction_features(latest_df, forecast_data, i)
+            pred_features = self.create_prediction_features(latest_df, forecast_data, i, metadata)
 
             # Make prediction
-            if hasattr(model, 'predict'):
-                pred = model.predict(pred_features.reshape(1, -1))[0]
-            else:
-                # For LSTM
-                pred_features_reshaped = pred_features.reshape((1, 24, pred_features.shape[0] // 24))
-                pred = model.predict(pred_features_reshaped).flatten()[0]
+            with timed('model_predict'):
+                if hasattr(model, 'predict'):
+                    pred = model.predict(pred_features.reshape(1, -1))[0]
+                else:
+                    # For LSTM
+                    pred_features_reshaped = pred_features.reshape((1, 24, pred_features.shape[0] // 24))
+                    pred = model.predict(pred_features_reshaped).flatten()[0]
 
             predictions.append({
                 'date': pred_time.date(),
@@ -62,28 +143,52 @@ class Predictor:
 
         return predictions
 
-    def create_prediction_features(self, latest_df, forecast_data, day_offset):
-        """Create features for prediction"""
-        # This is a simplified version
-        # In practice, you'd need to properly handle the feature engineering
+    def log_challenger_forecasts(self):
+        """Forecast with the latest version of every non-champion model, for live comparison only"""
+        latest_df = self.get_latest_features(hours=self.history_hours())
+        if latest_df.empty:
+            return 0
 
-        # Use the last available features as base
-        base_features = latest_df.iloc[-1:].copy()
+        champion = self.registry.resolve()
+        logged = 0
+
+        for name in self.db.models_collection.distinct('name'):
+            model, metadata = self.registry.load_latest(name)
+            if model is None or (name, metadata.get('version')) == champion:
+                continue
+
+            # Unfused: challengers are scored hourly, not worth compiling
+            if metadata.get('scaler'):
+                model = ScaledModel(model, metadata['scaler']['mean'], metadata['scaler']['scale'])
+
+            try:
+                predictions = self.forecast(model, latest_df, metadata)
+            except Exception as e:
+                print(f"Challenger {name} could not forecast: {e}")
+                continue
+
+            logged += self.tracker.log(name, metadata.get('version'), predictions, role='challenger')
+
+        return logged
+
+    def create_prediction_features(self, latest_df, forecast_data, day_offset, metadata):
+        """Create features for prediction"""
+        # This is a simplified version: the forecast weather replaces the latest observation
+        history = latest_df.copy()
+        last = history.index[-1]
 
         # Update with forecast data (simplified)
         if day_offset <= len(forecast_data):
             forecast = forecast_data[day_offset - 1]
-            base_features['temp'] = forecast.get('temp', base_features['temp'].iloc[0])
-            base_features['humidity'] = forecast.get('humidity', base_features['humidity'].iloc[0])
+            history.loc[last, 'temp'] = forecast.get('temp', history.loc[last, 'temp'])
+            history.loc[last, 'humidity'] = forecast.get('humidity', history.loc[last, 'humidity'])
 
         # Create features
-        features_df = self.fe.create_features(base_features)
-
-        # Prepare for model input
-        feature_cols = [col for col in features_df.columns if col not in ['timestamp', 'aqi_category', 'aqi']]
-        features = features_df[feature_cols].values.flatten()
+        features_df = self.fe.create_features(history)
 
-        return features
+        # Unscaled window in the column order and layout the model was trained on
+        return self.fe.inference_window(features_df, metadata.get('feature_columns'),
+                                        lookback=metadata.get('lookback', 24))
 
     def get_weather_forecast(self):
         """Get weather forecast from OpenWeatherMap"""
@@ -0,0 +1,187 @@
+import threading
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from metrics import REGISTRY, timed
+from config import RING_BUFFER_HOURS, RING_BUFFER_INGEST_LAG_SECONDS
+
+EPOCH = datetime(1970, 1, 1)
+
+BUFFER_ROWS = REGISTRY.gauge('aqi_ring_buffer_rows', 'Observations held in the serving ring buffer')
+
+
+class RingBuffer:
+    """Fixed-size, array-backed buffer of the most recent observations.
+
+    Each column lives in a preallocated NumPy array of `capacity` slots
+    (float64 for numeric columns, object for strings/flags) and new rows
+    overwrite the oldest ones. frame() materializes the rows in time order
+    once per change, so readers between updates get a cached DataFrame.
+
+    poll() follows the store by write time (ingested_at), not by timestamp,
+    so hours written behind the newest buffered one - backfill, catch-up,
+    rewritten rows - are noticed and the buffer is re-primed.
+    """
+
+    def __init__(self, capacity=RING_BUFFER_HOURS):
+        self.capacity = capacity
+        self.lock = threading.Lock()
+        self.timestamps = np.full(capacity, np.datetime64('NaT'), dtype='datetime64[ns]')
+        self.columns = {}
+        self.size = 0
+        self.head = 0
+        self.last_seen = None
+        self.ingested = None
+        self._applied = {}
+        self.sync_lock = threading.RLock()
+        self.version = 0
+        self._frame = None
+        self._frame_timestamps = None
+        self._frame_version = -1
+
+    def _column(self, name, values):
+        numeric = values.dtype.kind in 'iuf'
+        column = self.columns.get(name)
+
+        if column is None:
+            if numeric:
+                column = np.full(self.capacity, np.nan)
+            else:
+                column = np.full(self.capacity, None, dtype=object)
+            self.columns[name] = column
+        elif column.dtype != object and not numeric:
+            # A field changed type upstream; keep it as generic objects from now on
+            column = column.astype(object)
+            self.columns[name] = column
+
+        return column
+
+    def push(self, df, replace=False):
+        """Append rows newer than last_seen, overwriting the oldest slots.
+
+        With replace=True the buffer is emptied first, under the same lock,
+        so readers see either the old rows or the new ones.
+        """
+        timestamps = pd.to_datetime(df['timestamp']).to_numpy(dtype='datetime64[ns]') if len(df) else None
+
+        with self.lock:
+            if replace:
+                self.columns = {}
+                self.size = 0
+                self.head = 0
+                self.last_seen = None
+                self.version += 1
+
+            if timestamps is None:
+                return 0
+            order = np.argsort(timestamps, kind='stable')
+
+            # Filtered under the lock so concurrent polls never append the same rows twice
+            if self.last_seen is not None:
+                order = order[timestamps[order] > np.datetime64(self.last_seen)]
+            order = order[-self.capacity:]
+
+            if not len(order):
+                return 0
+
+            slots = (self.head + np.arange(len(order))) % self.capacity
+            self.timestamps[slots] = timestamps[order]
+
+            for name in df.columns:
+                if name in ('timestamp', '_id', 'meta'):
+                    continue
+                values = df[name].to_numpy()[order]
+                self._column(name, values)[slots] = values
+
+            # Fields missing from this batch must not keep the overwritten rows' values
+            for name, column in self.columns.items():
+                if name not in df.columns:
+                    column[slots] = np.nan if column.dtype != object else None
+
+            self.head = (self.head + len(order)) % self.capacity
+            self.size = min(self.size + len(order), self.capacity)
+            self.last_seen = pd.Timestamp(timestamps[order[-1]]).to_pydatetime()
+            self.version += 1
+
+        BUFFER_ROWS.set(self.size)
+        return len(order)
+
+    def frame(self, hours=None, now=None):
+        """Buffered rows in time order, optionally only those from the last `hours`"""
+        with self.lock:
+            if self._frame_version != self.version:
+                order = (self.head - self.size + np.arange(self.size)) % self.capacity
+                data = {'timestamp': self.timestamps[order]}
+                data.update({name: column[order] for name, column in self.columns.items()})
+                self._frame = pd.DataFrame(data)
+                self._frame_timestamps = data['timestamp']
+                self._frame_version = self.version
+            frame, timestamps = self._frame, self._frame_timestamps
+
+        if hours is None:
+            return frame
+
+        cutoff = pd.Timestamp((now or datetime.now()) - timedelta(hours=hours))
+        start = np.searchsorted(timestamps, cutoff.to_datetime64(), side='left')
+        return frame.iloc[start:]
+
+    # --------------------------------------------------
+    # SYNC WITH THE FEATURE STORE
+    # --------------------------------------------------
+    def _unseen(self, df):
+        """Drop rows this buffer already applied and advance the ingested_at watermark"""
+        keys = list(zip(df['timestamp'], df['ingested_at']))
+        df = df[[key not in self._applied for key in keys]]
+
+        for timestamp, ingested_at in keys:
+            if not pd.isna(ingested_at):
+                self._applied[(timestamp, ingested_at)] = ingested_at
+                if self.ingested is None or ingested_at > self.ingested:
+                    self.ingested = ingested_at
+
+        if self.ingested is not None:
+            cutoff = self.ingested - timedelta(seconds=2 * RING_BUFFER_INGEST_LAG_SECONDS)
+            self._applied = {key: value for key, value in self._applied.items() if value >= cutoff}
+
+        return df
+
+    @timed('ring_buffer_prime')
+    def prime(self, db):
+        """(Re)load the most recent `capacity` hours from the feature store"""
+        with self.sync_lock:
+            df = db.get_feature_changes(start_date=datetime.now() - timedelta(hours=self.capacity))
+            if not df.empty:
+                self._unseen(df)
+                df = df.drop(columns='ingested_at')
+            return self.push(df, replace=True)
+
+    @timed('ring_buffer_poll')
+    def poll(self, db):
+        """Pull rows written since the watermark (an index-only query when nothing changed)"""
+        with self.sync_lock:
+            if self.last_seen is None:
+                return self.prime(db)
+
+            # Re-read the lag window: a write stamped before the watermark may have committed after it
+            since = EPOCH
+            if self.ingested is not None:
+                since = self.ingested - timedelta(seconds=RING_BUFFER_INGEST_LAG_SECONDS)
+
+            df = db.get_feature_changes(ingested_after=since)
+            if df.empty:
+                return 0
+
+            df = self._unseen(df)
+            if df.empty:
+                return 0
+
+            # Hours at or behind the newest buffered one cannot be appended in order
+            window_start = pd.Timestamp(datetime.now() - timedelta(hours=self.capacity))
+            behind = df['timestamp'] <= pd.Timestamp(self.last_seen)
+            if (behind & (df['timestamp'] >= window_start)).any():
+                print(f"Re-priming ring buffer: {int(behind.sum())} rows written behind {self.last_seen}")
+                return self.prime(db)
+
+            return self.push(df[~behind].drop(columns='ingested_at'))
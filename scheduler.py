@@ -1,10 +1,65 @@
-import schedule
-import time
+import os
+import pandas as pd
+import requests
 from datetime import datetime, timedelta
+from apscheduler.schedulers.blocking import BlockingScheduler
+from apscheduler.executors.pool import ThreadPoolExecutor, ProcessPoolExecutor
+from apscheduler.jobstores.mongodb import MongoDBJobStore
+from apscheduler.triggers.cron import CronTrigger
+from apscheduler.events import EVENT_JOB_ERROR, EVENT_JOB_MISSED
 from data_fetcher import DataFetcher
 from feature_engineering import FeatureEngineer
 from database import DatabaseManager
 from model_training import ModelTrainer
+from config import (
+    DATABASE_NAME,
+    SCHEDULER_JOBS_COLLECTION,
+    SCHEDULER_INGEST_WORKERS,
+    SCHEDULER_TRAINING_WORKERS,
+    INGEST_MISFIRE_GRACE_SECONDS,
+    TRAINING_MISFIRE_GRACE_SECONDS,
+    CATCHUP_ENABLED,
+    CATCHUP_MAX_HOURS,
+    SERVING_NOTIFY_URL,
+    DRIFT_RETRAIN,
+    FORECAST_AUTO_PROMOTE,
+)
+
+_instance = None
+_instance_pid = None
+
+
+def get_scheduler():
+    """Return the Scheduler for the current process (one per worker process)"""
+    global _instance, _instance_pid
+
+    if _instance is None or _instance_pid != os.getpid():
+        _instance = Scheduler()
+        _instance_pid = os.getpid()
+
+    return _instance
+
+
+# --------------------------------------------------
+# JOB ENTRY POINTS
+# Module-level so the MongoDB job store can persist them
+# and the process pool can pickle them.
+# --------------------------------------------------
+def run_hourly_feature_pipeline():
+    get_scheduler().hourly_feature_pipeline()
+
+
+def run_daily_training_pipeline():
+    get_scheduler().daily_training_pipeline()
+
+
+def run_catch_up():
+    get_scheduler().catch_up_missed_hours()
+
+
+def run_drift_retrain():
+    get_scheduler().drift_retrain_pipeline()
+
 
 class Scheduler:
     def __init__(self):
@@ -12,6 +67,10 @@ class Scheduler:
         self.fe = FeatureEngineer()
         self.db = DatabaseManager()
         self.trainer = ModelTrainer()
+        self.alert_engine = None
+        self.predictor = None
+        self.drift_monitor = None
+        self.apscheduler = None
 
     def hourly_feature_pipeline(self):
         """Run feature pipeline every hour"""
@@ -28,18 +87,114 @@ class Scheduler:
             # Store in database
             self.db.store_features(features_df)
 
+            # Keep today's daily rollup current
+            self.db.refresh_daily_rollups(start_date=datetime.now() - timedelta(days=1))
+
+            self.notify_serving()
+
+            self.evaluate_alerts(current_data)
+
+            self.monitor_drift(current_data)
+
+            self.track_forecasts()
+
             print("Hourly feature pipeline completed")
 
         except Exception as e:
             print(f"Error in hourly pipeline: {e}")
 
+    def notify_serving(self):
+        """Tell the API to pull the new row into its ring buffer (it also polls on its own)"""
+        if not SERVING_NOTIFY_URL:
+            return
+
+        try:
+            requests.post(SERVING_NOTIFY_URL, timeout=2)
+        except requests.RequestException as e:
+            print(f"Could not notify serving API: {e}")
+
+    def evaluate_alerts(self, current_data):
+        """Run every subscriber rule against the new reading and a fresh forecast"""
+        from alerts import AlertEngine
+        from prediction import Predictor
+
+        if self.alert_engine is None:
+            self.alert_engine = AlertEngine(self.db)
+        if self.predictor is None:
+            self.predictor = Predictor()
+
+        try:
+            predictions = self.predictor.predict_next_3_days()
+        except Exception as e:
+            print(f"Evaluating alerts on the current reading only: {e}")
+            predictions = []
+
+        try:
+            self.alert_engine.evaluate(current_data['aqi'], predictions)
+        except Exception as e:
+            print(f"Alert evaluation failed: {e}")
+
+    def monitor_drift(self, current_data):
+        """Fold the new reading into the drift sketches and queue a retrain when they drifted"""
+        from drift import DriftMonitor
+
+        if self.drift_monitor is None:
+            self.drift_monitor = DriftMonitor(self.db)
+
+        try:
+            status = self.drift_monitor.update(current_data)
+        except Exception as e:
+            print(f"Drift monitoring failed: {e}")
+            return
+
+        if not status or not status['retrain'] or not DRIFT_RETRAIN or self.apscheduler is None:
+            return
+
+        print(f"Feature drift (PSI {status['max_psi']:.2f} in {', '.join(status['drifted_features'])}), queueing a full retrain")
+        self.apscheduler.add_job(
+            run_drift_retrain,
+            id='drift_retrain',
+            executor='training',
+            misfire_grace_time=None,
+            replace_existing=True
+        )
+
+    def drift_retrain_pipeline(self):
+        """Full retrain queued by the drift monitor"""
+        try:
+            print(f"Running drift-triggered retrain at {datetime.now()}")
+            self.trainer.train_all_models()
+            print("Drift-triggered retrain completed")
+        except Exception as e:
+            print(f"Error in drift-triggered retrain: {e}")
+
+    def track_forecasts(self):
+        """Score forecasts whose target hour arrived and log this hour's challenger forecasts"""
+        from prediction import Predictor
+
+        if self.predictor is None:
+            self.predictor = Predictor()
+
+        try:
+            tracker = self.predictor.tracker
+            outcome = tracker.resolve_pending()
+            logged = self.predictor.log_challenger_forecasts()
+            print(f"Forecast tracking: {outcome['resolved']} scored, {outcome['expired']} expired, "
+                  f"{logged} challenger forecasts logged")
+
+            if FORECAST_AUTO_PROMOTE:
+                result = tracker.promote_best(self.predictor.registry)
+                print(f"Live promotion: {result['reason']}")
+        except Exception as e:
+            print(f"Forecast tracking failed: {e}")
+
     def daily_training_pipeline(self):
         """Run training pipeline daily"""
         try:
             print(f"Running daily training pipeline at {datetime.now()}")
 
-            # Train models
-            self.trainer.train_all_models()
+            # Continue the stored models, or retrain when they drifted
+            self.trainer.run_training_cycle()
 
             print("Daily training pipeline completed")
 
@@ -62,27 +217,137 @@ class Scheduler:
         except Exception as e:
             print(f"Error in backfill pipeline: {e}")
 
+    def catch_up_missed_hours(self):
+        """Backfill the hours missed while the scheduler was down.
+
+        Starts from the oldest backfill chunk in the lookback that failed or
+        is still open, or from the newest stored hour if that is older, so a
+        failed chunk behind later successes is retried rather than skipped.
+        """
+        try:
+            # Real provider rows only, never the synthetic generators
+            from backfill import BackfillEngine
+            engine = BackfillEngine(db=self.db)
+
+            now = datetime.now()
+            horizon = now - timedelta(hours=CATCHUP_MAX_HOURS)
+            starts = engine.incomplete(horizon)
+
+            latest = self.db.get_latest_timestamp()
+            if latest is not None and now - latest >= timedelta(hours=2):
+                starts.append(latest + timedelta(hours=1))
+
+            if not starts:
+                print("No missed hours to catch up")
+                return
+
+            start_date = max(min(starts), horizon)
+
+            print(f"Catching up from {start_date}")
+            engine.run(start_date, now)
+
+            print("Catch-up completed")
+
+        except Exception as e:
+            print(f"Error in catch-up: {e}")
+
+    # --------------------------------------------------
+    # APSCHEDULER SETUP
+    # --------------------------------------------------
+    def build_scheduler(self, scheduler_class=BlockingScheduler):
+        """Create an APScheduler instance with persistent jobs and executor pools"""
+        jobstores = {
+            'default': MongoDBJobStore(
+                database=DATABASE_NAME,
+                collection=SCHEDULER_JOBS_COLLECTION,
+                client=self.db.client
+            )
+        }
+
+        # Ingest runs on its own threads so a long training run in the
+        # process pool never delays the hourly fetch.
+        executors = {
+            'default': ThreadPoolExecutor(1),
+            'ingest': ThreadPoolExecutor(SCHEDULER_INGEST_WORKERS),
+            'training': ProcessPoolExecutor(SCHEDULER_TRAINING_WORKERS)
+        }
+
+        job_defaults = {
+            'coalesce': True,
+            'max_instances': 1
+        }
+
+        scheduler = scheduler_class(
+            jobstores=jobstores,
+            executors=executors,
+            job_defaults=job_defaults
+        )
+
+        # Run feature pipeline at the top of every hour
+        scheduler.add_job(
+            run_hourly_feature_pipeline,
+            CronTrigger(minute=0),
+            id='hourly_feature_pipeline',
+            executor='ingest',
+            max_instances=1,
+            misfire_grace_time=INGEST_MISFIRE_GRACE_SECONDS,
+            replace_existing=True
+        )
+
+        # Run training pipeline daily at 2 AM
+        scheduler.add_job(
+            run_daily_training_pipeline,
+            CronTrigger(hour=2, minute=0),
+            id='daily_training_pipeline',
+            executor='training',
+            max_instances=1,
+            misfire_grace_time=TRAINING_MISFIRE_GRACE_SECONDS,
+            replace_existing=True
+        )
+
+        # One-off catch-up for hours missed during downtime
+        if CATCHUP_ENABLED:
+            scheduler.add_job(
+                run_catch_up,
+                id='catch_up',
+                executor='ingest',
+                misfire_grace_time=None,
+                replace_existing=True
+            )
+
+        scheduler.add_listener(self._on_job_event, EVENT_JOB_ERROR | EVENT_JOB_MISSED)
+
+        # Lets the hourly job queue drift-triggered retrains
+        self.apscheduler = scheduler
+
+        return scheduler
+
+    def _on_job_event(self, event):
+        if event.code == EVENT_JOB_MISSED:
+            print(f"Job {event.job_id} missed its run at {event.scheduled_run_time}")
+        elif event.exception:
+            print(f"Job {event.job_id} failed: {event.exception}")
+
     def start_scheduler(self):
         """Start the automated scheduler"""
-        # Run feature pipeline every hour
-        schedule.every().hour.do(self.hourly_feature_pipeline)
+        global _instance, _instance_pid
+        _instance, _instance_pid = self, os.getpid()
 
-        # Run training pipeline daily at 2 AM
-        schedule.every().day.at("02:00").do(self.daily_training_pipeline)
+        scheduler = self.build_scheduler()
 
         print("Scheduler started. Press Ctrl+C to stop.")
 
-        while True:
-            schedule.run_pending()
-            time.sleep(60)  # Check every minute
+        try:
+            scheduler.start()
+        except (KeyboardInterrupt, SystemExit):
+            scheduler.shutdown()
+            print("Scheduler stopped.")
 
 if __name__ == "__main__":
-    import pandas as pd  # Import here to avoid circular imports
-
     scheduler = Scheduler()
 
     # Run initial backfill
     scheduler.backfill_pipeline()
 
     # Start scheduler
-    scheduler.start_scheduler()
\ No newline at end of file
+    scheduler.start_scheduler()
@@ -0,0 +1,300 @@
+import json
+import os
+import pickle
+import shutil
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from database import DatabaseManager
+from feature_engineering import FeatureEngineer
+from metrics import timed
+from config import TRAINING_CACHE_DIR, TRAINING_CACHE_CHUNK_DAYS, TRAINING_DAYS
+
+COPY_CHUNK_ROWS = 4096
+
+
+class TrainingMatrixCache:
+    """Append-only X/y/timestamp memmaps for one feature configuration.
+
+    Windows are materialized once and only the windows whose target is newer
+    than the cached watermark are appended on later runs. A training range is
+    then a contiguous slice of the memmaps, scaled into a second memmap so the
+    full history never has to be held in RAM.
+
+    Layout of <cache_dir>/<config hash>/:
+        manifest.json   watermark, row count, capacity, feature columns
+        X.npy, y.npy    window matrix and targets (rows beyond `rows` are unused)
+        t.npy           target timestamps (datetime64[ns]) used to slice ranges
+        X_scaled.npy    scaled copy of the last requested range
+        scaler.pkl      StandardScaler fitted on that range's training split
+
+    Refreshing and scaling hold an exclusive lock on <config hash>.lock, so
+    training in the API process and in the scheduler never write the same
+    files at once. Files are replaced rather than rewritten, so a run still
+    reading memmaps from before keeps a consistent snapshot.
+    """
+
+    def __init__(self, db=None, fe=None, cache_dir=TRAINING_CACHE_DIR,
+                 target_col='aqi', lookback=24, chunk_days=TRAINING_CACHE_CHUNK_DAYS):
+        self.db = db or DatabaseManager()
+        self.fe = fe or FeatureEngineer()
+        self.target_col = target_col
+        self.lookback = lookback
+        self.chunk = timedelta(days=chunk_days)
+        self.config_hash = self.fe.config_fingerprint(target_col, lookback)
+        self.path = os.path.join(cache_dir, self.config_hash)
+
+    # --------------------------------------------------
+    # FILES
+    # --------------------------------------------------
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    @contextmanager
+    def _lock(self):
+        # Beside the cache directory, which clear() removes
+        import fcntl
+
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        with open(self.path + '.lock', 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _replace(self, name, write):
+        """Write a file through a temporary one and swap it in"""
+        tmp = self._file(name + '.tmp')
+        write(tmp)
+        os.replace(tmp, self._file(name))
+
+    def _load_manifest(self):
+        try:
+            with open(self._file('manifest.json')) as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        for key in ('start', 'watermark'):
+            if manifest.get(key):
+                manifest[key] = datetime.fromisoformat(manifest[key])
+
+        return manifest
+
+    def _save_manifest(self, manifest):
+        # Written last and atomically: a crash mid-append leaves the old row count valid
+        data = dict(manifest)
+        for key in ('start', 'watermark'):
+            if data.get(key):
+                data[key] = data[key].isoformat()
+
+        tmp = self._file('manifest.json.tmp')
+        with open(tmp, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp, self._file('manifest.json'))
+
+    def _memmap(self, name, mode='r'):
+        return np.load(self._file(name), mmap_mode=mode)
+
+    def _allocate(self, manifest, capacity):
+        """Create or grow the X/y/t memmaps, copying the filled rows in chunks"""
+        shapes = {
+            'X.npy': ((capacity, manifest['width']), np.float32),
+            'y.npy': ((capacity,), np.float32),
+            't.npy': ((capacity,), 'datetime64[ns]'),
+        }
+
+        for name, (shape, dtype) in shapes.items():
+            tmp = self._file(name + '.tmp')
+            grown = np.lib.format.open_memmap(tmp, mode='w+', dtype=dtype, shape=shape)
+
+            if manifest['rows']:
+                old = self._memmap(name)
+                for i in range(0, manifest['rows'], COPY_CHUNK_ROWS):
+                    end = min(i + COPY_CHUNK_ROWS, manifest['rows'])
+                    grown[i:end] = old[i:end]
+                del old
+
+            grown.flush()
+            del grown
+            os.replace(tmp, self._file(name))
+
+        manifest['capacity'] = capacity
+
+    def _append(self, manifest, X, y, t):
+        rows = manifest['rows']
+        needed = rows + len(X)
+
+        if needed > manifest['capacity']:
+            self._allocate(manifest, max(needed, 2 * manifest['capacity']))
+
+        for name, values in (('X.npy', X), ('y.npy', y), ('t.npy', t)):
+            array = self._memmap(name, 'r+')
+            array[rows:needed] = values
+            array.flush()
+            del array
+
+        manifest['rows'] = needed
+
+    def clear(self):
+        shutil.rmtree(self.path, ignore_errors=True)
+
+    # --------------------------------------------------
+    # MATERIALIZE
+    # --------------------------------------------------
+    def _is_valid(self, manifest, start_date):
+        if manifest is None or manifest['config_hash'] != self.config_hash:
+            return False
+
+        if manifest['start'] > start_date:
+            return False
+
+        # Rows backfilled behind the watermark change windows already on disk
+        if manifest['watermark'] is not None:
+            stored = self.db.count_features(manifest['start'], manifest['watermark'])
+            if stored != manifest['source_rows']:
+                return False
+
+        return True
+
+    def refresh(self, start_date, end_date=None):
+        """Bring the cache up to end_date, appending only windows newer than the watermark"""
+        with self._lock():
+            return self._refresh(start_date, end_date)
+
+    @timed('training_cache_refresh')
+    def _refresh(self, start_date, end_date=None):
+        end_date = end_date or datetime.now()
+        manifest = self._load_manifest()
+
+        if not self._is_valid(manifest, start_date):
+            if manifest is not None:
+                print("Training cache is stale, rebuilding")
+            self.clear()
+            os.makedirs(self.path, exist_ok=True)
+            manifest = {
+                'config_hash': self.config_hash,
+                'lookback': self.lookback,
+                'target_col': self.target_col,
+                'start': start_date,
+                'watermark': None,
+                'feature_columns': None,
+                'width': None,
+                'rows': 0,
+                'capacity': 0,
+                'source_rows': 0,
+                'scaled': None,
+            }
+
+        halo = timedelta(hours=2 * self.lookback)
+        appended = 0
+        cursor = manifest['watermark'] or manifest['start']
+
+        # Chunked so the first build never materializes the whole history at once
+        while cursor < end_date:
+            chunk_end = min(cursor + self.chunk, end_date)
+            watermark = manifest['watermark']
+
+            df = self.db.get_features(watermark - halo if watermark else manifest['start'], chunk_end)
+            cursor = chunk_end
+
+            if len(df) <= self.lookback:
+                continue
+
+            df = self.fe.create_features(df)
+            X, y, feature_cols, t = self.fe.build_windows(
+                df, manifest['feature_columns'], self.target_col, self.lookback, after=watermark)
+
+            if manifest['feature_columns'] is None:
+                manifest['feature_columns'] = feature_cols
+                manifest['width'] = X.shape[1]
+
+            if len(X):
+                self._append(manifest, X, y, t)
+                appended += len(X)
+
+            manifest['watermark'] = df['timestamp'].max().to_pydatetime()
+
+        if manifest['watermark'] is not None:
+            manifest['source_rows'] = self.db.count_features(manifest['start'], manifest['watermark'])
+
+        self._save_manifest(manifest)
+
+        print(f"Training cache: {manifest['rows']} windows ({appended} new), "
+              f"data up to {manifest['watermark']}")
+        return manifest
+
+    # --------------------------------------------------
+    # TRAINING MATRICES
+    # --------------------------------------------------
+    def _fit_scaled(self, manifest, lo, split, hi):
+        """Fit the scaler on rows lo:split and write rows lo:hi scaled to X_scaled.npy"""
+        from sklearn.preprocessing import StandardScaler
+
+        X = self._memmap('X.npy')
+        scaler = StandardScaler()
+
+        for i in range(lo, split, COPY_CHUNK_ROWS):
+            scaler.partial_fit(X[i:min(i + COPY_CHUNK_ROWS, split)])
+
+        def write_scaled(tmp):
+            scaled = np.lib.format.open_memmap(tmp, mode='w+', dtype=np.float32, shape=(hi - lo, X.shape[1]))
+            for i in range(lo, hi, COPY_CHUNK_ROWS):
+                end = min(i + COPY_CHUNK_ROWS, hi)
+                scaled[i - lo:end - lo] = scaler.transform(X[i:end])
+            scaled.flush()
+
+        def write_scaler(tmp):
+            with open(tmp, 'wb') as f:
+                pickle.dump(scaler, f)
+
+        self._replace('X_scaled.npy', write_scaled)
+        self._replace('scaler.pkl', write_scaler)
+
+        manifest['scaled'] = {'lo': lo, 'split': split, 'hi': hi}
+        self._save_manifest(manifest)
+
+        return scaler
+
+    def training_matrices(self, days=TRAINING_DAYS, test_fraction=0.2):
+        """Scaled train/test split for the last `days`, as read-only memmap slices.
+
+        Returns X_train, X_test, y_train, y_test, feature_cols, scaler, watermark.
+        """
+        end_date = datetime.now()
+        start_date = end_date - timedelta(days=days)
+
+        with self._lock():
+            manifest = self._refresh(start_date, end_date)
+
+            if manifest['rows'] == 0:
+                raise ValueError("No training data available. Run backfill first.")
+
+            t = self._memmap('t.npy')[:manifest['rows']]
+            lo = int(np.searchsorted(t, np.datetime64(pd.Timestamp(start_date)), side='left'))
+            hi = manifest['rows']
+            split = lo + int((hi - lo) * (1 - test_fraction))
+
+            if manifest['scaled'] == {'lo': lo, 'split': split, 'hi': hi}:
+                with open(self._file('scaler.pkl'), 'rb') as f:
+                    scaler = pickle.load(f)
+            else:
+                with timed('training_cache_scale'):
+                    scaler = self._fit_scaled(manifest, lo, split, hi)
+
+            X_scaled = self._memmap('X_scaled.npy')
+            y = self._memmap('y.npy')
+
+        return (
+            X_scaled[:split - lo],
+            X_scaled[split - lo:],
+            y[lo:split],
+            y[split:hi],
+            manifest['feature_columns'],
+            scaler,
+            manifest['watermark'],
+        )
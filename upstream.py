@@ -0,0 +1,379 @@
+import json
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from urllib.parse import urlparse
+
+import numpy as np
+import requests
+import urllib3
+from requests.adapters import HTTPAdapter
+
+from metrics import REGISTRY
+from config import (
+    UPSTREAM_CONNECT_TIMEOUT,
+    UPSTREAM_READ_TIMEOUT,
+    UPSTREAM_MAX_RETRIES,
+    UPSTREAM_BACKOFF_BASE,
+    UPSTREAM_BACKOFF_MAX,
+    UPSTREAM_DEADLINE_SECONDS,
+    CIRCUIT_FAILURE_THRESHOLD,
+    CIRCUIT_RESET_SECONDS,
+    UPSTREAM_HEDGE_PERCENTILE,
+)
+
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+UPSTREAM_DURATION = REGISTRY.histogram(
+    'aqi_upstream_request_duration_seconds', 'Upstream API request latency', ['host', 'outcome'])
+UPSTREAM_EVENTS = REGISTRY.counter(
+    'aqi_upstream_events_total', 'Upstream retries, hedges and short-circuits', ['host', 'event'])
+UPSTREAM_CIRCUIT_OPEN = REGISTRY.gauge(
+    'aqi_upstream_circuit_open', '1 while the host circuit breaker is not closed', ['host'])
+
+
+class UpstreamUnavailable(Exception):
+    """Upstream host could not answer within the retry budget"""
+
+
+class CircuitOpenError(UpstreamUnavailable):
+    """Request rejected without a network call because the host circuit is open"""
+
+
+class _RetryableStatus(Exception):
+    def __init__(self, response):
+        super().__init__(f"HTTP {response.status_code} from {response.url}")
+        self.response = response
+
+
+# --------------------------------------------------
+# PER-HOST STATE
+# --------------------------------------------------
+class HostStats:
+    def __init__(self, host, window=500):
+        self.host = host
+        self.lock = threading.Lock()
+        self.latencies = deque(maxlen=window)
+        self.requests = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.retries = 0
+        self.hedged = 0
+        self.short_circuited = 0
+
+    def record(self, latency, ok, timeout=False):
+        outcome = 'ok' if ok else ('timeout' if timeout else 'error')
+        UPSTREAM_DURATION.observe(latency, host=self.host, outcome=outcome)
+        with self.lock:
+            self.requests += 1
+            if ok:
+                self.latencies.append(latency)
+            else:
+                self.errors += 1
+                if timeout:
+                    self.timeouts += 1
+
+    def increment(self, field):
+        UPSTREAM_EVENTS.inc(host=self.host, event=field)
+        with self.lock:
+            setattr(self, field, getattr(self, field) + 1)
+
+    def percentile(self, q, min_samples=1):
+        with self.lock:
+            if len(self.latencies) < min_samples:
+                return None
+            return float(np.percentile(self.latencies, q))
+
+    def snapshot(self):
+        with self.lock:
+            latencies = np.array(self.latencies)
+            snapshot = {
+                'requests': self.requests,
+                'errors': self.errors,
+                'timeouts': self.timeouts,
+                'retries': self.retries,
+                'hedged': self.hedged,
+                'short_circuited': self.short_circuited,
+            }
+
+        for q in (50, 95, 99):
+            snapshot[f'latency_p{q}'] = float(np.percentile(latencies, q)) if len(latencies) else None
+
+        return snapshot
+
+
+class CircuitBreaker:
+    """Closed → open after consecutive failures, half-open probe after a cooldown"""
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold, reset_timeout):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.lock = threading.Lock()
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+
+    def allow_request(self):
+        with self.lock:
+            if self.state == self.CLOSED:
+                return True
+
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                # Let a single probe through
+                self.state = self.HALF_OPEN
+                return True
+
+            return False
+
+    def record_success(self):
+        with self.lock:
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+
+class TokenBucket:
+    """Thread-safe rate limiter: `rate` tokens per second, bursts up to `capacity`"""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, tokens=1):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+
+                wait_for = (tokens - self.tokens) / self.rate
+
+            time.sleep(wait_for)
+
+
+# --------------------------------------------------
+# CLIENT
+# --------------------------------------------------
+class ResilientClient:
+    def __init__(self,
+                 connect_timeout=UPSTREAM_CONNECT_TIMEOUT,
+                 read_timeout=UPSTREAM_READ_TIMEOUT,
+                 max_retries=UPSTREAM_MAX_RETRIES,
+                 backoff_base=UPSTREAM_BACKOFF_BASE,
+                 backoff_max=UPSTREAM_BACKOFF_MAX,
+                 deadline=UPSTREAM_DEADLINE_SECONDS,
+                 failure_threshold=CIRCUIT_FAILURE_THRESHOLD,
+                 reset_timeout=CIRCUIT_RESET_SECONDS,
+                 hedge_percentile=UPSTREAM_HEDGE_PERCENTILE,
+                 hedge_min_samples=20):
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.deadline = deadline
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.hedge_percentile = hedge_percentile or None
+        self.hedge_min_samples = hedge_min_samples
+
+        self.session = requests.Session()
+        self.session.mount('https://', HTTPAdapter(pool_maxsize=20))
+        self.session.mount('http://', HTTPAdapter(pool_maxsize=20))
+
+        self._hedge_pool = ThreadPoolExecutor(max_workers=8) if self.hedge_percentile else None
+        self._lock = threading.Lock()
+        self._breakers = {}
+        self._stats = {}
+
+    def _host_state(self, host):
+        with self._lock:
+            if host not in self._breakers:
+                self._breakers[host] = CircuitBreaker(self.failure_threshold, self.reset_timeout)
+                self._stats[host] = HostStats(host)
+            return self._breakers[host], self._stats[host]
+
+    def _backoff(self, attempt):
+        """Full-jitter exponential backoff"""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    @staticmethod
+    def _body_chunks(response):
+        """Yield the body as it arrives (urllib3 2 read1), else in fixed-size chunks"""
+        read1 = getattr(response.raw, 'read1', None)
+        if read1 is None:
+            yield from response.iter_content(64 * 1024)
+            return
+
+        while True:
+            try:
+                chunk = read1(64 * 1024, decode_content=True)
+            except urllib3.exceptions.ReadTimeoutError as e:
+                raise requests.ReadTimeout(e)
+            except urllib3.exceptions.ProtocolError as e:
+                raise requests.ConnectionError(e)
+            if not chunk:
+                return
+            yield chunk
+
+    def _send(self, url, params, stats, deadline_at):
+        """One attempt, bounded by the call's deadline; returns (response, body)"""
+        start = time.perf_counter()
+        remaining = deadline_at - time.monotonic()
+        connect_timeout, read_timeout = self.timeout
+        try:
+            if remaining <= 0:
+                raise requests.Timeout(f"Deadline exceeded before requesting {url}")
+
+            response = self.session.get(
+                url, params=params, stream=True,
+                timeout=(min(connect_timeout, remaining), min(read_timeout, remaining))
+            )
+
+            # The read timeout only bounds the gap between bytes, so a slow-drip
+            # body is read in whatever pieces arrive and checked against the deadline
+            chunks = []
+            with response:
+                for chunk in self._body_chunks(response):
+                    chunks.append(chunk)
+                    if time.monotonic() > deadline_at:
+                        raise requests.Timeout(f"Deadline exceeded reading {url}")
+            body = b''.join(chunks)
+        except requests.Timeout:
+            stats.record(time.perf_counter() - start, ok=False, timeout=True)
+            raise
+        except requests.RequestException:
+            stats.record(time.perf_counter() - start, ok=False)
+            raise
+
+        ok = response.status_code not in RETRYABLE_STATUS
+        stats.record(time.perf_counter() - start, ok=ok)
+
+        if not ok:
+            raise _RetryableStatus(response)
+
+        return response, body
+
+    def _send_hedged(self, url, params, stats, deadline_at):
+        """Fire a second request if the first is slower than the host's latency percentile"""
+        hedge_delay = stats.percentile(self.hedge_percentile, self.hedge_min_samples)
+        if hedge_delay is None:
+            return self._send(url, params, stats, deadline_at)
+
+        pending = {self._hedge_pool.submit(self._send, url, params, stats, deadline_at)}
+        done, pending = wait(pending, timeout=min(hedge_delay, max(0.0, deadline_at - time.monotonic())))
+
+        if not done and time.monotonic() < deadline_at:
+            stats.increment('hedged')
+            pending.add(self._hedge_pool.submit(self._send, url, params, stats, deadline_at))
+
+        error = requests.Timeout(f"Deadline exceeded waiting for {url}")
+        while pending or done:
+            for future in done:
+                try:
+                    return future.result()
+                except Exception as e:
+                    error = e
+            remaining = deadline_at - time.monotonic()
+            if not pending or remaining <= 0:
+                break
+            done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+
+        raise error
+
+    def get_json(self, url, params=None):
+        """GET a JSON document with timeouts, retries, circuit breaking and optional hedging.
+
+        Every attempt, backoff and hedge shares one deadline, so a call never
+        takes much longer than `deadline` seconds however the host misbehaves.
+        """
+        host = urlparse(url).netloc
+        breaker, stats = self._host_state(host)
+        deadline_at = time.monotonic() + self.deadline
+        last_error = None
+
+        for attempt in range(self.max_retries + 1):
+            if deadline_at - time.monotonic() <= 0:
+                break
+
+            if not breaker.allow_request():
+                stats.increment('short_circuited')
+                raise CircuitOpenError(f"Circuit open for {host}")
+
+            try:
+                if self._hedge_pool is not None:
+                    response, body = self._send_hedged(url, params, stats, deadline_at)
+                else:
+                    response, body = self._send(url, params, stats, deadline_at)
+            except (requests.ConnectionError, requests.Timeout, _RetryableStatus) as e:
+                breaker.record_failure()
+                UPSTREAM_CIRCUIT_OPEN.set(int(breaker.state != CircuitBreaker.CLOSED), host=host)
+                last_error = e
+            except Exception:
+                # Not worth a retry, but it must settle a half-open probe or the breaker never closes
+                breaker.record_failure()
+                UPSTREAM_CIRCUIT_OPEN.set(int(breaker.state != CircuitBreaker.CLOSED), host=host)
+                raise
+            else:
+                # Non-retryable 4xx still means the host is up
+                breaker.record_success()
+                UPSTREAM_CIRCUIT_OPEN.set(0, host=host)
+                response.raise_for_status()
+                return json.loads(body)
+
+            if attempt == self.max_retries:
+                break
+
+            delay = self._backoff(attempt)
+            if time.monotonic() + delay >= deadline_at:
+                break
+
+            stats.increment('retries')
+            time.sleep(delay)
+
+        raise UpstreamUnavailable(f"{host} unavailable: {last_error or 'deadline exceeded'}")
+
+    def stats(self):
+        """Per-host latency and error metrics"""
+        with self._lock:
+            hosts = list(self._stats.items())
+            breakers = dict(self._breakers)
+
+        result = {}
+        for host, stats in hosts:
+            result[host] = stats.snapshot()
+            result[host]['circuit'] = breakers[host].state
+
+        return result
+
+
+_default_client = None
+_default_client_lock = threading.Lock()
+
+
+def get_default_client():
+    """Process-wide client so breakers and metrics are shared by all fetchers"""
+    global _default_client
+
+    with _default_client_lock:
+        if _default_client is None:
+            _default_client = ResilientClient()
+        return _default_client